@@ -18,7 +18,9 @@
         'security/ir.model.access.csv',
         'security/contact_security.xml',
         'data/whatsapp_contact_config_data.xml',
+        'data/ir_cron_data.xml',
         'views/whatsapp_contact_config_views.xml',
+        'views/whatsapp_verification_job_views.xml',
         'views/res_partner_views_muk_inspired.xml', # <-- NOVO ARQUIVO DE VIEW
         'views/contact_views.xml',
         'views/res_partner_views_inherit.xml',
@@ -1,3 +1,7 @@
 # -*- coding: utf-8 -*-
 from . import res_partner
-from . import whatsapp_contact_config
\ No newline at end of file
+from . import whatsapp_contact_config
+from . import whatsapp_webhook_processor
+from . import whatsapp_number_check
+from . import whatsapp_verification_job
+from . import whatsapp_avatar_sync
\ No newline at end of file
@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 
 from odoo import models, fields, api, _
-from odoo.exceptions import UserError, ValidationError
-from odoo.tools import SQL
+from odoo.exceptions import MissingError, UserError, ValidationError
+from odoo.tools import SQL, sql
+from odoo.tools.lru import LRU
 from datetime import datetime, timedelta
 import logging
 import re
 
 _logger = logging.getLogger(__name__)
 
+# Cache do processo: (banco, número) -> id do parceiro. Limitado para não crescer sem controle.
+# As entradas são sempre revalidadas contra o registro, então não há invalidação entre workers.
+_WHATSAPP_JID_CACHE = LRU(8192)
+# Dígitos finais usados para encontrar números gravados sem o código do país.
+_WHATSAPP_JID_SUFFIX_LENGTH = 8
+
 class ResPartner(models.Model):
     _inherit = 'res.partner'
 
@@ -35,6 +42,120 @@ class ResPartner(models.Model):
                 partner.mobile_sanitized = False
     # ============================ FIM DA NOVA ADIÇÃO ============================
 
+    # --- Chaves de identificação do WhatsApp ---
+    whatsapp_jid = fields.Char(
+        string="WhatsApp JID",
+        compute='_compute_whatsapp_jid',
+        store=True,
+        index='btree_not_null',
+        copy=False,
+        help="Celular normalizado (somente dígitos, E.164), igual à parte numérica do JID do WhatsApp."
+    )
+    whatsapp_phone_jid = fields.Char(
+        string="WhatsApp JID (Telefone)",
+        compute='_compute_whatsapp_jid',
+        store=True,
+        index='btree_not_null',
+        copy=False,
+        help="Telefone normalizado (somente dígitos, E.164), usado como alternativa ao celular."
+    )
+
+    def _auto_init(self):
+        # Cria e preenche as colunas dos JIDs em SQL, só com os dígitos do número:
+        # evita o recompute em Python de toda a res.partner na atualização do módulo.
+        # Os números sem código do país são encontrados pelo sufixo em `_find_by_whatsapp_jid`
+        # e normalizados no próximo `write` do contato.
+        for column, source in (('whatsapp_jid', 'mobile'), ('whatsapp_phone_jid', 'phone')):
+            if sql.column_exists(self.env.cr, self._table, column):
+                continue
+            sql.create_column(self.env.cr, self._table, column, 'varchar')
+            self._whatsapp_backfill_jid_column(column, source)
+        return super()._auto_init()
+
+    def _whatsapp_backfill_jid_column(self, column, source):
+        """Preenche a coluna do JID com os dígitos do campo de origem, direto em SQL."""
+        self.env.cr.execute(SQL(
+            "UPDATE %s SET %s = NULLIF(regexp_replace(%s, '\\D', '', 'g'), '') WHERE %s IS NOT NULL",
+            SQL.identifier(self._table), SQL.identifier(column), SQL.identifier(source), SQL.identifier(source),
+        ))
+
+    @api.depends('mobile', 'phone', 'country_id')
+    def _compute_whatsapp_jid(self):
+        for partner in self:
+            partner.whatsapp_jid = partner._whatsapp_normalize_number('mobile')
+            partner.whatsapp_phone_jid = partner._whatsapp_normalize_number('phone')
+
+    def _whatsapp_normalize_number(self, fname):
+        """
+        Retorna o número do campo em E.164 apenas com dígitos (ex: '5511987654321').
+        Se não for possível formatar, usa os dígitos do valor original.
+        """
+        self.ensure_one()
+        if not self[fname]:
+            return False
+        number = self._phone_format(fname=fname) or self[fname]
+        return ''.join(filter(str.isdigit, number)) or False
+
+    def _whatsapp_matches_number(self, number):
+        """Indica se o JID completo termina com o número do contato (igual ou sem o código do país)."""
+        self.ensure_one()
+        return any(
+            jid and (jid == number or (len(jid) >= _WHATSAPP_JID_SUFFIX_LENGTH and number.endswith(jid)))
+            for jid in (self.whatsapp_jid, self.whatsapp_phone_jid)
+        )
+
+    @api.model
+    def _find_by_whatsapp_jid(self, number):
+        """
+        Encontra o parceiro pela parte numérica do JID usando uma busca exata e
+        indexada, com um LRU do processo na frente. Se não houver correspondência
+        exata, procura números gravados sem o código do país (o JID termina com
+        o número do contato), pelo índice dos dígitos finais. Retorna um
+        recordset vazio se nenhum parceiro corresponder.
+        """
+        if not number:
+            return self.browse()
+
+        cache_key = (self.env.cr.dbname, number)
+        partner_id = _WHATSAPP_JID_CACHE.get(cache_key)
+        if partner_id:
+            partner = self.browse(partner_id)
+            try:
+                if partner._whatsapp_matches_number(number):
+                    return partner
+            except MissingError:
+                pass
+            try:
+                del _WHATSAPP_JID_CACHE[cache_key]
+            except KeyError:
+                pass
+
+        partner = self.search(['|', ('whatsapp_jid', '=', number), ('whatsapp_phone_jid', '=', number)], limit=1)
+        if not partner and len(number) > _WHATSAPP_JID_SUFFIX_LENGTH:
+            partner = self._find_by_whatsapp_jid_suffix(number)
+        if partner:
+            _WHATSAPP_JID_CACHE[cache_key] = partner.id
+        return partner
+
+    @api.model
+    def _find_by_whatsapp_jid_suffix(self, number):
+        suffix = number[-_WHATSAPP_JID_SUFFIX_LENGTH:]
+        self.env.cr.execute(SQL(
+            """
+                SELECT id
+                  FROM %(table)s
+                 WHERE (right(whatsapp_jid, %(length)s) = %(suffix)s AND %(number)s LIKE '%%' || whatsapp_jid)
+                    OR (right(whatsapp_phone_jid, %(length)s) = %(suffix)s AND %(number)s LIKE '%%' || whatsapp_phone_jid)
+              ORDER BY id
+            """,
+            table=SQL.identifier(self._table),
+            length=_WHATSAPP_JID_SUFFIX_LENGTH,
+            suffix=suffix,
+            number=number,
+        ))
+        # Aplica as regras de acesso, como a busca exata.
+        return self.search([('id', 'in', [row[0] for row in self.env.cr.fetchall()])], limit=1, order='id')
+
     # --- Campo movido do whatsapp_evolution_base ---
     whatsapp_instance_id = fields.Many2one(
         'whatsapp.instance', string='WhatsApp Instance Origin',
@@ -112,6 +233,16 @@ class ResPartner(models.Model):
                 SQL.identifier(self._table)
             )
         )
+        # Busca pelos dígitos finais (números gravados sem o código do país).
+        for column in ('whatsapp_jid', 'whatsapp_phone_jid'):
+            self.env.cr.execute(SQL(
+                "CREATE INDEX IF NOT EXISTS %s ON %s (right(%s, %s)) WHERE %s IS NOT NULL",
+                SQL.identifier(f'{self._table}_{column}_suffix_idx'),
+                SQL.identifier(self._table),
+                SQL.identifier(column),
+                SQL(str(_WHATSAPP_JID_SUFFIX_LENGTH)),
+                SQL.identifier(column),
+            ))
 
     # --- Métodos Computados ---
     @api.depends('is_private')
@@ -192,52 +323,100 @@ class ResPartner(models.Model):
         instance = self.env['whatsapp.instance']._get_verifying_instance()
         if not instance:
             raise UserError(_("Nenhuma instância conectada do WhatsApp foi encontrada para realizar a verificação. Por favor, contate um administrador."))
-        verified_count = 0
-        failed_count = 0
-        for partner in self:
-            if not partner.mobile:
-                partner.message_post(body=_("Falha na verificação do WhatsApp: O campo 'Celular' está vazio."))
-                failed_count += 1
-                continue
-            clean_number = re.sub(r'\D', '', partner.mobile)
-            if not clean_number:
-                partner.message_post(body=_("Falha na verificação do WhatsApp: O número de celular '%s' é inválido.") % partner.mobile)
-                failed_count += 1
-                continue
-            try:
-                response = self.env['whatsapp.evolution.api']._api_check_whatsapp_numbers(instance, [clean_number])
-                if response and isinstance(response, list) and response[0]:
-                    result = response[0]
-                    if result.get('exists'):
-                        partner.write({
-                            'whatsapp_verified': True,
-                            'whatsapp_verified_date': fields.Datetime.now(),
-                        })
-                        partner.message_post(body=_("O número de celular (%s) foi verificado com sucesso como uma conta do WhatsApp.") % partner.mobile)
-                        verified_count += 1
-                    else:
-                        partner.write({'whatsapp_verified': False})
-                        partner.message_post(body=_("O número de celular (%s) não corresponde a uma conta do WhatsApp.") % partner.mobile)
-                        failed_count += 1
-                else:
-                    raise UserError(_("A API retornou uma resposta inesperada: %s") % response)
-            except UserError as e:
-                _logger.error("Erro ao verificar o número do WhatsApp para '%s': %s", partner.name, e)
-                partner.message_post(body=_("Erro na verificação do WhatsApp: %s") % e)
-                failed_count += 1
-        if verified_count or failed_count:
-            message = _("%d contato(s) verificado(s) com sucesso. %d falha(ram).") % (verified_count, failed_count)
+
+        config = self.env['whatsapp.contact.config'].sudo()._get_config_record()
+        if len(self) > (config.verify_chunk_size or 100):
+            # Seleções grandes são verificadas em segundo plano, em lotes.
+            job = self.env['whatsapp.verification.job']._create_job(
+                self, _("Verificação de %s contatos", len(self)), instance
+            )
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
-                    'title': _("Verificação Concluída"),
-                    'message': message,
-                    'type': 'success' if verified_count and not failed_count else 'warning',
+                    'title': _("Verificação Agendada"),
+                    'message': _("%s contatos serão verificados em segundo plano. Você será avisado ao final.", job.total_count),
+                    'type': 'info',
                     'sticky': False,
                 }
             }
 
+        verified, not_found, failed = self._whatsapp_verify_numbers(instance)
+        if len(self) == 1:
+            partner = self
+            if verified:
+                partner.message_post(body=_("O número de celular (%s) foi verificado com sucesso como uma conta do WhatsApp.") % partner.mobile)
+            elif not_found:
+                partner.message_post(body=_("O número de celular (%s) não corresponde a uma conta do WhatsApp.") % partner.mobile)
+            else:
+                partner.message_post(body=_("Falha na verificação do WhatsApp para o número '%s'.") % (partner.mobile or ''))
+        verified_count = len(verified)
+        failed_count = len(not_found) + len(failed)
+        message = _("%d contato(s) verificado(s) com sucesso. %d falha(ram).") % (verified_count, failed_count)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _("Verificação Concluída"),
+                'message': message,
+                'type': 'success' if verified_count and not failed_count else 'warning',
+                'sticky': False,
+            }
+        }
+
+    def _whatsapp_verify_numbers(self, instance):
+        """
+        Verifica os contatos em lote: consulta primeiro o cache de resultados e
+        envia apenas os números restantes para `/chat/whatsappNumbers`, em blocos.
+
+        :return: tupla de recordsets (com WhatsApp, sem WhatsApp, falhas)
+        """
+        config = self.env['whatsapp.contact.config'].sudo()._get_config_record()
+        chunk_size = config.verify_chunk_size or 100
+        NumberCheck = self.env['whatsapp.number.check'].sudo()
+
+        numbers_by_partner = {}
+        invalid = self.browse()
+        for partner in self:
+            number = partner.whatsapp_jid or re.sub(r'\D', '', partner.mobile or '')
+            if number:
+                numbers_by_partner[partner] = number
+            else:
+                invalid |= partner
+
+        numbers = set(numbers_by_partner.values())
+        results = NumberCheck._get_fresh_results(numbers, config.verify_cache_ttl_hours)
+        to_check = sorted(numbers - set(results))
+        for start in range(0, len(to_check), chunk_size):
+            chunk = to_check[start:start + chunk_size]
+            try:
+                response = self.env['whatsapp.evolution.api']._api_check_whatsapp_numbers(instance, chunk)
+            except UserError as e:
+                _logger.error("Erro ao verificar %s número(s) do WhatsApp: %s", len(chunk), e)
+                continue
+            if not isinstance(response, list):
+                _logger.error("A API retornou uma resposta inesperada na verificação de números: %s", response)
+                continue
+            chunk_results = {}
+            for position, item in enumerate(response):
+                if not isinstance(item, dict):
+                    continue
+                number = re.sub(r'\D', '', str(item.get('number') or ''))
+                if number not in chunk and position < len(chunk):
+                    number = chunk[position]
+                chunk_results[number] = (bool(item.get('exists')), item.get('jid'))
+            NumberCheck._store_results(chunk_results)
+            results.update({number: exists for number, (exists, _jid) in chunk_results.items()})
+
+        verified = self.browse([p.id for p, number in numbers_by_partner.items() if results.get(number) is True])
+        not_found = self.browse([p.id for p, number in numbers_by_partner.items() if results.get(number) is False])
+        failed = self - verified - not_found
+        if verified:
+            verified.write({'whatsapp_verified': True, 'whatsapp_verified_date': fields.Datetime.now()})
+        if not_found:
+            not_found.write({'whatsapp_verified': False})
+        return verified, not_found, failed
+
     # ============================ INÍCIO DOS MÉTODOS RESTAURADOS E ADICIONADOS ============================
     def _get_revert_window_hours(self):
         """Busca o valor do nosso novo modelo de configuração."""
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+
+from odoo import _, api, fields, models
+from odoo.tools.lru import LRU
+
+_logger = logging.getLogger(__name__)
+
+_BATCH_SIZE = 50
+_DOWNLOAD_WORKERS = 4
+# Intervalo até uma sincronização com falha poder ser reagendada (o TTL só vale para sucessos).
+_FAILED_RETRY_INTERVAL = timedelta(minutes=30)
+
+# Cache do processo: (banco, JID) -> data até a qual a foto não precisa ser verificada.
+# Como só encurta o caminho dentro do TTL, não precisa de invalidação entre workers.
+_FRESH_UNTIL_CACHE = LRU(8192)
+
+
+def _download_picture(url):
+    """Baixa a foto de perfil. Executada nas threads do pool: não acessa o banco."""
+    try:
+        response = requests.get(url, timeout=20)
+        response.raise_for_status()
+        return response.content, None
+    except requests.exceptions.RequestException as e:
+        return None, str(e)
+
+
+class WhatsappAvatarSync(models.Model):
+    """
+    Fila de sincronização das fotos de perfil dos contatos do WhatsApp.
+
+    O webhook apenas enfileira o JID (uma linha por JID, sem duplicatas); o cron
+    `ir_cron_sync_whatsapp_avatars` busca a URL da foto em segundo plano, respeitando
+    o TTL configurado, e só baixa e grava `image_1920` quando a URL ou o conteúdo
+    da imagem realmente mudou.
+    """
+    _name = 'whatsapp.avatar.sync'
+    _description = 'WhatsApp Profile Picture Sync'
+    _rec_name = 'jid'
+
+    jid = fields.Char(string='JID', required=True, readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Contato', required=True, readonly=True, ondelete='cascade')
+    instance_id = fields.Many2one('whatsapp.instance', string='Instância', readonly=True, ondelete='set null')
+    state = fields.Selection([
+        ('pending', 'Na Fila'),
+        ('done', 'Sincronizada'),
+        ('failed', 'Falhou'),
+    ], string='Status', default='pending', required=True, readonly=True)
+    picture_url = fields.Char(string='URL da Foto', readonly=True)
+    picture_checksum = fields.Char(string='Checksum da Foto', readonly=True)
+    last_sync_date = fields.Datetime(string='Sincronizada em', readonly=True)
+    error = fields.Char(string='Erro', readonly=True)
+
+    _sql_constraints = [('jid_unique', 'UNIQUE(jid)', 'Cada JID só pode aparecer uma vez na fila de fotos de perfil.')]
+
+    def init(self):
+        # O cron busca sempre "próximos pendentes".
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_avatar_sync_pending_idx
+                ON whatsapp_avatar_sync (id)
+             WHERE state = 'pending'
+        """)
+
+    @api.model
+    def _normalize_jid(self, jid):
+        """Remove o sufixo de dispositivo: "5511...:14@s.whatsapp.net" -> "5511...@s.whatsapp.net"."""
+        user, _sep, server = jid.partition('@')
+        return f"{user.split(':')[0]}@{server or 's.whatsapp.net'}"
+
+    @api.model
+    def _enqueue(self, partner, instance, jid):
+        """
+        Agenda a sincronização da foto do JID. Não faz nada se ele já estiver na
+        fila ou tiver sido sincronizado dentro do TTL, então pode ser chamado a
+        cada mensagem recebida. Uma sincronização com falha é repetida depois de
+        `_FAILED_RETRY_INTERVAL`, sem esperar o TTL.
+        """
+        jid = self._normalize_jid(jid)
+        now = fields.Datetime.now()
+        cache_key = (self.env.cr.dbname, jid)
+        fresh_until = _FRESH_UNTIL_CACHE.get(cache_key)
+        if fresh_until and fresh_until > now:
+            return
+
+        config = self.env['whatsapp.contact.config'].sudo()._get_config_record()
+        ttl = timedelta(hours=config.avatar_sync_ttl_hours)
+        # Verifica o TTL com uma leitura antes de escrever: a maioria das mensagens é
+        # de contatos já sincronizados, e o webhook não deve gravar nada para eles.
+        self.env.cr.execute("SELECT state, last_sync_date, write_date FROM whatsapp_avatar_sync WHERE jid = %s", [jid])
+        row = self.env.cr.fetchone()
+        if row:
+            state, last_sync_date, write_date = row
+            if state == 'pending':
+                return
+            if state == 'failed':
+                if write_date >= now - _FAILED_RETRY_INTERVAL:
+                    _FRESH_UNTIL_CACHE[cache_key] = write_date + _FAILED_RETRY_INTERVAL
+                    return
+            elif last_sync_date and last_sync_date >= now - ttl:
+                _FRESH_UNTIL_CACHE[cache_key] = last_sync_date + ttl
+                return
+
+        # Upsert atômico: webhooks simultâneos do mesmo contato não colidem na constraint.
+        self.env.cr.execute("""
+            INSERT INTO whatsapp_avatar_sync (jid, partner_id, instance_id, state, create_uid, write_uid, create_date, write_date)
+                 VALUES (%(jid)s, %(partner)s, %(instance)s, 'pending', %(uid)s, %(uid)s, %(now)s, %(now)s)
+            ON CONFLICT (jid) DO UPDATE
+                    SET state = 'pending',
+                        partner_id = EXCLUDED.partner_id,
+                        instance_id = EXCLUDED.instance_id,
+                        write_uid = EXCLUDED.write_uid,
+                        write_date = EXCLUDED.write_date
+                  WHERE CASE whatsapp_avatar_sync.state
+                            WHEN 'pending' THEN FALSE
+                            WHEN 'failed' THEN whatsapp_avatar_sync.write_date < %(retry_limit)s
+                            ELSE whatsapp_avatar_sync.last_sync_date IS NULL OR whatsapp_avatar_sync.last_sync_date < %(limit)s
+                        END
+              RETURNING id
+        """, {
+            'jid': jid,
+            'partner': partner.id,
+            'instance': instance.id,
+            'uid': self.env.uid,
+            'now': now,
+            'limit': now - ttl,
+            'retry_limit': now - _FAILED_RETRY_INTERVAL,
+        })
+        if self.env.cr.fetchone():
+            self.env.ref('whatsapp_contact_management.ir_cron_sync_whatsapp_avatars')._trigger()
+
+    @api.model
+    def _cron_sync_avatars(self):
+        """
+        Sincroniza um lote da fila. As URLs vêm da API na thread do cron (que usa
+        o ambiente e os limites de envio da instância); só as imagens cuja URL
+        mudou são baixadas, em paralelo, e só as que mudaram de conteúdo são gravadas.
+        """
+        self.env.cr.execute("""
+            SELECT id
+              FROM whatsapp_avatar_sync
+             WHERE state = 'pending'
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [_BATCH_SIZE])
+        items = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not items:
+            return
+
+        # `last_sync_date` marca só os sucessos: é dela que o TTL de `_enqueue` depende.
+        results = {item: {'state': 'done', 'error': False} for item in items}
+        fallback_instance = None
+        to_download = {}
+        for item in items:
+            instance = item.instance_id
+            if instance.status != 'connected':
+                if fallback_instance is None:
+                    fallback_instance = self.env['whatsapp.instance']._get_verifying_instance()
+                instance = fallback_instance
+            if not instance:
+                results[item].update({'state': 'failed', 'error': _("Nenhuma instância conectada do WhatsApp foi encontrada.")})
+                continue
+            try:
+                api_response = self.env['whatsapp.evolution.api']._api_fetch_profile_picture_url(instance, item.jid.split('@')[0])
+            except Exception as e:
+                _logger.warning("Não foi possível buscar a URL da foto de perfil de %s: %s", item.jid, e)
+                results[item].update({'state': 'failed', 'error': str(e)})
+                continue
+            picture_url = api_response.get('profilePictureUrl')
+            # Sem foto (ou privada): mantém a imagem atual do contato.
+            if picture_url and picture_url != item.picture_url:
+                to_download[item] = picture_url
+
+        with ThreadPoolExecutor(max_workers=_DOWNLOAD_WORKERS) as executor:
+            futures = {item: executor.submit(_download_picture, url) for item, url in to_download.items()}
+
+        for item, future in futures.items():
+            content, error = future.result()
+            if content is None:
+                _logger.warning("Não foi possível baixar a foto de perfil de %s: %s", item.jid, error)
+                results[item].update({'state': 'failed', 'error': error})
+                continue
+            results[item]['picture_url'] = to_download[item]
+            checksum = hashlib.sha1(content).hexdigest()
+            if checksum == item.picture_checksum:
+                continue
+            results[item]['picture_checksum'] = checksum
+            # Na primeira sincronização, não substitui uma imagem definida manualmente.
+            if item.picture_checksum or not item.partner_id.image_1920:
+                item.partner_id.write({'image_1920': base64.b64encode(content)})
+
+        now = fields.Datetime.now()
+        for item, vals in results.items():
+            if vals['state'] == 'done':
+                vals['last_sync_date'] = now
+            item.write(vals)
+        # Libera os locks do lote antes de reagendar.
+        self.env.cr.commit()  # pylint: disable=invalid-commit
+
+        if len(items) == _BATCH_SIZE:
+            self.env.ref('whatsapp_contact_management.ir_cron_sync_whatsapp_avatars')._trigger()
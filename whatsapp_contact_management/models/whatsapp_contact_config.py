@@ -13,6 +13,31 @@ class WhatsappContactConfig(models.Model):
         help="Period (in hours) during which a user can revert the promotion of their own contact."
     )
 
+    # --- WhatsApp number verification ---
+    verify_chunk_size = fields.Integer(
+        string="Verification Batch Size", default=100,
+        help="Numbers sent per call to the Evolution API. Larger selections are verified in the background."
+    )
+    verify_cache_ttl_hours = fields.Integer(
+        string="Verification Cache (Hours)", default=168,
+        help="A number verified within this period is not checked against the API again. 0 disables the cache."
+    )
+    reverify_after_days = fields.Integer(
+        string="Re-verify After (Days)", default=30,
+        help="Verified contacts older than this are periodically re-verified in the background. 0 disables it."
+    )
+    reverify_batch_size = fields.Integer(
+        string="Re-verification Batch", default=1000,
+        help="Maximum number of stale contacts scheduled per periodic run."
+    )
+
+    # --- Profile pictures ---
+    avatar_sync_ttl_hours = fields.Integer(
+        string="Profile Picture Refresh (Hours)", default=24,
+        help="A contact's profile picture is checked against WhatsApp at most once per period. "
+             "The image is only downloaded and saved again when it changed."
+    )
+
     @api.model
     def create(self, vals):
         if self.search_count([]) > 0:
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+
+class WhatsappNumberCheck(models.Model):
+    """
+    Cache dos resultados de `/chat/whatsappNumbers`, por número normalizado.
+    Enquanto o resultado estiver dentro do TTL, a verificação não chama a API.
+    """
+    _name = 'whatsapp.number.check'
+    _description = 'WhatsApp Number Verification Cache'
+    _rec_name = 'number'
+
+    number = fields.Char(string='Número', required=True, readonly=True)
+    exists = fields.Boolean(string='Possui WhatsApp', readonly=True)
+    jid = fields.Char(string='JID', readonly=True)
+    check_date = fields.Datetime(string='Verificado em', required=True, readonly=True, index=True)
+
+    _sql_constraints = [('number_unique', 'UNIQUE(number)', 'Cada número só pode ter um resultado em cache.')]
+
+    @api.model
+    def _get_fresh_results(self, numbers, ttl_hours):
+        """Retorna {número: existe} para os números verificados dentro do TTL."""
+        if not numbers or not ttl_hours:
+            return {}
+        limit_date = fields.Datetime.now() - timedelta(hours=ttl_hours)
+        checks = self.search_fetch([
+            ('number', 'in', list(numbers)),
+            ('check_date', '>=', limit_date),
+        ], ['number', 'exists'])
+        return {check.number: check.exists for check in checks}
+
+    @api.model
+    def _store_results(self, results):
+        """Grava os resultados {número: (existe, jid)}, atualizando as entradas já existentes."""
+        if not results:
+            return
+        now = fields.Datetime.now()
+        existing = {check.number: check for check in self.search([('number', 'in', list(results))])}
+        to_create = []
+        for number, (exists, jid) in results.items():
+            vals = {'exists': exists, 'jid': jid, 'check_date': now}
+            if number in existing:
+                existing[number].write(vals)
+            else:
+                to_create.append({'number': number, **vals})
+        if to_create:
+            self.create(to_create)
+
+    @api.autovacuum
+    def _gc_expired_checks(self):
+        """Remove resultados muito antigos (90 dias), que já não serviriam como cache."""
+        self.search([('check_date', '<', fields.Datetime.now() - timedelta(days=90))]).unlink()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+from datetime import timedelta
+
+from odoo import _, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Tempo máximo de uma execução do cron antes de se reagendar (segundos).
+_JOB_RUN_BUDGET = 240
+# Lotes seguidos com erro inesperado antes de o job ser marcado como falho.
+_MAX_CONSECUTIVE_CHUNK_ERRORS = 3
+
+
+class WhatsappVerificationJob(models.Model):
+    """
+    Verificação de números do WhatsApp em segundo plano, para seleções grandes
+    e para a reverificação periódica dos contatos com verificação antiga.
+    Os contatos são processados em lotes; o progresso é confirmado a cada lote.
+    """
+    _name = 'whatsapp.verification.job'
+    _description = 'WhatsApp Number Verification Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Descrição', required=True, readonly=True)
+    instance_id = fields.Many2one('whatsapp.instance', string='Instância', readonly=True, ondelete='set null')
+    partner_ids = fields.Many2many('res.partner', string='Contatos', readonly=True)
+    state = fields.Selection([
+        ('pending', 'Na Fila'),
+        ('running', 'Em Andamento'),
+        ('done', 'Concluída'),
+        ('failed', 'Falhou'),
+    ], string='Status', default='pending', required=True, readonly=True, index=True)
+    total_count = fields.Integer(string='Total', readonly=True)
+    processed_count = fields.Integer(string='Processados', readonly=True)
+    verified_count = fields.Integer(string='Com WhatsApp', readonly=True)
+    not_found_count = fields.Integer(string='Sem WhatsApp', readonly=True)
+    failed_count = fields.Integer(string='Falhas', readonly=True)
+    progress = fields.Float(string='Progresso', compute='_compute_progress')
+    error = fields.Text(string='Erro', readonly=True)
+
+    @api.depends('processed_count', 'total_count')
+    def _compute_progress(self):
+        for job in self:
+            job.progress = 100.0 * job.processed_count / job.total_count if job.total_count else 0.0
+
+    def _trigger_run(self):
+        self.env.ref('whatsapp_contact_management.ir_cron_run_whatsapp_verification_jobs')._trigger()
+
+    @api.model
+    def _create_job(self, partners, name, instance=None):
+        job = self.sudo().create({
+            'name': name,
+            'instance_id': instance.id if instance else False,
+            'partner_ids': [(6, 0, partners.ids)],
+            'total_count': len(partners),
+        })
+        self._trigger_run()
+        return job
+
+    @api.model
+    def _cron_run_jobs(self):
+        deadline = time.monotonic() + _JOB_RUN_BUDGET
+        config = self.env['whatsapp.contact.config'].sudo()._get_config_record()
+        chunk_size = config.verify_chunk_size or 100
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            instance = job.instance_id if job.instance_id.status == 'connected' else \
+                self.env['whatsapp.instance']._get_verifying_instance()
+            if not instance:
+                job.write({'state': 'failed', 'error': _("Nenhuma instância conectada do WhatsApp foi encontrada.")})
+                continue
+            partner_ids = sorted(job.partner_ids.ids)
+            job.state = 'running'
+            chunk_errors = 0
+            while job.processed_count < len(partner_ids):
+                if time.monotonic() > deadline:
+                    self._trigger_run()
+                    return
+                chunk_ids = partner_ids[job.processed_count:job.processed_count + chunk_size]
+                try:
+                    # Contatos excluídos depois da criação do job contam como falha.
+                    partners = self.env['res.partner'].browse(chunk_ids).exists()
+                    verified, not_found, failed = partners._whatsapp_verify_numbers(instance)
+                    job.write({
+                        'processed_count': job.processed_count + len(chunk_ids),
+                        'verified_count': job.verified_count + len(verified),
+                        'not_found_count': job.not_found_count + len(not_found),
+                        'failed_count': job.failed_count + len(failed) + len(chunk_ids) - len(partners),
+                    })
+                    chunk_errors = 0
+                except Exception as e:
+                    # Um lote com erro inesperado não pode travar a fila: desfaz o
+                    # lote, conta seus contatos como falha e segue adiante.
+                    _logger.exception("Erro ao verificar um lote do job de verificação %s.", job.id)
+                    self.env.cr.rollback()
+                    chunk_errors += 1
+                    job.write({
+                        'processed_count': job.processed_count + len(chunk_ids),
+                        'failed_count': job.failed_count + len(chunk_ids),
+                        'error': str(e),
+                    })
+                    if chunk_errors >= _MAX_CONSECUTIVE_CHUNK_ERRORS:
+                        job.state = 'failed'
+                        self.env.cr.commit()  # pylint: disable=invalid-commit
+                        break
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            if job.state == 'failed':
+                continue
+            job.state = 'done'
+            job._notify_done()
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def _notify_done(self):
+        self.ensure_one()
+        if not self.create_uid or self.create_uid._is_superuser():
+            return
+        self.create_uid.partner_id._bus_send('simple_notification', {
+            'type': 'success' if not self.failed_count else 'warning',
+            'title': _("Verificação Concluída"),
+            'message': _("%(verified)s com WhatsApp, %(not_found)s sem WhatsApp, %(failed)s falha(s).",
+                         verified=self.verified_count, not_found=self.not_found_count, failed=self.failed_count),
+        })
+
+    @api.model
+    def _cron_reverify_stale_partners(self):
+        """Agenda a reverificação dos contatos verificados há mais tempo que o configurado."""
+        config = self.env['whatsapp.contact.config'].sudo()._get_config_record()
+        if not config.reverify_after_days:
+            return
+        if self.search_count([('state', 'in', ('pending', 'running'))]):
+            return
+        limit_date = fields.Datetime.now() - timedelta(days=config.reverify_after_days)
+        partners = self.env['res.partner'].search([
+            ('whatsapp_verified', '=', True),
+            ('whatsapp_verified_date', '<', limit_date),
+            ('mobile', '!=', False),
+        ], order='whatsapp_verified_date', limit=config.reverify_batch_size or 1000)
+        if partners:
+            self._create_job(partners, _("Reverificação periódica (%s contatos)", len(partners)))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from odoo import api, fields, models, _
+from odoo.addons.whatsapp_evolution_base.tools import metrics
+
+_logger = logging.getLogger(__name__)
+
+class WhatsappWebhookProcessor(models.AbstractModel):
+    _inherit = 'whatsapp.webhook.processor'
+
+    @api.model
+    def _process_event(self, instance, payload):
+        """
+        1. Encontra/cria o parceiro (para mensagens de entrada E saída).
+        2. Passa o parceiro para o processamento base criar o log da mensagem.
+        3. Passa o parceiro para a camada do Discuss postar no canal.
+        """
+        event = payload.get('event')
+
+        # Ignora eventos de chamada para evitar criação de contatos indesejados
+        # e mensagens automáticas que não queremos.
+        if event == 'call':
+            _logger.info("Webhook de chamada (event: 'call') ignorado.")
+            return {'status': 'ok', 'message': 'Call event ignored'}
+
+        partner = self.env['res.partner']
+        if event == 'messages.upsert':
+            message_data = payload.get('data', {})
+            # A lógica de encontrar/criar o parceiro funciona para ambas as direções
+            with metrics.stage('partner_find_or_create', self.env.cr):
+                partner = self._find_or_create_partner_from_message(instance, message_data)
+
+        processor = self.with_context(webhook_partner_id=partner.id) if partner else self
+        response = super(WhatsappWebhookProcessor, processor)._process_event(instance, payload)
+
+        # A postagem no Discuss também ocorre para mensagens de saída.
+        # Reentregas de uma mensagem já registrada não são postadas novamente.
+        if event == 'messages.upsert' and partner and not response.get('duplicate'):
+            self._post_message_in_discuss_channel(instance, payload.get('data', {}), partner)
+
+        return response
+
+    @api.model
+    def _post_message_in_discuss_channel(self, instance, message_data, partner):
+        """
+        Este método é um "placeholder" que é implementado pelo módulo whatsapp_evolution_discuss.
+        """
+        pass
+
+    @api.model
+    def _set_partner_image_from_api(self, partner, instance, phone_number):
+        """
+        Agenda a sincronização da foto de perfil do contato. O download acontece
+        em segundo plano (`whatsapp.avatar.sync`), fora da transação do webhook.
+        """
+        if not all([partner, instance, phone_number]):
+            return
+        with metrics.stage('profile_picture_fetch', self.env.cr):
+            self.env['whatsapp.avatar.sync'].sudo()._enqueue(partner, instance, phone_number)
+
+    @api.model
+    def _find_or_create_partner_from_message(self, instance, message_data):
+        """
+        Encontra ou cria o parceiro tanto para mensagens de entrada quanto de saída.
+        """
+        key = message_data.get('key', {})
+        is_from_me = key.get('fromMe', False)
+
+        # Determina o JID do "outro" participante da conversa
+        if is_from_me:
+            # Mensagem de SAÍDA: O parceiro é o destinatário (remoteJid)
+            partner_jid = key.get('remoteJid')
+        else:
+            # Mensagem de ENTRADA: O parceiro é o remetente (participant ou remoteJid)
+            partner_jid = key.get('participant') or key.get('remoteJid')
+
+        # Se não há um JID de parceiro ou é uma mensagem de grupo genérica, não faz nada
+        if not partner_jid or '@g.us' in partner_jid:
+            return self.env['res.partner']
+
+        # Limpa o JID para remover qualquer coisa após ':' ou '@'
+        # Ex: "55123456:14@s.whatsapp.net" -> "55123456"
+        clean_jid = partner_jid.split('@')[0].split(':')[0]
+
+        Partner = self.env['res.partner']
+        sanitized_number = ''.join(filter(str.isdigit, clean_jid))
+
+        # Busca exata e indexada pelo número normalizado (com LRU do processo),
+        # em vez de um `ilike` com curinga inicial em toda a res.partner.
+        partner = Partner._find_by_whatsapp_jid(sanitized_number)
+
+        if partner:
+            # Não faz a lógica de promoção para mensagens de saída
+            if not is_from_me and partner.is_private and instance.instance_type == 'company':
+                pass # Lógica de promoção, se houver
+
+            # Agenda a foto de perfil apenas para mensagens de entrada; a fila respeita
+            # o TTL e detecta trocas de foto, então não depende de o contato já ter imagem.
+            if not is_from_me:
+                self._set_partner_image_from_api(partner, instance, partner_jid)
+            return partner
+
+        # Lógica de criação de contato (geralmente para mensagens de entrada)
+        # Para mensagens de saída, o contato já deveria existir. Se não existir, criamos.
+        # O pushName em mensagens de saída é o do remetente, não do destinatário.
+        # Usar o número de telefone como nome é um fallback seguro.
+        partner_name = message_data.get('pushName') if not is_from_me else sanitized_number
+
+        vals = {
+            'name': partner_name,
+            'mobile': f"+{sanitized_number}",
+            'whatsapp_instance_id': instance.id,
+            'whatsapp_verified': True,
+            'whatsapp_verified_date': fields.Datetime.now(),
+        }
+
+        if instance.instance_type == 'user' and instance.user_id:
+            vals.update({'is_private': True, 'owner_user_id': instance.user_id.id})
+        else:
+            vals.update({'is_private': False})
+
+        try:
+            new_partner = Partner.create(vals)
+            new_partner.message_post(body=_("Contato criado a partir de uma mensagem do WhatsApp."))
+            if not is_from_me:
+                self._set_partner_image_from_api(new_partner, instance, partner_jid)
+            return new_partner
+        except Exception as e:
+            _logger.error("Webhook: Falha ao criar contato para %s. Erro: %s", sanitized_number, e)
+            return self.env['res.partner']
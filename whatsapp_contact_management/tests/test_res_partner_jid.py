@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+
+@tagged('post_install', '-at_install')
+class TestResPartnerWhatsappJid(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Partner = cls.env['res.partner']
+        cls.brazil = cls.env.ref('base.br')
+        cls.partner = cls.Partner.create({
+            'name': 'Contato JID',
+            'mobile': '+55 11 98765-4321',
+            'phone': '+55 11 3333-4444',
+            'country_id': cls.brazil.id,
+        })
+
+    def _set_column(self, partner, column, value):
+        """Grava a coluna direto no banco, como fazem o backfill e os dados antigos."""
+        self.env.flush_all()
+        self.env.cr.execute(f"UPDATE res_partner SET {column} = %s WHERE id = %s", [value, partner.id])
+        partner.invalidate_recordset([column])
+
+    def test_jid_is_computed_from_mobile_and_phone(self):
+        self.assertEqual(self.partner.whatsapp_jid, '5511987654321')
+        self.assertEqual(self.partner.whatsapp_phone_jid, '551133334444')
+        self.partner.mobile = '+55 21 91234-5678'
+        self.assertEqual(self.partner.whatsapp_jid, '5521912345678')
+
+    def test_find_by_exact_jid(self):
+        self.assertEqual(self.Partner._find_by_whatsapp_jid('5511987654321'), self.partner)
+        self.assertEqual(self.Partner._find_by_whatsapp_jid('551133334444'), self.partner)
+        self.assertFalse(self.Partner._find_by_whatsapp_jid('5599000000000'))
+        self.assertFalse(self.Partner._find_by_whatsapp_jid(''))
+
+    def test_find_number_stored_without_country_code(self):
+        # Número antigo gravado sem o código do país (ex.: preenchido pelo backfill).
+        self._set_column(self.partner, 'whatsapp_jid', '11987654321')
+        self.assertEqual(self.Partner._find_by_whatsapp_jid('5511987654321'), self.partner)
+        # Um sufixo curto demais não basta para casar números diferentes.
+        self._set_column(self.partner, 'whatsapp_jid', '4321')
+        self._set_column(self.partner, 'whatsapp_phone_jid', False)
+        self.assertFalse(self.Partner._find_by_whatsapp_jid('5511987654321'))
+
+    def test_cached_lookup_is_revalidated(self):
+        self.assertEqual(self.Partner._find_by_whatsapp_jid('5511987654321'), self.partner)
+        # O número mudou depois da busca: o LRU do processo não pode devolver o parceiro antigo.
+        self.partner.mobile = '+55 21 91234-5678'
+        self.assertFalse(self.Partner._find_by_whatsapp_jid('5511987654321'))
+        self.assertEqual(self.Partner._find_by_whatsapp_jid('5521912345678'), self.partner)
+
+    def test_backfill_keeps_only_digits(self):
+        self._set_column(self.partner, 'whatsapp_jid', None)
+        self._set_column(self.partner, 'whatsapp_phone_jid', None)
+        self.Partner._whatsapp_backfill_jid_column('whatsapp_jid', 'mobile')
+        self.Partner._whatsapp_backfill_jid_column('whatsapp_phone_jid', 'phone')
+        self.partner.invalidate_recordset(['whatsapp_jid', 'whatsapp_phone_jid'])
+        self.assertEqual(self.partner.whatsapp_jid, '5511987654321')
+        self.assertEqual(self.partner.whatsapp_phone_jid, '551133334444')
+
+    def test_backfill_ignores_values_without_digits(self):
+        partner = self.Partner.create({'name': 'Sem Dígitos', 'phone': 'n/d'})
+        self._set_column(partner, 'whatsapp_phone_jid', 'x')
+        self.Partner._whatsapp_backfill_jid_column('whatsapp_phone_jid', 'phone')
+        partner.invalidate_recordset(['whatsapp_phone_jid'])
+        self.assertFalse(partner.whatsapp_phone_jid)
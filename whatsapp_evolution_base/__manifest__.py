@@ -12,11 +12,13 @@
         'security/ir.model.access.csv', 
         'data/evolution_api_config_data.xml',
         'data/whatsapp_webhook_event_data.xml', # <-- ADICIONADO 
+        'data/ir_cron_data.xml',
         'views/whatsapp_config_settings_views.xml', 
         # --- ORDEM CORRIGIDA --- 
         # 1. Carregar as views e suas actions PRIMEIRO 
         'views/whatsapp_instance_views.xml', 
         'views/whatsapp_message_views.xml', 
+        'views/whatsapp_webhook_queue_views.xml',
         # 2. Carregar os menus que USAM essas actions DEPOIS 
         'views/evolution_menus.xml', 
         # --- FIM DA CORREÇÃO --- 
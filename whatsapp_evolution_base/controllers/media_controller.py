@@ -2,10 +2,12 @@
 import requests
 import os
 import mimetypes
+import time
 from urllib.parse import urlparse
 
 from odoo import http
 from odoo.http import request
+from odoo.tools import consteq
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -58,4 +60,26 @@ class MediaProxyController(http.Controller):
             return request.notfound(f"Não foi possível buscar a mídia externa. Erro: {e}")
         except Exception as e:
             _logger.exception("Erro inesperado no download de mídia para o ID %s: %s", message_id, e)
-            return request.make_response("Erro interno no servidor ao processar o download.", status=500)
\ No newline at end of file
+            return request.make_response("Erro interno no servidor ao processar o download.", status=500)
+
+    @http.route('/whatsapp/media/outbound/<int:attachment_id>/<string:filename>', type='http', auth='public', methods=['GET'])
+    def download_outbound_media(self, attachment_id, filename=None, expires=None, token=None, **kw):
+        """
+        Entrega um anexo para a Evolution API baixar ao enviar mídia em modo 'URL assinada'.
+        O link só vale até `expires` e o token é um HMAC do anexo e da validade.
+        """
+        try:
+            expires = int(expires or 0)
+        except ValueError:
+            return request.not_found()
+        if expires < time.time() or not token:
+            return request.not_found()
+        expected = request.env['whatsapp.instance'].sudo()._get_media_url_token(attachment_id, expires)
+        if not consteq(expected, token):
+            return request.not_found()
+
+        attachment = request.env['ir.attachment'].sudo().browse(attachment_id).exists()
+        if not attachment:
+            return request.not_found()
+        # Transmite direto do filestore, com o mimetype dos metadados do anexo.
+        return request.env['ir.binary']._get_stream_from(attachment).get_response(as_attachment=False)
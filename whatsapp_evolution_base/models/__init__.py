@@ -2,6 +2,10 @@ from . import evolution_api
 from . import whatsapp_instance
 # A linha do wizard foi removida
 from . import whatsapp_message
+from . import whatsapp_message_payload
+from . import whatsapp_message_map
 from . import evolution_api_config
 from . import res_partner
-from . import whatsapp_webhook_event
\ No newline at end of file
+from . import whatsapp_webhook_event
+from . import whatsapp_webhook_processor
+from . import whatsapp_webhook_queue
\ No newline at end of file
@@ -6,15 +6,68 @@ import logging
 
 from odoo import models, fields, api, _ as odoo_t
 from odoo.exceptions import UserError, ValidationError
+from odoo.http import request
+
+from ..tools import http_pool, rate_limit
 
 _logger = logging.getLogger(__name__)
 
+
+def perform_prepared_request(prepared):
+    """
+    Executa uma chamada preparada por `_prepare_api_request`: limitada por
+    instância e classe de endpoint, com novas tentativas e backoff. Não acessa o
+    banco. Retorna o JSON da resposta ou levanta a exceção do `requests` (ou
+    `rate_limit.RateLimitExceeded`, se o limite da instância exceder `max_wait`).
+    """
+    response = rate_limit.call(
+        lambda: http_pool.request(
+            prepared['method'], prepared['base_url'], prepared['endpoint'],
+            headers=prepared['headers'], json=prepared['payload'], **prepared['http_options']
+        ),
+        bucket=prepared['bucket'],
+        max_retries=prepared['max_retries'],
+        idempotent=prepared['idempotent'],
+        max_wait=prepared['max_wait'],
+    )
+    response.raise_for_status()
+    return response.json() if response.content else {}
+
+
 class EvolutionApi(models.AbstractModel):
     _name = 'whatsapp.evolution.api'
     _description = 'Evolution API Abstraction Layer'
 
     @api.model
-    def _send_api_request(self, instance_id, method, endpoint, payload=None):
+    def _get_http_options(self):
+        """Opções do pool HTTP, lidas do cache da configuração."""
+        config = self.env['evolution.api.config']._get_api_config_values()
+        return {
+            'pool_size': config['http_pool_size'] or 10,
+            'keep_alive': config['http_keep_alive'],
+            'connect_timeout': config['http_connect_timeout'] or 5,
+            'read_timeout': config['http_read_timeout'] or 30,
+        }
+
+    @api.model
+    def _get_retry_options(self, method, idempotent=None):
+        """
+        Opções de nova tentativa do `rate_limit.call`. Por padrão só GETs são
+        idempotentes; dentro de uma requisição HTTP a espera total é limitada,
+        e o outbox ou o cron tentam de novo depois.
+        """
+        return {
+            'idempotent': method.upper() == 'GET' if idempotent is None else idempotent,
+            'max_wait': rate_limit.INTERACTIVE_MAX_WAIT if request else None,
+        }
+
+    @api.model
+    def _prepare_api_request(self, instance_id, method, endpoint, payload=None, idempotent=None):
+        """
+        Valida a instância e resolve tudo o que a chamada precisa do banco (URL,
+        chave, opções HTTP, bucket e novas tentativas). O resultado é executado por
+        `perform_prepared_request`, que não acessa o banco e pode rodar em threads.
+        """
         base_url, _ = instance_id._get_api_config()
         if not instance_id.api_key:
             raise UserError(odoo_t("A Chave da API (Token) não está configurada para a instância %s.") % instance_id.name)
@@ -22,15 +75,37 @@ class EvolutionApi(models.AbstractModel):
         # --- CORREÇÃO DA URL APLICADA AQUI ---
         clean_base_url = base_url.rstrip('/')
         clean_endpoint = endpoint if endpoint.startswith('/') else f'/{endpoint}'
-        url = f"{clean_base_url}{clean_endpoint}"
         # --- FIM DA CORREÇÃO ---
          
         headers = { 'Content-Type': 'application/json', 'apikey': instance_id.api_key }
 
+        endpoint_class = rate_limit.endpoint_class(clean_endpoint)
+        if endpoint_class == 'send' and instance_id.status == 'disconnected':
+            # Falha imediata em vez de esperar o timeout da Evolution; o monitor de conexão
+            # mantém o status atualizado.
+            raise UserError(odoo_t("A instância %s está desconectada do WhatsApp.") % instance_id.name)
+
+        bucket_key, rate, burst = instance_id._get_rate_limit(endpoint_class)
+        return {
+            'method': method.upper(),
+            'base_url': clean_base_url,
+            'endpoint': clean_endpoint,
+            'headers': headers,
+            'payload': payload,
+            'http_options': self._get_http_options(),
+            'bucket': rate_limit.get_bucket(bucket_key, rate, burst) if rate else None,
+            'max_retries': instance_id.api_max_retries,
+            **self._get_retry_options(method, idempotent),
+        }
+
+    @api.model
+    def _send_api_request(self, instance_id, method, endpoint, payload=None, idempotent=None):
+        prepared = self._prepare_api_request(instance_id, method, endpoint, payload=payload, idempotent=idempotent)
         try:
-            response = requests.request(method.upper(), url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            return response.json() if response.content else {}
+            return perform_prepared_request(prepared)
+        except rate_limit.RateLimitExceeded as e:
+            _logger.warning("Chamada à Evolution API não enviada para a instância '%s': %s", instance_id.name, e)
+            raise UserError(odoo_t("Limite de chamadas da instância %s atingido. Tente novamente em instantes.") % instance_id.name)
         except requests.exceptions.RequestException as e:
             _logger.error("Erro ao enviar requisição para a API da Evolution: %s", e)
             raise UserError(odoo_t("Erro ao comunicar com a API da Evolution: %s") % str(e))
@@ -46,7 +121,10 @@ class EvolutionApi(models.AbstractModel):
         url = f"{clean_base_url}{clean_endpoint}"
 
         try:
-            response = requests.request(method.upper(), url, headers=headers, json=payload, timeout=30)
+            http_options = self._get_http_options()
+            response = rate_limit.call(lambda: http_pool.request(
+                method.upper(), clean_base_url, clean_endpoint, headers=headers, json=payload, **http_options
+            ), **self._get_retry_options(method))
             response.raise_for_status()
             # Adicionar log da resposta para facilitar o debug futuro
             _logger.info("API Response from %s: %s", url, response.text)
@@ -86,7 +164,7 @@ class EvolutionApi(models.AbstractModel):
         """Configura o webhook para uma instância específica."""
         endpoint = f"/webhook/set/{instance_id.name}"
         # A configuração do webhook usa a chave da PRÓPRIA instância, não a global.
-        return self._send_api_request(instance_id, 'POST', endpoint, payload=webhook_payload)
+        return self._send_api_request(instance_id, 'POST', endpoint, payload=webhook_payload, idempotent=True)
 
     # ============================ INÍCIO DA NOVA FUNÇÃO ============================
     @api.model
@@ -95,7 +173,13 @@ class EvolutionApi(models.AbstractModel):
         Define as configurações para uma instância específica.
         """
         endpoint = f"/settings/set/{instance_id.name}"
-        return self._send_api_request(instance_id, 'POST', endpoint, payload=settings_payload)
+        return self._send_api_request(instance_id, 'POST', endpoint, payload=settings_payload, idempotent=True)
+
+    @api.model
+    def _prepare_set_settings(self, instance_id, settings_payload):
+        """Prepara o `_api_set_settings` para ser executado fora da transação (ver `perform_prepared_request`)."""
+        endpoint = f"/settings/set/{instance_id.name}"
+        return self._prepare_api_request(instance_id, 'POST', endpoint, payload=settings_payload, idempotent=True)
      # ============================= FIM DA NOVA FUNÇÃO ==============================
 
     @api.model
@@ -112,7 +196,7 @@ class EvolutionApi(models.AbstractModel):
         endpoint = f"/chat/fetchProfilePictureUrl/{instance_id.name}"
         payload = {'number': phone_number}
         # Este endpoint específico usa POST, conforme a documentação
-        return self._send_api_request(instance_id, 'POST', endpoint, payload=payload)
+        return self._send_api_request(instance_id, 'POST', endpoint, payload=payload, idempotent=True)
 
     # ======================= INÍCIO DA ADIÇÃO =======================
     @api.model
@@ -123,9 +207,19 @@ class EvolutionApi(models.AbstractModel):
         endpoint = f"/chat/whatsappNumbers/{instance_id.name}"
         # A API espera uma lista de strings. Garante que `numbers` seja sempre uma lista.
         payload = {'numbers': numbers if isinstance(numbers, list) else [numbers]}
-        return self._send_api_request(instance_id, 'POST', endpoint, payload=payload)
+        return self._send_api_request(instance_id, 'POST', endpoint, payload=payload, idempotent=True)
     # ======================== FIM DA ADIÇÃO =========================
 
+    @api.model
+    def _api_get_base64_from_media_message(self, instance_id, message_key):
+        """
+        Baixa e decifra a mídia de uma mensagem recebida, identificada pela `key`
+        do webhook. Retorna um dicionário com 'base64' e 'mimetype'.
+        """
+        endpoint = f"/chat/getBase64FromMediaMessage/{instance_id.name}"
+        payload = {'message': {'key': message_key}, 'convertToMp4': False}
+        return self._send_api_request(instance_id, 'POST', endpoint, payload=payload, idempotent=True)
+
     # ======================= INÍCIO DAS NOVAS FUNÇÕES DE ENVIO =======================
     @api.model
     def _api_send_text(self, instance_id, number, text, quoted_message=None):
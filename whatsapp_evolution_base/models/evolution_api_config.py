@@ -1,6 +1,7 @@
 import logging
-from odoo import fields, models, api, _
+from odoo import fields, models, api, tools, _
 from odoo.exceptions import UserError
+from odoo.tools import frozendict
 
 _logger = logging.getLogger(__name__)
 
@@ -21,6 +22,76 @@ class EvolutionApiConfig(models.Model):
     evolution_api_url = fields.Char(string="Evolution API URL", help="URL base do seu servidor Evolution API (ex: http://localhost:8080)")
     evolution_api_global_key = fields.Char(string="Evolution Global API Key", help="Chave de API global para gerenciar instâncias.")
 
+    # --- Processamento do Webhook ---
+    webhook_processing_mode = fields.Selection([
+        ('sync', 'Síncrono (na requisição)'),
+        ('queue', 'Fila assíncrona'),
+    ], string="Modo de Processamento", default='sync', required=True,
+        help="Síncrono: o webhook é processado dentro da requisição HTTP.\n"
+             "Fila assíncrona: o payload é apenas gravado e processado em lotes por um worker em segundo plano, "
+             "mantendo a latência do webhook constante sob carga.")
+    webhook_queue_batch_size = fields.Integer(
+        string="Tamanho do Lote da Fila", default=200,
+        help="Quantidade máxima de eventos processados por cada worker da fila em uma execução."
+    )
+    webhook_queue_workers = fields.Integer(
+        string="Workers da Fila", default=2,
+        help="Quantidade de threads que drenam a fila em paralelo. Cada conversa é processada por um "
+             "único worker de cada vez, então a ordem das mensagens dentro da conversa é mantida."
+    )
+
+    raw_json_storage = fields.Selection([
+        ('full', 'Completo (texto sem compressão)'),
+        ('compressed', 'Enxuto e comprimido'),
+        ('none', 'Não armazenar'),
+    ], string="Armazenamento do JSON Bruto", default='compressed', required=True,
+        help="Completo: grava o payload inteiro em whatsapp.message, inclusive mídias em base64 e miniaturas.\n"
+             "Enxuto e comprimido: remove os campos binários (mantendo apenas uma referência) e grava o "
+             "restante comprimido em uma tabela à parte, descomprimido somente quando necessário.\n"
+             "Não armazenar: o payload bruto não é guardado.")
+
+    # --- Envio de anexos ---
+    outbound_media_mode = fields.Selection([
+        ('base64', 'Base64 no corpo da requisição'),
+        ('url', 'URL assinada'),
+    ], string="Envio de Anexos", default='base64', required=True,
+        help="Base64: o arquivo é codificado e enviado dentro do JSON.\n"
+             "URL assinada: o Odoo gera um link temporário e protegido por token, e a Evolution baixa o arquivo "
+             "diretamente. Exige que o servidor da Evolution alcance a URL base do Odoo.")
+    outbound_media_url_ttl = fields.Integer(
+        string="Validade do Link (s)", default=600,
+        help="Tempo durante o qual o link assinado do anexo pode ser usado pela Evolution."
+    )
+
+    # --- Conexões HTTP com a Evolution API ---
+    http_pool_size = fields.Integer(
+        string="Conexões por Processo", default=10,
+        help="Tamanho do pool de conexões mantidas abertas com a Evolution API em cada processo do Odoo."
+    )
+    http_keep_alive = fields.Boolean(
+        string="Manter Conexões Abertas (Keep-Alive)", default=True,
+        help="Reaproveita as conexões TCP/TLS entre as chamadas, evitando um novo handshake a cada envio."
+    )
+    http_connect_timeout = fields.Integer(string="Timeout de Conexão (s)", default=5)
+    http_read_timeout = fields.Integer(string="Timeout de Resposta (s)", default=30)
+
+    # --- Métricas ---
+    metrics_token = fields.Char(
+        string="Token das Métricas",
+        help="Habilita o endpoint /whatsapp/metrics (formato Prometheus). O coletor deve enviar "
+             "'Authorization: Bearer <token>'. Vazio desabilita o endpoint."
+    )
+
+    # --- Monitor de conexão das instâncias ---
+    health_check_interval = fields.Integer(
+        string="Verificar Instâncias Conectadas (min)", default=10,
+        help="Intervalo entre as verificações de status das instâncias conectadas. 0 desativa o monitor."
+    )
+    health_check_unhealthy_interval = fields.Integer(
+        string="Verificar Instâncias com Problema (min)", default=1,
+        help="Instâncias desconectadas, conectando ou com erro são verificadas com mais frequência."
+    )
+
     # ... o resto do seu código python permanece o mesmo ...
     def action_save(self):
         """
@@ -66,12 +137,33 @@ class EvolutionApiConfig(models.Model):
                 config_record = self.create({})
         return config_record
 
+    @api.model
+    @tools.ormcache()
+    def _get_api_config_values(self):
+        """
+        Retorna os valores da configuração a partir do cache do processo.
+        Usado no caminho crítico (webhook e chamadas de saída) para evitar o
+        `env.ref` + leitura do registro a cada chamada. Invalidado no `write`.
+        """
+        config = self.sudo()._get_config_record()
+        return frozendict({
+            fname: config[fname]
+            for fname, field in self._fields.items()
+            if field.store and field.type not in ('one2many', 'many2many', 'many2one', 'binary')
+        })
+
     # MUDANÇA 4: Sobrescrever métodos create e unlink para garantir que sempre exista apenas um registro
     @api.model
     def create(self, vals):
         if self.search_count([]) > 0:
             raise UserError(_('Já existe uma configuração da Evolution API. Você não pode criar uma nova.'))
+        self.env.registry.clear_cache()
         return super(EvolutionApiConfig, self).create(vals)
 
+    def write(self, vals):
+        res = super(EvolutionApiConfig, self).write(vals)
+        self.env.registry.clear_cache()
+        return res
+
     def unlink(self):
         raise UserError(_('Você não pode apagar a configuração da Evolution API.'))
\ No newline at end of file
@@ -1,21 +1,48 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError
 from odoo.tools.mimetypes import guess_mimetype
-from odoo.tools import html2plaintext
+from odoo.tools import frozendict, html2plaintext
+from odoo.tools.misc import hmac as odoo_hmac
 # ======================= IMPORTAÇÃO ADICIONADA =======================
 from urllib.parse import quote
 # =====================================================================
 import requests
 import base64
+import hashlib
 import json # <-- Importar json
 import logging
 import json
-from datetime import datetime
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .evolution_api import perform_prepared_request
 
 _logger = logging.getLogger(__name__)
 
+_PICTURE_DOWNLOAD_WORKERS = 8
+
+_SETTINGS_SYNC_MAX_ATTEMPTS = 5
+_SETTINGS_SYNC_WORKERS = 8
+# Chave (classe) do advisory lock da sincronização de configurações.
+_SETTINGS_SYNC_LOCK = 8045001
+
+
+def _download_profile_picture(url):
+    """Baixa a foto de perfil da instância. Executada nas threads do pool: não acessa o banco."""
+    try:
+        response = requests.get(url, timeout=10)
+        if response.status_code == 200:
+            return response.content
+    except Exception as e:
+        _logger.warning("Não foi possível buscar a foto do perfil em %s: %s", url, e)
+    return None
+
+
 class WhatsappInstance(models.Model):
     _name = 'whatsapp.instance'
     _description = 'WhatsApp Instance'
@@ -48,6 +75,9 @@ class WhatsappInstance(models.Model):
         ('error', 'Erro'),
     ], string='Status', default='disconnected', readonly=True, tracking=True)
     profile_picture = fields.Binary(string='Foto do Perfil', readonly=True, attachment=True)
+    # URL e sha1 da última foto baixada: evitam baixar e regravar a mesma imagem a cada atualização.
+    profile_picture_url = fields.Char(string='URL da Foto do Perfil', readonly=True)
+    profile_picture_checksum = fields.Char(string='Checksum da Foto do Perfil', readonly=True)
     profile_name = fields.Char(string='Nome do Perfil', readonly=True)
     api_key = fields.Char(string='Chave da API', groups="base.group_system", help="Token da instância na Evolution API.", tracking=True)
     company_id = fields.Many2one('res.company', string='Empresa', default=lambda self: self.env.company)
@@ -69,56 +99,202 @@ class WhatsappInstance(models.Model):
     enable_webhook = fields.Boolean(string="Habilitar Webhook", default=True, tracking=True)
     webhook_url = fields.Char(string="Webhook URL", compute='_compute_webhook_url', readonly=True, store=False)
     base64_webhook = fields.Boolean(string="Base64 Webhook", default=False, tracking=True)
+
+    # --- Limites de envio para a Evolution API (por processo) ---
+    rate_limit_send = fields.Integer(
+        string="Envios por Minuto", default=40,
+        help="Máximo de chamadas de envio (/message/*) por minuto. 0 desativa o limite.")
+    rate_limit_chat = fields.Integer(
+        string="Consultas por Minuto", default=60,
+        help="Máximo de chamadas de consulta (/chat/*, ex.: verificação de números e fotos) por minuto. 0 desativa o limite.")
+    rate_limit_admin = fields.Integer(
+        string="Chamadas Administrativas por Minuto", default=30,
+        help="Máximo de chamadas de configuração (instância, webhook, settings) por minuto. 0 desativa o limite.")
+    rate_limit_burst = fields.Integer(
+        string="Rajada Máxima", default=5,
+        help="Quantidade de chamadas que podem ser feitas de uma vez antes de o limite por minuto ser aplicado.")
+    api_max_retries = fields.Integer(
+        string="Novas Tentativas", default=3,
+        help="Novas tentativas, com backoff exponencial e respeitando o Retry-After, para respostas 429/5xx e falhas de conexão.")
+
+    # --- Monitor de conexão ---
+    status_change_date = fields.Datetime(string='Status Alterado em', readonly=True, copy=False)
+    health_next_check = fields.Datetime(string='Próxima Verificação', readonly=True, index=True, copy=False)
+
+    # --- Sincronização das configurações com a Evolution API ---
+    settings_sync_state = fields.Selection([
+        ('synced', 'Sincronizadas'),
+        ('pending', 'Pendentes'),
+        ('failed', 'Falhou'),
+    ], string='Sincronização das Configurações', default='synced', required=True, readonly=True, copy=False)
+    settings_sync_attempts = fields.Integer(string='Tentativas de Sincronização', readonly=True, copy=False)
+    settings_sync_error = fields.Char(string='Erro de Sincronização', readonly=True, copy=False)
     
     _sql_constraints = [
         ('name_unique', 'UNIQUE(name)', 'O nome da instância deve ser único!'),
     ]
 
+    # Campos que representam configurações na API
+    _SETTINGS_FIELDS = (
+        'reject_call', 'call_rejected_message', 'ignore_group', 'always_online',
+        'view_message', 'sync_history', 'view_status',
+    )
+
+    # Campos expostos pelo resolvedor em cache; alterá-los invalida o cache.
+    _RESOLVER_CACHED_FIELDS = ('name', 'instance_type', 'user_id', 'api_key')
+
     # ... (TODOS OS MÉTODOS ANTERIORES PERMANECEM AQUI) ...
 
+    @api.model
+    @tools.ormcache('name')
+    def _get_instance_info_by_name(self, name):
+        """
+        Resolve o nome de uma instância (como enviado pelo webhook) a partir do
+        cache do processo. Retorna None se a instância não existir.
+        """
+        instance = self.sudo().search([('name', '=', name)], limit=1)
+        if not instance:
+            return None
+        return frozendict({
+            'id': instance.id,
+            'instance_type': instance.instance_type,
+            'user_id': instance.user_id.id,
+            'api_key': instance.api_key,
+        })
+
+    def _get_rate_limit(self, endpoint_class):
+        """Retorna (chave do bucket, chamadas por minuto, rajada) para a classe de endpoint."""
+        self.ensure_one()
+        rate = {
+            'send': self.rate_limit_send,
+            'chat': self.rate_limit_chat,
+        }.get(endpoint_class, self.rate_limit_admin)
+        return (self.env.cr.dbname, self.id, endpoint_class), rate, self.rate_limit_burst
+
     # ============================ INÍCIO DO MÉTODO SOBRESCRITO ============================
     def write(self, vals):
         """
         Sobrescreve o método write para sincronizar as configurações com a Evolution API
         sempre que um campo relevante for alterado.
+
+        A sincronização não acontece aqui: as instâncias cujas configurações de fato
+        mudaram são marcadas como pendentes e enviadas pelo cron, fora da requisição
+        (ver `_schedule_settings_sync`). Várias alterações na mesma transação geram
+        um único envio por instância, e um rollback não envia nada.
         """
-        # Lista dos campos que representam configurações na API
-        settings_fields = [
-            'reject_call', 'call_rejected_message', 'ignore_group', 'always_online',
-            'view_message', 'sync_history', 'view_status'
-        ]
-        
+        changed_settings = self.browse()
+        if any(field in vals for field in self._SETTINGS_FIELDS):
+            changed_settings = self.filtered(lambda instance: any(
+                (instance[field] or False) != (vals[field] or False)
+                for field in self._SETTINGS_FIELDS if field in vals
+            ))
+
         # Chama o método original para salvar os dados no Odoo primeiro
         res = super(WhatsappInstance, self).write(vals)
 
-        # Verifica se algum dos campos de configuração foi modificado
-        if any(field in vals for field in settings_fields):
-            for instance in self:
-                _logger.info("Sincronizando configurações para a instância '%s'...", instance.name)
-                # Monta o payload com as chaves em camelCase que a API espera
-                payload = {
-                    "rejectCall": instance.reject_call,
-                    "msgCall": instance.call_rejected_message,
-                    "groupsIgnore": instance.ignore_group,
-                    "alwaysOnline": instance.always_online,
-                    "readMessages": instance.view_message,
-                    "readStatus": instance.view_status,
-                    "syncFullHistory": instance.sync_history
-                }
-                try:
-                    # Chama o novo método da camada de API
-                    self.env['whatsapp.evolution.api']._api_set_settings(instance, payload)
-                    _logger.info("Configurações da instância '%s' sincronizadas com sucesso.", instance.name)
-                    # Adiciona uma nota no chatter para auditoria
-                    instance.message_post(body=_("As configurações da instância foram atualizadas na Evolution API."))
-                except Exception as e:
-                    _logger.warning("Falha ao sincronizar configurações para a instância '%s': %s", instance.name, e)
-                    # Opcional: Adicionar uma mensagem de erro no chatter
-                    instance.message_post(body=_("Falha ao atualizar as configurações na Evolution API: %s") % e)
-        
+        if any(field in vals for field in self._RESOLVER_CACHED_FIELDS):
+            self.env.registry.clear_cache()
+
+        if changed_settings:
+            super(WhatsappInstance, changed_settings).write({
+                'settings_sync_state': 'pending',
+                'settings_sync_attempts': 0,
+                'settings_sync_error': False,
+            })
+            changed_settings._schedule_settings_sync()
+
         return res
     # ============================= FIM DO MÉTODO SOBRESCRITO ==============================
 
+    def _get_settings_payload(self):
+        self.ensure_one()
+        # Monta o payload com as chaves em camelCase que a API espera
+        return {
+            "rejectCall": self.reject_call,
+            "msgCall": self.call_rejected_message,
+            "groupsIgnore": self.ignore_group,
+            "alwaysOnline": self.always_online,
+            "readMessages": self.view_message,
+            "readStatus": self.view_status,
+            "syncFullHistory": self.sync_history
+        }
+
+    def _schedule_settings_sync(self):
+        """
+        Agenda o cron de sincronização para logo após o commit. O gatilho é
+        transacional: um rollback não agenda nada, e a requisição não espera pela
+        Evolution API. Um único gatilho por transação atende todas as instâncias pendentes.
+        """
+        if self.env.cr.cache.get('whatsapp.instance.settings_sync'):
+            return
+        self.env.ref('whatsapp_evolution_base.ir_cron_sync_instance_settings')._trigger()
+        self.env.cr.cache['whatsapp.instance.settings_sync'] = True
+
+    def _apply_settings_sync_result(self, error=None):
+        """
+        Grava o resultado do envio das configurações. Falhas são repetidas pelo
+        cron `ir_cron_sync_instance_settings` com backoff.
+        """
+        self.ensure_one()
+        if not error:
+            self.write({'settings_sync_state': 'synced', 'settings_sync_attempts': 0, 'settings_sync_error': False})
+            _logger.info("Configurações da instância '%s' sincronizadas com sucesso.", self.name)
+            return
+        attempts = self.settings_sync_attempts + 1
+        _logger.warning("Falha ao sincronizar configurações para a instância '%s' (tentativa %s): %s", self.name, attempts, error)
+        vals = {'settings_sync_attempts': attempts, 'settings_sync_error': str(error)}
+        if attempts >= _SETTINGS_SYNC_MAX_ATTEMPTS:
+            vals['settings_sync_state'] = 'failed'
+            self.message_post(body=_("Falha ao atualizar as configurações na Evolution API: %s") % error)
+        else:
+            self.env.ref('whatsapp_evolution_base.ir_cron_sync_instance_settings')._trigger(
+                fields.Datetime.now() + timedelta(minutes=2 ** (attempts - 1))
+            )
+        self.write(vals)
+
+    @api.model
+    def _cron_sync_settings(self):
+        """
+        Envia as configurações pendentes para a Evolution API. As chamadas HTTP
+        rodam em paralelo, em threads que não acessam o banco (como o download das
+        fotos em `_apply_api_details`); os resultados são gravados neste cursor.
+        """
+        instances = self.browse()
+        for instance in self.search([('settings_sync_state', '=', 'pending')]):
+            # Lock não bloqueante: duas execuções nunca sincronizam a mesma instância juntas.
+            self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", [_SETTINGS_SYNC_LOCK, instance.id])
+            if self.env.cr.fetchone()[0]:
+                instances |= instance
+        if not instances:
+            return
+
+        errors = {}
+        prepared = {}
+        for instance in instances:
+            _logger.info("Sincronizando configurações para a instância '%s'...", instance.name)
+            try:
+                prepared[instance] = self.env['whatsapp.evolution.api']._prepare_set_settings(
+                    instance, instance._get_settings_payload()
+                )
+            except UserError as e:
+                errors[instance] = e
+
+        if prepared:
+            with ThreadPoolExecutor(max_workers=min(len(prepared), _SETTINGS_SYNC_WORKERS)) as executor:
+                futures = {instance: executor.submit(perform_prepared_request, request) for instance, request in prepared.items()}
+            for instance, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[instance] = e
+
+        for instance in instances:
+            instance._apply_settings_sync_result(errors.get(instance))
+
+    def action_retry_settings_sync(self):
+        self.write({'settings_sync_state': 'pending', 'settings_sync_attempts': 0, 'settings_sync_error': False})
+        self._schedule_settings_sync()
+
     # ======================= INÍCIO DA CORREÇÃO DEFINITIVA DOS MÉTODOS DE ENVIO =======================
     def send_text(self, phone_number, message, partner=None, quoted_message=None):
         """
@@ -142,9 +318,9 @@ class WhatsappInstance(models.Model):
             quoted_payload = None
             if quoted_message and quoted_message.whatsapp_message_id_str:
                 # Encontra o log da mensagem original para vincular
-                original_log = self.env['whatsapp.message'].search([
-                    ('message_id', '=', quoted_message.whatsapp_message_id_str)
-                ], limit=1)
+                original_log = self.env['whatsapp.message.map']._resolve(
+                    self.id, quoted_message.whatsapp_message_id_str
+                ).whatsapp_message_id
                 if original_log:
                     vals['quoted_message_id'] = original_log.id
 
@@ -177,12 +353,29 @@ class WhatsappInstance(models.Model):
             vals.update({
                 'state': 'failed',
                 'raw_json': str(e),
-                'message_id': f"failed-{fields.Datetime.now()}-{phone_number}"
+                'message_id': f"failed-{uuid.uuid4().hex}-{phone_number}"
             })
         
-        log_message = self.env['whatsapp.message'].create(vals)
+        log_message = self.env['whatsapp.message']._create_outbound_log(vals)
         return log_message, remote_message_id
     
+    @api.model
+    def _get_media_url_token(self, attachment_id, expires):
+        return odoo_hmac(self.env(su=True), 'whatsapp-outbound-media', f'{attachment_id}:{expires}')
+
+    @api.model
+    def _get_signed_media_url(self, attachment):
+        """URL pública, assinada e de curta duração para a Evolution baixar o anexo."""
+        ttl = self.env['evolution.api.config']._get_api_config_values()['outbound_media_url_ttl'] or 600
+        expires = int(time.time()) + ttl
+        token = self._get_media_url_token(attachment.id, expires)
+        # O servidor decodifica %2F antes do roteamento: uma '/' no nome quebraria a rota.
+        filename = quote((attachment.name or 'file').replace('/', '_'), safe='')
+        return (
+            f"{self.get_base_url()}/whatsapp/media/outbound/{attachment.id}/{filename}"
+            f"?expires={expires}&token={token}"
+        )
+
     def send_attachment(self, phone_number, attachment, caption='', partner=None, quoted_message=None):
         """
         MODIFICADO: Adicionado parâmetro 'quoted_message' para consistência.
@@ -190,8 +383,13 @@ class WhatsappInstance(models.Model):
         self.ensure_one()
         _logger.info("Preparando para enviar anexo para %s", phone_number)
 
-        mimetype = attachment.mimetype or guess_mimetype(base64.b64decode(attachment.datas))
-        media_base64 = attachment.datas.decode('utf-8')
+        # O mimetype vem dos metadados do anexo; só decodifica o conteúdo se estiver faltando.
+        mimetype = attachment.mimetype or guess_mimetype(attachment.raw or b'')
+        if self.env['evolution.api.config']._get_api_config_values()['outbound_media_mode'] == 'url':
+            # A Evolution baixa o arquivo direto do Odoo: nada de base64 no corpo do JSON.
+            media_base64 = self._get_signed_media_url(attachment)
+        else:
+            media_base64 = attachment.datas.decode('utf-8')
         odoo_attachment_url = f'/web/content/{attachment.id}/{quote(attachment.name)}'
 
         if 'image' in mimetype and 'webp' in mimetype:
@@ -220,9 +418,9 @@ class WhatsappInstance(models.Model):
         # ======================= INÍCIO DA CORREÇÃO =======================
         # Adicionamos a lógica para preencher o quoted_message_id no log
         if quoted_message and quoted_message.whatsapp_message_id_str:
-            original_log = self.env['whatsapp.message'].search([
-                ('message_id', '=', quoted_message.whatsapp_message_id_str)
-            ], limit=1)
+            original_log = self.env['whatsapp.message.map']._resolve(
+                self.id, quoted_message.whatsapp_message_id_str
+            ).whatsapp_message_id
             if original_log:
                 vals['quoted_message_id'] = original_log.id
         # ======================== FIM DA CORREÇÃO =========================
@@ -250,10 +448,10 @@ class WhatsappInstance(models.Model):
             vals.update({
                 'state': 'failed',
                 'raw_json': str(e),
-                'message_id': f"failed-attachment-{fields.Datetime.now()}-{phone_number}"
+                'message_id': f"failed-attachment-{uuid.uuid4().hex}-{phone_number}"
             })
 
-        log_message = self.env['whatsapp.message'].create(vals)
+        log_message = self.env['whatsapp.message']._create_outbound_log(vals)
         return log_message, remote_message_id # <-- Retorna ambos
     # ======================== FIM DA CORREÇÃO DEFINITIVA DOS MÉTODOS DE ENVIO =========================
 
@@ -297,11 +495,7 @@ class WhatsappInstance(models.Model):
         if not self.env.context.get('syncing_instance'):
             _logger.info("Criando a instância '%s' na Evolution API...", vals.get('name'))
             try:
-                api_config = self.env['evolution.api.config']._get_config_record()
-                base_url = api_config.evolution_api_url
-                api_key = api_config.evolution_api_global_key
-                if not base_url or not api_key:
-                    raise UserError(_("A URL e a Chave Global da API devem ser configuradas."))
+                base_url, api_key = self._get_api_config()
 
                 # ============================ INÍCIO DO AJUSTE NO PAYLOAD ============================
                 # Alinhado com a API e o exemplo do wa_conn (chaves camelCase no nível raiz)
@@ -346,6 +540,8 @@ class WhatsappInstance(models.Model):
                 raise UserError(_(f"Falha ao criar a instância na Evolution API. Erro: {e}"))
          
         instance = super(WhatsappInstance, self).create(vals)
+        # Um webhook pode ter chegado antes da criação e deixado um "não encontrado" em cache.
+        self.env.registry.clear_cache()
         if not self.env.context.get('syncing_instance'):
             instance.action_set_webhook()
         return instance
@@ -363,6 +559,7 @@ class WhatsappInstance(models.Model):
                     _logger.error("Falha ao excluir a instância '%s' na Evolution API: %s", instance.name, e)
                     raise UserError(_("Não foi possível excluir a instância na Evolution API. A exclusão foi cancelada. Erro: %s") % e)
          
+        self.env.registry.clear_cache()
         return super(WhatsappInstance, self).unlink()
 
     def action_delete_instance(self):
@@ -390,23 +587,25 @@ class WhatsappInstance(models.Model):
 
     def _get_api_config(self):
         # Este método agora pode ser chamado em um recordset vazio ou com um registro
-        api_config = self.env['evolution.api.config']._get_config_record()
-        if not api_config or not api_config.evolution_api_url or not api_config.evolution_api_global_key:
+        api_config = self.env['evolution.api.config']._get_api_config_values()
+        if not api_config.get('evolution_api_url') or not api_config.get('evolution_api_global_key'):
             raise UserError(_("A URL e a Chave Global da API devem ser configuradas."))
-        return api_config.evolution_api_url, api_config.evolution_api_global_key
+        return api_config['evolution_api_url'], api_config['evolution_api_global_key']
 
     def _update_details_from_api(self, instance_data):
         self.ensure_one()
-        instance_details = instance_data
-        if not instance_details: return 'disconnected'
+        if not instance_data: return 'disconnected'
+        return self._apply_api_details({self.name: instance_data})[self]
 
+    def _prepare_details_from_api(self, instance_details):
+        """Converte os dados de `/instance/fetchInstances` nos valores dos campos da instância (exceto a foto)."""
         api_status = instance_details.get('connectionStatus')
         status = 'disconnected'
         if api_status == 'open':
             status = 'connected'
         elif api_status in ('connecting', 'pair_device', 'qrcode'):
             status = 'connecting'
-             
+
         owner_jid = instance_details.get('ownerJid')
         phone_number = owner_jid.split('@')[0] if owner_jid else False
         count_data = instance_details.get('_count', {})
@@ -418,23 +617,72 @@ class WhatsappInstance(models.Model):
             'contact_count': count_data.get('Contact', 0),
             'chat_count': count_data.get('Chat', 0),
             'message_count': count_data.get('Message', 0),
-            'qrcode_image': False,
         }
-         
-        profile_pic_url = instance_details.get('profilePicUrl')
-        if profile_pic_url:
-            try:
-                response = requests.get(profile_pic_url, timeout=10)
-                if response.status_code == 200:
-                    vals['profile_picture'] = base64.b64encode(response.content)
-            except Exception as e:
-                _logger.warning("Não foi possível buscar a foto do perfil para %s: %s", self.name, e)
-        else:
-            vals['profile_picture'] = False
-         
-        vals_to_write = {k: v for k, v in vals.items() if v is not None}
-        self.write(vals_to_write)
-        return status
+        return {k: v for k, v in vals.items() if v is not None}
+
+    def _apply_api_details(self, api_instances_map):
+        """
+        Atualiza as instâncias com os dados de `/instance/fetchInstances`.
+
+        As fotos de perfil cuja URL mudou são baixadas em paralelo, e cada instância
+        recebe só os campos que de fato mudaram; instâncias com a mesma alteração
+        são gravadas juntas. Evita o rastreamento, o chatter e a regravação da foto
+        quando nada mudou.
+
+        :return: dicionário {instância: status}
+        """
+        statuses = {}
+        changes = {}
+        to_download = {}
+        for instance in self:
+            instance_details = api_instances_map.get(instance.name)
+            if not instance_details:
+                statuses[instance] = 'disconnected'
+                changes[instance] = {'status': 'disconnected'}
+                continue
+            vals = instance._prepare_details_from_api(instance_details)
+            statuses[instance] = vals['status']
+            vals['qrcode_image'] = False
+            profile_pic_url = instance_details.get('profilePicUrl')
+            if not profile_pic_url:
+                vals.update({'profile_picture': False, 'profile_picture_url': False, 'profile_picture_checksum': False})
+            elif profile_pic_url != instance.profile_picture_url:
+                # Só baixa quando a URL mudou, e só regrava a imagem quando o conteúdo mudou.
+                to_download[instance] = profile_pic_url
+            changes[instance] = vals
+
+        if to_download:
+            with ThreadPoolExecutor(max_workers=min(len(to_download), _PICTURE_DOWNLOAD_WORKERS)) as executor:
+                futures = {instance: executor.submit(_download_profile_picture, url) for instance, url in to_download.items()}
+            for instance, future in futures.items():
+                content = future.result()
+                if content is None:
+                    continue
+                changes[instance]['profile_picture_url'] = to_download[instance]
+                checksum = hashlib.sha1(content).hexdigest()
+                if checksum != instance.profile_picture_checksum:
+                    changes[instance]['profile_picture'] = base64.b64encode(content)
+                    changes[instance]['profile_picture_checksum'] = checksum
+
+        groups = defaultdict(lambda: self.browse())
+        for instance, vals in changes.items():
+            diff = {}
+            for field_name, value in vals.items():
+                if field_name in ('profile_picture', 'qrcode_image'):
+                    # Binários: compara sem carregar o conteúdo (a foto nova já passou pelo checksum).
+                    if value or instance.with_context(bin_size=True)[field_name]:
+                        diff[field_name] = value
+                elif (instance[field_name] or False) != (value or False):
+                    diff[field_name] = value
+            if diff:
+                groups[tuple(sorted(diff.items()))] |= instance
+
+        for diff, instances in groups.items():
+            instances.write(dict(diff))
+        if groups:
+            _logger.info("%d instância(s) consultada(s) na API; %d com alterações.",
+                         len(self), sum(len(instances) for instances in groups.values()))
+        return statuses
 
     def action_connect_instance(self):
         self.ensure_one()
@@ -470,6 +718,8 @@ class WhatsappInstance(models.Model):
                 'profile_name': False,
                 'phone_number': False,
                 'profile_picture': False,
+                'profile_picture_url': False,
+                'profile_picture_checksum': False,
             })
         except Exception as e:
             _logger.error("Erro ao desconectar instância %s: %s", self.name, e)
@@ -494,18 +744,15 @@ class WhatsappInstance(models.Model):
             )
             api_instances_map = {inst.get('name'): inst for inst in all_instances_data if inst.get('name')}
             
-            for instance in instances_to_refresh:
-                if instance.name in api_instances_map:
-                    new_status = instance._update_details_from_api(api_instances_map[instance.name])
-                    if new_status == 'connecting':
-                        _logger.info("Instância %s está 'Conectando'. Buscando novo QR Code.", instance.name)
-                        try:
-                            instance.action_connect_instance()
-                        except Exception as e:
-                            _logger.error("Falha ao buscar novo QR Code para %s durante a atualização: %s", instance.name, e)
-                            instance.write({'status': 'error'})
-                else:
-                    instance.write({'status': 'disconnected'})
+            statuses = instances_to_refresh._apply_api_details(api_instances_map)
+            for instance, new_status in statuses.items():
+                if new_status == 'connecting':
+                    _logger.info("Instância %s está 'Conectando'. Buscando novo QR Code.", instance.name)
+                    try:
+                        instance.action_connect_instance()
+                    except Exception as e:
+                        _logger.error("Falha ao buscar novo QR Code para %s durante a atualização: %s", instance.name, e)
+                        instance.write({'status': 'error'})
 
             return {'type': 'ir.actions.client', 'tag': 'reload'}
             
@@ -513,16 +760,97 @@ class WhatsappInstance(models.Model):
             _logger.error("Falha ao atualizar status das instâncias: %s", e, exc_info=True)
             raise UserError(_("Falha ao comunicar com a API Evolution: %s") % e)
 
+    @api.model
+    def _cron_check_health(self):
+        """
+        Monitor de conexão: uma única chamada a `/instance/fetchInstances` por ciclo
+        atualiza todas as instâncias com verificação vencida. Instâncias conectadas
+        voltam a ser verificadas no intervalo normal; as demais, no intervalo curto.
+        """
+        config = self.env['evolution.api.config']._get_api_config_values()
+        interval = config['health_check_interval']
+        if not interval or not config.get('evolution_api_url') or not config.get('evolution_api_global_key'):
+            return
+        unhealthy_interval = config['health_check_unhealthy_interval'] or 1
+        now = fields.Datetime.now()
+        due_instances = self.search(['|', ('health_next_check', '=', False), ('health_next_check', '<=', now)])
+        if not due_instances:
+            return
+
+        try:
+            all_instances_data = self.env['whatsapp.evolution.api']._send_api_request_global(
+                config['evolution_api_url'], config['evolution_api_global_key'], 'GET', '/instance/fetchInstances'
+            )
+        except Exception as e:
+            # A própria Evolution está fora: tenta de novo no próximo ciclo, sem mexer nas instâncias.
+            _logger.warning("Monitor de conexão: falha ao consultar a Evolution API: %s", e)
+            return
+        api_instances_map = {inst.get('name'): inst for inst in all_instances_data if inst.get('name')}
+
+        previous_statuses = {instance: instance.status for instance in due_instances}
+        due_instances._apply_api_details(api_instances_map)
+        due_instances._handle_status_changes(previous_statuses)
+
+        healthy = due_instances.filtered(lambda i: i.status == 'connected')
+        healthy.write({'health_next_check': now + timedelta(minutes=interval)})
+        (due_instances - healthy).write({'health_next_check': now + timedelta(minutes=unhealthy_interval)})
+
+    def _handle_status_changes(self, previous_statuses):
+        """
+        Registra a mudança de status e avisa os responsáveis quando a conexão cai
+        ou é restabelecida. Usado pelo monitor e pelo webhook `connection.update`.
+        """
+        changed = self.filtered(lambda i: previous_statuses.get(i) != i.status)
+        if not changed:
+            return
+        changed.write({'status_change_date': fields.Datetime.now()})
+        for instance in changed:
+            previous_status = previous_statuses.get(instance)
+            if previous_status == 'connected':
+                instance._notify_connection_lost()
+            elif instance.status == 'connected' and previous_status:
+                instance._notify_connection_restored()
+
+    def _get_status_recipients(self):
+        self.ensure_one()
+        return self.user_id or self.env.ref('base.group_system').users
+
+    def _notify_connection_lost(self):
+        self.ensure_one()
+        _logger.warning("Instância '%s' perdeu a conexão com o WhatsApp (status: %s).", self.name, self.status)
+        status_label = dict(self._fields['status']._description_selection(self.env)).get(self.status)
+        self._get_status_recipients().partner_id._bus_send('simple_notification', {
+            'type': 'danger',
+            'sticky': True,
+            'title': _("WhatsApp Desconectado"),
+            'message': _("A instância %(name)s perdeu a conexão (status: %(status)s).", name=self.name, status=status_label),
+        })
+        activity_type = self.env.ref('whatsapp_evolution_base.mail_activity_data_whatsapp_disconnected')
+        if not self.activity_ids.filtered(lambda a: a.activity_type_id == activity_type):
+            self.sudo().activity_schedule(
+                'whatsapp_evolution_base.mail_activity_data_whatsapp_disconnected',
+                note=_("A conexão da instância com o WhatsApp caiu. Verifique o aparelho ou leia o QR Code novamente."),
+                user_id=(self.user_id or self.env.ref('base.user_admin')).id,
+            )
+
+    def _notify_connection_restored(self):
+        self.ensure_one()
+        _logger.info("Instância '%s' reconectada ao WhatsApp.", self.name)
+        self._get_status_recipients().partner_id._bus_send('simple_notification', {
+            'type': 'success',
+            'title': _("WhatsApp Reconectado"),
+            'message': _("A instância %s voltou a se conectar.", self.name),
+        })
+        self.sudo().activity_feedback(
+            ['whatsapp_evolution_base.mail_activity_data_whatsapp_disconnected'],
+            feedback=_("Conexão restabelecida."),
+        )
+
     @api.model
     def action_sync_instances(self):
         _logger.info("Iniciando sincronização de instâncias da Evolution API.")
         try:
-            api_config = self.env['evolution.api.config']._get_config_record()
-            base_url = api_config.evolution_api_url
-            api_key = api_config.evolution_api_global_key
-            if not base_url or not api_key:
-                 raise UserError(_("A URL e a Chave Global da API devem ser configuradas."))
-
+            base_url, api_key = self._get_api_config()
             api_instances_data = self.env['whatsapp.evolution.api']._send_api_request_global(
                 base_url, api_key, 'GET', '/instance/fetchInstances'
             )
@@ -544,19 +872,10 @@ class WhatsappInstance(models.Model):
             _logger.info("Excluindo %d instâncias fantasmas do Odoo: %s", len(instances_to_delete), list(names_to_delete))
             instances_to_delete.unlink()
 
-        for name in names_to_create:
-             instance_data = api_instance_map.get(name)
-             if instance_data:
-                vals = {'name': name}
-                new_instance = self.with_context(syncing_instance=True).create(vals)
-                new_instance._update_details_from_api(instance_data)
-
+        new_instances = self.with_context(syncing_instance=True).create([{'name': name} for name in names_to_create])
         instances_to_update = self.search([('name', 'in', list(names_to_update))])
-        if instances_to_update:
-            for instance in instances_to_update:
-                if instance.name in api_instance_map:
-                    instance._update_details_from_api(api_instance_map[instance.name])
-        
+        (new_instances | instances_to_update)._apply_api_details(api_instance_map)
+
         message_parts = []
         if names_to_delete:
             message_parts.append(_("%d instâncias foram excluídas.") % len(names_to_delete))
@@ -570,6 +889,9 @@ class WhatsappInstance(models.Model):
         else:
             message = " ".join(message_parts)
             
+        # Garante que o resolvedor de instâncias do webhook reflita o resultado da sincronização.
+        self.env.registry.clear_cache()
+
         _logger.info("Verificando e configurando webhooks para todas as instâncias sincronizadas...")
         all_odoo_instances = self.search([('name', 'in', list(api_instance_names))])
         all_odoo_instances.action_set_webhook()
@@ -658,9 +980,9 @@ class WhatsappInstance(models.Model):
         except Exception as e:
             _logger.error("Falha ao enviar reação para %s: %s", phone_number, e, exc_info=True)
             vals['raw_json'] = str(e)
-            vals['message_id'] = f"failed-reaction-{fields.Datetime.now()}-{phone_number}"
+            vals['message_id'] = f"failed-reaction-{uuid.uuid4().hex}-{phone_number}"
         
-        return self.env['whatsapp.message'].create(vals)
+        return self.env['whatsapp.message']._create_outbound_log(vals)
     # ====================================================================
 
     def action_sync_with_odoo_user(self):
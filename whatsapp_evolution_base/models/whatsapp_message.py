@@ -1,7 +1,10 @@
 # models/whatsapp_message.py 
 # -*- coding: utf-8 -*- 
+import psycopg2
+
 from odoo import fields, models, api
-from odoo.tools import html_escape
+from odoo.tools import mute_logger
+from odoo.tools import SQL, html_escape
 from markupsafe import Markup
 import json 
 
@@ -39,9 +42,96 @@ class WhatsappMessage(models.Model):
     state = fields.Selection([('sent', 'Sent'), ('delivered', 'Delivered'), ('read', 'Read'), ('failed', 'Failed')], string='Status', default='sent') 
     failure_reason = fields.Text(string='Failure Reason') 
     raw_json = fields.Text(string='Raw JSON', readonly=True) 
+    # Payload enxuto e comprimido (modo 'compressed'), lido apenas sob demanda.
+    payload_ids = fields.One2many('whatsapp.message.payload', 'message_id', string='Raw Payload')
+    raw_json_display = fields.Text(string='Raw JSON', compute='_compute_raw_json_display')
     _sql_constraints = [('message_id_unique', 'UNIQUE(message_id, instance_id)', 'Message ID must be unique per instance!')] 
 
-    @api.depends('media_type', 'media_url', 'media_filename', 'body', 'raw_json')
+    @api.model
+    def _create_if_not_exists(self, vals):
+        """
+        Insere o log de uma mensagem recebida pelo webhook de forma idempotente,
+        com `INSERT ... ON CONFLICT (message_id, instance_id) DO NOTHING`.
+
+        Substitui o par `search_count` + `create`: é uma única ida ao banco e não
+        há corrida entre workers (reentregas da Evolution, SEND_MESSAGE e
+        MESSAGES_UPSERT para a mesma chave). Em caso de conflito a transação não é
+        abortada; o registro existente é retornado.
+
+        Só deve ser usado com IDs vindos da Evolution: o insert direto não passa
+        pelo `create` do ORM. Os logs de envio usam `_create_outbound_log`.
+
+        :return: tupla (registro, criado)
+        """
+        self.check_access('create')
+        vals = self._add_missing_default_values(vals)
+        now = self.env.cr.now()
+        columns = [SQL.identifier(name) for name in ('create_uid', 'create_date', 'write_uid', 'write_date')]
+        values = [SQL("%s", self.env.uid), SQL("%s", now), SQL("%s", self.env.uid), SQL("%s", now)]
+        for fname, value in vals.items():
+            field = self._fields[fname]
+            if not field.store or field.type in ('one2many', 'many2many') or fname in models.MAGIC_COLUMNS:
+                continue
+            columns.append(SQL.identifier(fname))
+            values.append(SQL("%s", field.convert_to_column_insert(value, self, vals)))
+
+        self.env.cr.execute(SQL(
+            """INSERT INTO %s (%s) VALUES (%s)
+               ON CONFLICT (message_id, instance_id) DO NOTHING
+               RETURNING id""",
+            SQL.identifier(self._table), SQL(", ").join(columns), SQL(", ").join(values),
+        ))
+        row = self.env.cr.fetchone()
+        if row:
+            self.env['whatsapp.instance'].invalidate_model(['message_ids'])
+            if vals.get('state') != 'failed':
+                self.env['whatsapp.message.map']._link(vals.get('instance_id'), vals.get('message_id'), whatsapp_message_id=row[0])
+            return self.browse(row[0]), True
+
+        existing = self.search([
+            ('message_id', '=', vals.get('message_id')),
+            ('instance_id', '=', vals.get('instance_id')),
+        ], limit=1)
+        return existing, False
+
+    @api.model
+    def _create_outbound_log(self, vals):
+        """
+        Cria o log de uma mensagem enviada pelo Odoo (pelo `create` do ORM). Se o
+        webhook de SEND_MESSAGE/MESSAGES_UPSERT já registrou o mesmo ID, retorna
+        o registro existente em vez de abortar a transação.
+        """
+        if vals.get('state') == 'failed':
+            return self.create(vals)
+        try:
+            with mute_logger('odoo.sql_db'), self.env.cr.savepoint():
+                message = self.create(vals)
+        except psycopg2.errors.UniqueViolation:
+            return self.search([
+                ('message_id', '=', vals['message_id']),
+                ('instance_id', '=', vals['instance_id']),
+            ], limit=1)
+        self.env['whatsapp.message.map']._link(vals['instance_id'], vals['message_id'], whatsapp_message_id=message.id)
+        return message
+
+    @api.depends('raw_json', 'payload_ids')
+    def _compute_raw_json_display(self):
+        for message in self:
+            message.raw_json_display = message.raw_json or (message.payload_ids[:1]._get_json() if message.payload_ids else False)
+
+    def _get_document_thumbnail(self):
+        """Miniatura (base64) do documento, a partir do payload comprimido ou do JSON legado."""
+        self.ensure_one()
+        if self.payload_ids:
+            thumbnail = self.payload_ids[:1].thumbnail
+            return thumbnail.decode() if thumbnail else ''
+        try:
+            raw_data = json.loads(self.raw_json or '{}')
+            return raw_data.get('data', {}).get('message', {}).get('documentMessage', {}).get('jpegThumbnail') or ''
+        except Exception:
+            return '' # Ignora erros de parsing
+
+    @api.depends('media_type', 'media_url', 'media_filename', 'body', 'raw_json', 'payload_ids')
     def _compute_media_preview(self):
         for message in self:
             preview_html = ''
@@ -61,13 +151,8 @@ class WhatsappMessage(models.Model):
                 elif message.media_type == 'video':
                     media_player_html = f'<video src="{safe_media_url}" controls="controls" preload="metadata" class="img img-fluid border rounded" style="max-height: 450px;">Vídeo não suportado.</video>'
                 elif message.media_type == 'document':
-                    thumbnail_b64 = ''
-                    try:
-                        raw_data = json.loads(message.raw_json or '{}')
-                        thumbnail_b64 = raw_data.get('data', {}).get('message', {}).get('documentMessage', {}).get('jpegThumbnail')
-                    except Exception:
-                        thumbnail_b64 = '' # Ignora erros de parsing
-                    
+                    thumbnail_b64 = message._get_document_thumbnail()
+
                     if thumbnail_b64:
                         media_player_html = f'<img src="data:image/jpeg;base64,{thumbnail_b64}" class="img img-fluid border rounded" style="max-height: 450px;" alt="Miniatura do Documento"/>'
                     else:
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models
+from odoo.tools import SQL
+
+# Campos de vínculo que podem ser preenchidos pelo `_link`.
+_LINK_FIELDS = ('whatsapp_message_id', 'mail_message_id', 'channel_id')
+
+
+class WhatsappMessageMap(models.Model):
+    """
+    Mapa compacto do ID de uma mensagem no WhatsApp para os registros do Odoo.
+
+    Respostas, reações e citações resolvem o ID remoto aqui, com uma única busca
+    pela chave única (instância, ID no WhatsApp), em vez de procurar na
+    `mail.message` e na `whatsapp.message` de todas as instâncias.
+    """
+    _name = 'whatsapp.message.map'
+    _description = 'WhatsApp Message ID Map'
+    _rec_name = 'wa_message_id'
+
+    instance_id = fields.Many2one('whatsapp.instance', string='Instance', required=True, readonly=True, ondelete='cascade')
+    wa_message_id = fields.Char(string='WhatsApp Message ID', required=True, readonly=True)
+    whatsapp_message_id = fields.Many2one('whatsapp.message', string='Message Log', readonly=True, index='btree_not_null', ondelete='set null')
+    mail_message_id = fields.Many2one('mail.message', string='Discuss Message', readonly=True, index='btree_not_null', ondelete='set null')
+    channel_id = fields.Many2one('discuss.channel', string='Channel', readonly=True, ondelete='set null')
+
+    _sql_constraints = [('wa_message_unique', 'UNIQUE(instance_id, wa_message_id)', 'WhatsApp message IDs must be unique per instance!')]
+
+    def init(self):
+        # Preenche o mapa a partir do log existente na primeira instalação.
+        self.env.cr.execute("SELECT 1 FROM whatsapp_message_map LIMIT 1")
+        if self.env.cr.fetchone():
+            return
+        self.env.cr.execute("""
+            INSERT INTO whatsapp_message_map (instance_id, wa_message_id, whatsapp_message_id, create_date, write_date)
+                 SELECT instance_id, message_id, id, create_date, create_date
+                   FROM whatsapp_message
+                  WHERE state != 'failed'
+            ON CONFLICT (instance_id, wa_message_id) DO NOTHING
+        """)
+
+    def _get_resolver_cache(self):
+        # Cache por requisição (por cursor), compartilhado por todos os envs da transação.
+        return self.env.cr.cache.setdefault('whatsapp.message.map', {})
+
+    @api.model
+    def _resolve(self, instance_id, wa_message_id):
+        """Retorna a entrada do mapa para o ID remoto na instância (ou um recordset vazio)."""
+        if not instance_id or not wa_message_id:
+            return self.browse()
+        cache = self._get_resolver_cache()
+        key = (instance_id, wa_message_id)
+        if key not in cache:
+            entry = self.sudo().search_fetch([
+                ('instance_id', '=', instance_id),
+                ('wa_message_id', '=', wa_message_id),
+            ], _LINK_FIELDS, limit=1)
+            cache[key] = entry.id or None
+        return self.sudo().browse(cache[key] or ())
+
+    @api.model
+    def _link(self, instance_id, wa_message_id, **links):
+        """
+        Cria ou completa a entrada do ID remoto. Só os vínculos informados são
+        gravados; os já existentes são mantidos.
+        """
+        links = {fname: value for fname, value in links.items() if fname in _LINK_FIELDS and value}
+        if not instance_id or not wa_message_id:
+            return
+        now = self.env.cr.now()
+        columns = ['instance_id', 'wa_message_id', 'create_uid', 'create_date', 'write_uid', 'write_date', *links]
+        values = [instance_id, wa_message_id, self.env.uid, now, self.env.uid, now, *links.values()]
+        updates = [SQL("%s = EXCLUDED.%s", SQL.identifier(fname), SQL.identifier(fname)) for fname in links]
+        updates.append(SQL("write_date = EXCLUDED.write_date"))
+        self.env.cr.execute(SQL(
+            """INSERT INTO whatsapp_message_map (%s) VALUES %s
+               ON CONFLICT (instance_id, wa_message_id) DO UPDATE SET %s""",
+            SQL(", ").join(SQL.identifier(column) for column in columns),
+            tuple(values),
+            SQL(", ").join(updates),
+        ))
+        self._get_resolver_cache().pop((instance_id, wa_message_id), None)
+        self.invalidate_model(list(links))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import json
+import zlib
+
+from odoo import api, fields, models
+
+# Chaves do payload da Evolution que carregam conteúdo binário em base64.
+# São removidas do JSON antes de gravar, ficando apenas uma referência.
+_BINARY_PAYLOAD_KEYS = ('base64', 'jpegThumbnail', 'thumbnail', 'pngThumbnail')
+
+
+class WhatsappMessagePayload(models.Model):
+    """
+    Payload bruto de uma `whatsapp.message`, sem os blobs binários e comprimido.
+
+    Fica fora da tabela principal para que as listagens e buscas de mensagens não
+    carreguem esse conteúdo; só é lido quando alguém abre o JSON bruto ou quando
+    o preview de um documento precisa da miniatura.
+    """
+    _name = 'whatsapp.message.payload'
+    _description = 'WhatsApp Message Raw Payload'
+
+    message_id = fields.Many2one('whatsapp.message', string='Message', required=True, index=True, ondelete='cascade')
+    data = fields.Binary(string='Compressed Payload', attachment=False, readonly=True, prefetch=False)
+    thumbnail = fields.Binary(string='Thumbnail', attachment=False, readonly=True, prefetch=False)
+
+    _sql_constraints = [('message_id_unique', 'UNIQUE(message_id)', 'Only one raw payload per message!')]
+
+    @api.model
+    def _slim_payload(self, value, refs=None):
+        """
+        Retorna uma cópia do payload sem os campos binários. Cada campo removido é
+        trocado por `{"$omitted": <chave>, "size": <tamanho>}`; a primeira miniatura
+        encontrada é devolvida em `refs['thumbnail']` para ser guardada à parte.
+        """
+        if refs is None:
+            refs = {}
+        if isinstance(value, dict):
+            slim = {}
+            for key, item in value.items():
+                if key in _BINARY_PAYLOAD_KEYS and isinstance(item, str) and item:
+                    if key != 'base64' and 'thumbnail' not in refs:
+                        refs['thumbnail'] = item
+                    slim[key] = {'$omitted': key, 'size': len(item)}
+                else:
+                    slim[key] = self._slim_payload(item, refs)
+            return slim
+        if isinstance(value, list):
+            return [self._slim_payload(item, refs) for item in value]
+        return value
+
+    @api.model
+    def _store(self, message, payload):
+        refs = {}
+        slim = self._slim_payload(payload, refs)
+        return self.create({
+            'message_id': message.id,
+            'data': zlib.compress(json.dumps(slim).encode()),
+            'thumbnail': refs.get('thumbnail') or False,
+        })
+
+    def _get_json(self):
+        self.ensure_one()
+        if not self.data:
+            return ''
+        return zlib.decompress(self.data).decode()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import mimetypes
+from collections import defaultdict
+from datetime import datetime
+
+from odoo import api, fields, models
+
+from ..tools import metrics
+
+_logger = logging.getLogger(__name__)
+
+
+class WhatsappWebhookProcessor(models.AbstractModel):
+    """
+    Contém toda a lógica de interpretação dos webhooks da Evolution API.
+
+    A lógica fica em um modelo (e não no controller) para que possa ser executada
+    tanto dentro da requisição HTTP quanto pelo worker da fila de ingestão
+    (`whatsapp.webhook.queue`). Os módulos superiores (contatos, Discuss) estendem
+    este modelo via `_inherit`, da mesma forma que antes estendiam o controller.
+    """
+    _name = 'whatsapp.webhook.processor'
+    _description = 'WhatsApp Webhook Processor'
+
+    @api.model
+    def _process_payload(self, payload):
+        """Ponto de entrada: resolve a instância e despacha o evento."""
+        instance_name = payload.get('instance')
+        # O payload é público: os labels só recebem o nome da instância depois
+        # que ela é resolvida, e o evento é limitado à lista conhecida.
+        event_label = metrics.event_label(payload.get('event'))
+        with metrics.labels(instance=metrics.UNKNOWN_LABEL, event=event_label), metrics.stage('total', self.env.cr):
+            with metrics.stage('instance_lookup', self.env.cr):
+                # Resolvido a partir do cache do processo: a maioria dos eventos não executa SQL aqui.
+                instance_info = self.env['whatsapp.instance']._get_instance_info_by_name(instance_name)
+            if not instance_info:
+                _logger.warning("Webhook ignorado: Instância '%s' não encontrada.", instance_name)
+                return {'status': 'ok', 'message': f'Instance {instance_name} not found'}
+            metrics.set_labels(instance=instance_name)
+            instance = self.env['whatsapp.instance'].browse(instance_info['id'])
+            return self._process_event(instance, payload)
+
+    # --- Lotes da fila de ingestão ---
+    # O worker da fila processa os eventos de uma conversa em sequência, na mesma
+    # transação, com o contexto `whatsapp_webhook_batch`. As camadas superiores
+    # podem adiar trabalho até o fim do lote (ex.: postar uma rajada de mensagens
+    # no Discuss de uma vez) implementando os três ganchos abaixo.
+
+    @api.model
+    def _batch_mark(self):
+        """Marca o ponto do lote antes de um evento, para descartá-lo se o evento falhar."""
+        return None
+
+    @api.model
+    def _batch_discard(self, mark):
+        """Descarta o trabalho adiado desde a marca (o savepoint do evento foi desfeito)."""
+
+    @api.model
+    def _batch_flush(self):
+        """Executa o trabalho adiado pelos eventos do lote."""
+
+    @api.model
+    def _process_event(self, instance, payload):
+        """
+        Processa um evento para uma instância já resolvida.
+        Este é o método que as camadas superiores sobrescrevem.
+        """
+        event = payload.get('event')
+        if event == 'messages.upsert':
+            return self._process_messages_upsert(instance, payload)
+        if event == 'messages.update':
+            return self._process_messages_update(instance, payload)
+        if event == 'connection.update':
+            return self._process_connection_update(instance, payload)
+        return {'status': 'success', 'message': 'Webhook processed'}
+
+    @api.model
+    def _process_messages_upsert(self, instance, payload):
+        message_data = payload.get('data', {})
+        key = message_data.get('key', {})
+        message_content = message_data.get('message', {})
+
+        if not message_content or not key.get('id'):
+            return {'status': 'ok', 'message': 'Skipped, no message content or key ID'}
+
+        timestamp = message_data.get('messageTimestamp')
+        if not timestamp:
+            return {'status': 'ok', 'message': 'Skipped, no timestamp'}
+
+        WhatsappMessage = self.env['whatsapp.message']
+
+        is_group = '@g.us' in (key.get('remoteJid') or '')
+        sender_jid = key.get('participant') if is_group and not key.get('fromMe') else key.get('remoteJid')
+
+        vals = {
+            'instance_id': instance.id,
+            'message_id': key.get('id'),
+            'timestamp': datetime.fromtimestamp(int(timestamp)),
+            'message_direction': 'inbound' if not key.get('fromMe') else 'outbound',
+            'state': 'delivered' if not key.get('fromMe') else 'sent',
+            'is_group': is_group,
+            'sender_name': message_data.get('pushName') or (sender_jid.split('@')[0] if sender_jid else 'Desconhecido'),
+            'phone_number': sender_jid.split('@')[0] if sender_jid else None,
+            'body': "",
+        }
+
+        # Lógica de busca de contexto mais robusta
+        context_info = message_content.get('contextInfo') or \
+                       message_data.get('contextInfo') or \
+                       message_content.get('extendedTextMessage', {}).get('contextInfo')
+
+        if context_info:
+            quoted_msg_id_str = context_info.get('stanzaId')
+            if quoted_msg_id_str:
+                # Procura a mensagem original no nosso log
+                quoted_msg = self.env['whatsapp.message.map']._resolve(instance.id, quoted_msg_id_str).whatsapp_message_id
+                if quoted_msg:
+                    vals['quoted_message_id'] = quoted_msg.id
+
+        # Lista de prioridade para garantir que peguemos o conteúdo real, não mensagens técnicas.
+        priority_message_types = [
+            'conversation', 'extendedTextMessage', 'reactionMessage', 'imageMessage',
+            'videoMessage', 'stickerMessage', 'audioMessage', 'documentMessage'
+        ]
+        message_type_key = None
+        for msg_type in priority_message_types:
+            if msg_type in message_content:
+                message_type_key = msg_type
+                break
+
+        # Se não encontrarmos um tipo prioritário, pegamos o primeiro que não seja de contexto.
+        if not message_type_key:
+            message_type_key = next((k for k in message_content if k != 'messageContextInfo'), None)
+
+        vals['message_type'] = message_type_key
+
+        if not message_type_key:
+            _logger.warning("Não foi possível determinar um tipo de mensagem válido para o payload: %s", message_content)
+            return {'status': 'ok', 'message': 'Could not determine a valid message type'}
+
+        if message_type_key in ['conversation', 'extendedTextMessage']:
+            vals['body'] = message_content.get('conversation') or \
+                           message_content.get('extendedTextMessage', {}).get('text', '')
+        elif message_type_key == 'reactionMessage':
+            reaction = message_content.get('reactionMessage', {})
+            emoji = reaction.get('text', '')
+            vals['body'] = f"Reagiu com: {emoji}" if emoji else "Reação removida"
+            reacted_msg_id = reaction.get('key', {}).get('id')
+            if reacted_msg_id:
+                reacted_msg = self.env['whatsapp.message.map']._resolve(instance.id, reacted_msg_id).whatsapp_message_id
+                if reacted_msg:
+                    vals['reacted_message_id'] = reacted_msg.id
+        elif message_type_key in ['imageMessage', 'videoMessage', 'stickerMessage', 'audioMessage', 'documentMessage']:
+            media_map = {
+                'imageMessage': 'image', 'videoMessage': 'video', 'stickerMessage': 'sticker',
+                'audioMessage': 'audio', 'documentMessage': 'document',
+            }
+            vals['media_type'] = media_map.get(message_type_key, 'other')
+
+            media_info = message_content.get(message_type_key, {})
+
+            raw_url = message_content.get('mediaUrl') or media_info.get('url')
+            if raw_url:
+                vals['media_url'] = raw_url.split('?')[0]
+
+            vals['body'] = media_info.get('caption', '')
+            vals['media_filename'] = media_info.get('fileName') or media_info.get('title')
+
+            if not vals.get('media_filename'):
+                mimetype = media_info.get('mimetype')
+                ext = mimetypes.guess_extension(mimetype.split(';')[0]) if mimetype else ''
+                vals['media_filename'] = f"{vals['media_type']}_{key.get('id')}{ext or '.bin'}"
+        else:
+            # Ignora tipos de mensagem técnicos ou não suportados
+            _logger.info("Ignorando tipo de mensagem não processado: %s", message_type_key)
+            return {'status': 'ok', 'message': f'Skipped unsupported message type: {message_type_key}'}
+
+        if vals.get('body') is None:
+            vals['body'] = ""
+
+        # Verifica se a camada superior (contact_management) já identificou o parceiro
+        webhook_partner_id = self.env.context.get('webhook_partner_id')
+        if webhook_partner_id:
+            vals['partner_id'] = webhook_partner_id
+
+        raw_json_storage = self.env['evolution.api.config']._get_api_config_values()['raw_json_storage']
+        if raw_json_storage == 'full':
+            vals['raw_json'] = json.dumps(payload)
+
+        with metrics.stage('message_create', self.env.cr):
+            # Inserção idempotente: reentregas e eventos duplicados não abortam a transação.
+            message, created = WhatsappMessage._create_if_not_exists(vals)
+            if not created:
+                _logger.info("Webhook ignorado: Mensagem com ID '%s' já existe.", key.get('id'))
+                return {'status': 'ok', 'message': 'Message already exists', 'duplicate': True}
+
+            if raw_json_storage == 'compressed':
+                self.env['whatsapp.message.payload']._store(message, payload)
+
+        _logger.info("Mensagem de '%s' (Tipo: %s) salva com sucesso.", vals['sender_name'], message_type_key)
+        return {'status': 'success', 'message': 'Webhook processed'}
+
+    @api.model
+    def _process_messages_update(self, instance, payload):
+        updates = payload.get('data', [])
+        if isinstance(updates, dict):
+            updates = [updates]
+
+        status_map = {
+            'delivered': 'delivered', 'read': 'read',
+            'error': 'failed', 'played': 'read',
+        }
+        # Consolida a lista inteira em {keyId: novo_status}, preservando a regra
+        # de nunca rebaixar uma mensagem que já foi lida.
+        status_by_key = {}
+        for update_data in updates:
+            key_id = update_data.get('keyId')
+            status_str = (update_data.get('status') or '').lower()
+            new_status = status_map.get(status_str)
+            if key_id and new_status and status_by_key.get(key_id) != 'read':
+                status_by_key[key_id] = new_status
+
+        if status_by_key:
+            self._apply_message_status_updates(instance, status_by_key)
+        return {'status': 'success', 'message': 'Webhook processed'}
+
+    @api.model
+    def _apply_message_status_updates(self, instance, status_by_key):
+        """
+        Aplica os novos status em lote: uma única busca para todas as chaves e
+        um único `write` por status de destino, independentemente do tamanho da lista.
+        """
+        messages = self.env['whatsapp.message'].search_fetch([
+            ('instance_id', '=', instance.id),
+            ('message_id', 'in', list(status_by_key)),
+            ('state', '!=', 'read'),
+        ], ['message_id'])
+
+        ids_by_status = defaultdict(list)
+        for message in messages:
+            ids_by_status[status_by_key[message.message_id]].append(message.id)
+
+        for new_status, message_ids in ids_by_status.items():
+            self.env['whatsapp.message'].browse(message_ids).write({'state': new_status})
+            _logger.info("Status de %d mensagem(ns) atualizado para '%s'.", len(message_ids), new_status)
+
+    @api.model
+    def _process_connection_update(self, instance, payload):
+        connection_data = payload.get('data', {})
+        new_status = 'disconnected'
+        if connection_data.get('state') == 'open':
+            new_status = 'connected'
+        elif connection_data.get('state') == 'connecting':
+            new_status = 'connecting'
+        previous_statuses = {instance: instance.status}
+        vals = {'status': new_status}
+        if new_status != 'connected':
+            # Antecipa a próxima verificação do monitor de conexão.
+            vals['health_next_check'] = fields.Datetime.now()
+        instance.write(vals)
+        instance._handle_status_changes(previous_statuses)
+        return {'status': 'success', 'message': 'Webhook processed'}
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from odoo import SUPERUSER_ID, api, fields, models
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+# Tempo máximo de uma execução do cron antes de se reagendar (segundos).
+_QUEUE_RUN_BUDGET = 240
+_MAX_WORKERS = 8
+
+
+def _queue_worker(dbname, deadline, batch_size):
+    """
+    Worker da fila executado em uma thread, com cursor próprio. Reivindica uma
+    conversa por vez (advisory lock de transação) e processa seus itens em
+    ordem; o commit de cada conversa libera o lock para os outros workers.
+    """
+    threading.current_thread().dbname = dbname
+    registry = Registry(dbname)
+    processed = 0
+    while processed < batch_size and time.monotonic() < deadline:
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            items = env['whatsapp.webhook.queue']._claim_next_chat(batch_size - processed)
+            if not items:
+                return
+            processed += items._process_items()
+
+
+class WhatsappWebhookQueue(models.Model):
+    """
+    Tabela de staging para o modo de ingestão assíncrona do webhook.
+
+    O controller apenas grava o payload bruto aqui e responde imediatamente.
+    O cron `ir_cron_process_webhook_queue` drena a fila com vários workers em
+    paralelo, na ordem de chegada dentro de cada conversa, usando o
+    `whatsapp.webhook.processor`.
+    """
+    _name = 'whatsapp.webhook.queue'
+    _description = 'WhatsApp Webhook Ingestion Queue'
+    _order = 'id'
+    _rec_name = 'event'
+
+    instance_name = fields.Char(string='Instância', readonly=True)
+    event = fields.Char(string='Evento', readonly=True)
+    chat_key = fields.Char(
+        string='Conversa', readonly=True, index=True,
+        help="Chave de ordenação: itens com a mesma chave são processados estritamente em ordem."
+    )
+    payload = fields.Text(string='Payload', readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pendente'),
+        ('done', 'Processado'),
+        ('failed', 'Falhou'),
+    ], string='Status', default='pending', required=True, readonly=True, index=True)
+    attempts = fields.Integer(string='Tentativas', readonly=True)
+    next_retry_at = fields.Datetime(
+        string='Próxima Tentativa', readonly=True,
+        help="Enquanto não chegar, a conversa do item fica parada para preservar a ordem."
+    )
+    error = fields.Text(string='Erro', readonly=True)
+    processed_date = fields.Datetime(string='Processado em', readonly=True)
+
+    _MAX_ATTEMPTS = 5
+
+    @api.model
+    def _get_chat_key(self, payload):
+        """
+        Retorna a chave que define a ordem de processamento do payload.
+        Mensagens da mesma conversa compartilham a chave; eventos sem conversa
+        (ex.: connection.update) são ordenados por instância.
+        """
+        instance_name = payload.get('instance') or ''
+        data = payload.get('data')
+        if isinstance(data, list):
+            data = data[0] if data else {}
+        remote_jid = None
+        if isinstance(data, dict):
+            remote_jid = (data.get('key') or {}).get('remoteJid') or data.get('remoteJid')
+        return f"{instance_name}:{remote_jid or ''}"
+
+    @api.model
+    def _enqueue(self, payload):
+        """Grava o payload na fila e agenda o worker. Não faz nenhum outro processamento."""
+        item = self.create({
+            'instance_name': payload.get('instance'),
+            'event': payload.get('event'),
+            'chat_key': self._get_chat_key(payload),
+            'payload': json.dumps(payload),
+        })
+        self._trigger_worker()
+        return item
+
+    @api.model
+    def _trigger_worker(self):
+        """
+        Agenda o worker da fila, a não ser que já exista um gatilho vencido ainda
+        não consumido: o cron vai rodar de qualquer forma e drena todos os itens
+        pendentes. Evita uma linha em `ir_cron_trigger` (e um NOTIFY) por webhook.
+        """
+        if self.env.cr.cache.get('whatsapp.webhook.queue.triggered'):
+            return
+        cron = self.env.ref('whatsapp_evolution_base.ir_cron_process_webhook_queue')
+        self.env.cr.execute(
+            "SELECT 1 FROM ir_cron_trigger WHERE cron_id = %s AND call_at <= %s LIMIT 1",
+            [cron.id, fields.Datetime.now()],
+        )
+        if not self.env.cr.fetchone():
+            cron._trigger()
+        self.env.cr.cache['whatsapp.webhook.queue.triggered'] = True
+
+    @api.model
+    def _cron_process_queue(self):
+        """
+        Drena a fila com `webhook_queue_workers` threads em paralelo, cada uma com
+        o seu cursor. Uma conversa é reivindicada por um único worker de cada vez
+        (ver `_claim_next_chat`), então conversas diferentes avançam em paralelo e
+        a ordem dentro de cada conversa é mantida.
+        """
+        config = self.env['evolution.api.config']._get_api_config_values()
+        batch_size = config['webhook_queue_batch_size'] or 200
+        worker_count = min(max(config['webhook_queue_workers'], 1), _MAX_WORKERS)
+
+        deadline = time.monotonic() + _QUEUE_RUN_BUDGET
+        dbname = self.env.cr.dbname
+        # Os workers usam cursores próprios: libera o snapshot e os locks desta transação.
+        self.env.cr.commit()  # pylint: disable=invalid-commit
+
+        workers = [
+            threading.Thread(target=_queue_worker, args=(dbname, deadline, batch_size),
+                             name=f'whatsapp_webhook_queue_{index}', daemon=True)
+            for index in range(worker_count)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.env.invalidate_all()
+        self._schedule_next_run()
+
+    @api.model
+    def _schedule_next_run(self):
+        """
+        Reagenda o worker: imediatamente se ainda houver conversas prontas (lote
+        esgotado ou itens que chegaram durante a execução, que não criam gatilho
+        novo enquanto o atual não é consumido; ver `_trigger_worker`), senão para
+        a próxima tentativa agendada de um item com falha.
+        """
+        cron = self.env.ref('whatsapp_evolution_base.ir_cron_process_webhook_queue')
+        if self._get_ready_chat_keys(1):
+            cron._trigger()
+            return
+        self.env.cr.execute("""
+            SELECT min(next_retry_at)
+              FROM whatsapp_webhook_queue
+             WHERE state = 'pending' AND next_retry_at IS NOT NULL
+        """)
+        next_retry_at = self.env.cr.fetchone()[0]
+        if next_retry_at:
+            cron._trigger(next_retry_at)
+
+    @api.model
+    def _get_ready_chat_keys(self, limit):
+        """
+        Retorna as conversas cujo primeiro item pendente já pode ser processado
+        (sem tentativa agendada para o futuro), das mais antigas para as mais novas.
+        """
+        self.env.cr.execute("""
+            SELECT chat_key
+              FROM (
+                    SELECT DISTINCT ON (chat_key) chat_key, id, next_retry_at
+                      FROM whatsapp_webhook_queue
+                     WHERE state = 'pending'
+                  ORDER BY chat_key, id
+                   ) heads
+             WHERE next_retry_at IS NULL OR next_retry_at <= (now() at time zone 'UTC')
+          ORDER BY id
+             LIMIT %s
+        """, [limit])
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _claim_next_chat(self, limit):
+        """
+        Reivindica a conversa pronta mais antiga que nenhum outro worker esteja
+        processando e retorna até `limit` itens pendentes dela, em ordem. O lock é
+        um advisory lock de transação: é liberado no commit do worker.
+        """
+        for chat_key in self._get_ready_chat_keys(_MAX_WORKERS * 4):
+            self.env.cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", [f'whatsapp_webhook_queue:{chat_key}'])
+            if not self.env.cr.fetchone()[0]:
+                # Outro worker já está processando esta conversa.
+                continue
+            # A conversa pode ter sido concluída entre a listagem e o lock.
+            items = self.search([('chat_key', '=', chat_key), ('state', '=', 'pending')], limit=limit)
+            if items and not (items[0].next_retry_at and items[0].next_retry_at > fields.Datetime.now()):
+                return items
+        return self.browse()
+
+    def _process_items(self):
+        """
+        Processa os itens em ordem. Um item com erro para a conversa até a próxima
+        tentativa (com espera exponencial), para não inverter a ordem; depois de
+        `_MAX_ATTEMPTS` tentativas ele é marcado como falho e a conversa segue.
+        """
+        processor = self.env['whatsapp.webhook.processor'].sudo().with_context(whatsapp_webhook_batch=True)
+        processed = 0
+        for item in self:
+            mark = processor._batch_mark()
+            try:
+                with self.env.cr.savepoint():
+                    processor._process_payload(json.loads(item.payload))
+            except Exception as e:
+                processor._batch_discard(mark)
+                attempts = item.attempts + 1
+                _logger.error("Falha ao processar o item #%s da fila de webhooks (tentativa %s): %s", item.id, attempts, e, exc_info=True)
+                if attempts >= self._MAX_ATTEMPTS:
+                    item.write({'attempts': attempts, 'error': str(e), 'state': 'failed', 'next_retry_at': False})
+                    continue
+                item.write({
+                    'attempts': attempts,
+                    'error': str(e),
+                    'next_retry_at': fields.Datetime.now() + timedelta(minutes=2 ** (attempts - 1)),
+                })
+                break
+            item.write({'state': 'done', 'processed_date': fields.Datetime.now(), 'error': False, 'next_retry_at': False})
+            processed += 1
+        processor._batch_flush()
+        return processed
+
+    def action_retry(self):
+        self.write({'state': 'pending', 'attempts': 0, 'error': False, 'next_retry_at': False})
+        self.env.ref('whatsapp_evolution_base.ir_cron_process_webhook_queue')._trigger()
+
+    @api.autovacuum
+    def _gc_processed_items(self):
+        """Remove itens já processados há mais de 7 dias."""
+        limit_date = fields.Datetime.now() - timedelta(days=7)
+        self.search([('state', '=', 'done'), ('processed_date', '<', limit_date)]).unlink()
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+from . import common
+from . import test_rate_limit
+from . import test_webhook_queue
+from . import test_whatsapp_message
+from . import test_whatsapp_message_map
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import TransactionCase
+
+
+class WhatsappCase(TransactionCase):
+    """Base dos testes: uma instância criada só no Odoo, sem chamar a Evolution API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.instance = cls.env['whatsapp.instance'].with_context(syncing_instance=True).create({
+            'name': 'test_instance',
+            'api_key': 'test-key',
+        })
+        cls.other_instance = cls.env['whatsapp.instance'].with_context(syncing_instance=True).create({
+            'name': 'test_other_instance',
+            'api_key': 'test-key',
+        })
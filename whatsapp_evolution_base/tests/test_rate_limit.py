@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from ..tools import rate_limit
+
+
+def _response(status):
+    response = requests.Response()
+    response.status_code = status
+    return response
+
+
+class _Sender:
+    """Simula a Evolution: devolve (ou levanta) os resultados na ordem, contando as chamadas."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return _response(result)
+
+
+@tagged('post_install', '-at_install')
+class TestRateLimitCall(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(rate_limit.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rate_limited_response_is_always_retried(self):
+        send = _Sender(429, 200)
+        response = rate_limit.call(send, max_retries=3, idempotent=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send.calls, 2)
+
+    def test_server_error_is_retried_only_when_idempotent(self):
+        send = _Sender(503, 200)
+        response = rate_limit.call(send, max_retries=3, idempotent=False)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(send.calls, 1)
+
+        send = _Sender(503, 502, 200)
+        response = rate_limit.call(send, max_retries=3, idempotent=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send.calls, 3)
+
+    def test_read_timeout_is_retried_only_when_idempotent(self):
+        # A Evolution pode ter recebido o envio: repetir duplicaria a mensagem.
+        send = _Sender(requests.exceptions.ReadTimeout(), 200)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            rate_limit.call(send, max_retries=3, idempotent=False)
+        self.assertEqual(send.calls, 1)
+
+        send = _Sender(requests.exceptions.ReadTimeout(), 200)
+        self.assertEqual(rate_limit.call(send, max_retries=3, idempotent=True).status_code, 200)
+        self.assertEqual(send.calls, 2)
+
+    def test_connect_errors_are_always_retried(self):
+        refused = requests.exceptions.ConnectionError(NewConnectionError(None, 'Connection refused'))
+        send = _Sender(requests.exceptions.ConnectTimeout(), refused, 200)
+        response = rate_limit.call(send, max_retries=3, idempotent=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(send.calls, 3)
+
+    def test_max_retries_returns_last_response(self):
+        send = _Sender(429, 429, 429)
+        response = rate_limit.call(send, max_retries=2, idempotent=True)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(send.calls, 3)
+
+    def test_max_wait_caps_retry_delays(self):
+        send = _Sender(429, 200)
+        with patch.object(rate_limit, 'retry_delay', return_value=30.0):
+            response = rate_limit.call(send, max_retries=3, max_wait=rate_limit.INTERACTIVE_MAX_WAIT)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(send.calls, 1)
+        self.sleep.assert_not_called()
+
+    def test_max_wait_fails_fast_on_a_drained_bucket(self):
+        bucket = rate_limit.TokenBucket(rate_per_minute=1, burst=1)
+        send = _Sender(200, 200)
+        rate_limit.call(send, bucket=bucket, max_wait=rate_limit.INTERACTIVE_MAX_WAIT)
+        # A próxima ficha só sai em ~60s: a chamada não é feita e nada é consumido.
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            rate_limit.call(send, bucket=bucket, max_wait=rate_limit.INTERACTIVE_MAX_WAIT)
+        self.assertEqual(send.calls, 1)
+        self.sleep.assert_not_called()
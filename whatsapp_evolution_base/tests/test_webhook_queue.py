@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import WhatsappCase
+
+
+@tagged('post_install', '-at_install')
+class TestWebhookQueue(WhatsappCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Queue = cls.env['whatsapp.webhook.queue']
+        cls.cron = cls.env.ref('whatsapp_evolution_base.ir_cron_process_webhook_queue')
+
+    def setUp(self):
+        super().setUp()
+        # O gatilho do worker é memorizado por transação.
+        self.env.cr.cache.pop('whatsapp.webhook.queue.triggered', None)
+        self.processed = []
+        self.failing = set()
+
+        def fake_process_payload(processor, payload):
+            if payload['n'] in self.failing:
+                raise ValueError(f"payload {payload['n']} inválido")
+            self.processed.append(payload['n'])
+            return {'status': 'success'}
+
+        patcher = patch.object(self.registry['whatsapp.webhook.processor'], '_process_payload', fake_process_payload)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _enqueue(self, n, jid='5511999990000@s.whatsapp.net'):
+        return self.Queue._enqueue({
+            'instance': self.instance.name,
+            'event': 'messages.upsert',
+            'data': {'key': {'remoteJid': jid, 'id': f'ID-{n}'}},
+            'n': n,
+        })
+
+    def _triggers(self):
+        return self.env['ir.cron.trigger'].search([('cron_id', '=', self.cron.id)])
+
+    def test_chat_key_groups_by_conversation(self):
+        item_a = self._enqueue(1, jid='111@s.whatsapp.net')
+        item_b = self._enqueue(2, jid='222@s.whatsapp.net')
+        item_c = self._enqueue(3, jid='111@s.whatsapp.net')
+        self.assertEqual(item_a.chat_key, item_c.chat_key)
+        self.assertNotEqual(item_a.chat_key, item_b.chat_key)
+        self.assertEqual(json.loads(item_b.payload)['n'], 2)
+
+    def test_items_of_a_chat_are_processed_in_order(self):
+        items = self._enqueue(1) | self._enqueue(2) | self._enqueue(3)
+        claimed = self.Queue._claim_next_chat(10)
+        self.assertEqual(claimed, items)
+        self.assertEqual(claimed._process_items(), 3)
+        self.assertEqual(self.processed, [1, 2, 3])
+        self.assertEqual(set(items.mapped('state')), {'done'})
+
+    def test_failed_item_holds_its_chat_with_backoff(self):
+        items = self._enqueue(1) | self._enqueue(2) | self._enqueue(3)
+        other = self._enqueue(4, jid='5511888880000@s.whatsapp.net')
+        self.failing.add(2)
+
+        self.assertEqual(items._process_items(), 1)
+        # O item seguinte não passa na frente do que falhou.
+        self.assertEqual(self.processed, [1])
+        self.assertEqual(items.mapped('state'), ['done', 'pending', 'pending'])
+        self.assertEqual(items[1].attempts, 1)
+        self.assertGreater(items[1].next_retry_at, fields.Datetime.now())
+
+        # A conversa fica parada até a próxima tentativa; as outras continuam prontas.
+        ready = self.Queue._get_ready_chat_keys(100)
+        self.assertNotIn(items[0].chat_key, ready)
+        self.assertIn(other.chat_key, ready)
+
+        # Vencida a espera, o item é repetido e a conversa segue em ordem.
+        self.failing.clear()
+        items[1].next_retry_at = fields.Datetime.now() - timedelta(seconds=1)
+        self.assertIn(items[0].chat_key, self.Queue._get_ready_chat_keys(100))
+        self.assertEqual(items[1:]._process_items(), 2)
+        self.assertEqual(self.processed, [1, 2, 3])
+
+    def test_item_fails_for_good_after_max_attempts(self):
+        items = self._enqueue(1) | self._enqueue(2)
+        items[0].attempts = self.Queue._MAX_ATTEMPTS - 1
+        self.failing.add(1)
+        self.assertEqual(items._process_items(), 1)
+        self.assertEqual(items.mapped('state'), ['failed', 'done'])
+        self.assertFalse(items[0].next_retry_at)
+        self.assertEqual(self.processed, [2])
+
+    def test_enqueue_triggers_the_worker_once(self):
+        before = len(self._triggers())
+        self._enqueue(1)
+        self._enqueue(2)
+        self.assertEqual(len(self._triggers()), before + 1)
+
+    def test_schedule_next_run_retriggers_for_ready_chats(self):
+        self._enqueue(1)
+        before = len(self._triggers())
+        self.Queue._schedule_next_run()
+        self.assertEqual(len(self._triggers()), before + 1)
+
+    def test_schedule_next_run_waits_for_the_next_retry(self):
+        item = self._enqueue(1)
+        self.failing.add(1)
+        item._process_items()
+        if self.Queue._get_ready_chat_keys(1):
+            self.skipTest("Há outros itens prontos na fila do banco de testes.")
+        before = self._triggers()
+        self.Queue._schedule_next_run()
+        new_triggers = self._triggers() - before
+        self.assertEqual(len(new_triggers), 1)
+        self.assertEqual(new_triggers.call_at, item.next_retry_at)
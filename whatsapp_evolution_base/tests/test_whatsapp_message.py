@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import WhatsappCase
+
+
+@tagged('post_install', '-at_install')
+class TestWhatsappMessageInsert(WhatsappCase):
+
+    def _vals(self, message_id, instance=None, **extra):
+        return {
+            'instance_id': (instance or self.instance).id,
+            'message_id': message_id,
+            'timestamp': fields.Datetime.now(),
+            'message_direction': 'inbound',
+            'state': 'delivered',
+            'body': 'Olá',
+            **extra,
+        }
+
+    def test_create_if_not_exists_is_idempotent(self):
+        Message = self.env['whatsapp.message']
+        message, created = Message._create_if_not_exists(self._vals('WAID-1'))
+        self.assertTrue(created)
+        self.assertEqual(message.body, 'Olá')
+
+        # Reentrega do mesmo evento: não aborta a transação e devolve o registro existente.
+        duplicate, created = Message._create_if_not_exists(self._vals('WAID-1', body='Outro corpo'))
+        self.assertFalse(created)
+        self.assertEqual(duplicate, message)
+        self.assertEqual(Message.search_count([('message_id', '=', 'WAID-1')]), 1)
+        self.assertEqual(duplicate.body, 'Olá')
+
+        # A transação continua utilizável depois do conflito.
+        self.env.cr.execute("SELECT 1")
+
+    def test_create_if_not_exists_is_scoped_by_instance(self):
+        Message = self.env['whatsapp.message']
+        first, created = Message._create_if_not_exists(self._vals('WAID-2'))
+        self.assertTrue(created)
+        second, created = Message._create_if_not_exists(self._vals('WAID-2', instance=self.other_instance))
+        self.assertTrue(created)
+        self.assertNotEqual(first, second)
+
+    def test_create_if_not_exists_links_map(self):
+        Map = self.env['whatsapp.message.map']
+        message, _created = self.env['whatsapp.message']._create_if_not_exists(self._vals('WAID-3'))
+        self.assertEqual(Map._resolve(self.instance.id, 'WAID-3').whatsapp_message_id, message)
+
+        # Logs com falha não entram no mapa: seus IDs não vieram da Evolution.
+        self.env['whatsapp.message']._create_if_not_exists(self._vals('WAID-4', state='failed'))
+        self.assertFalse(Map._resolve(self.instance.id, 'WAID-4'))
+
+    def test_create_outbound_log_returns_existing_row(self):
+        Message = self.env['whatsapp.message']
+        inbound, _created = Message._create_if_not_exists(self._vals('WAID-5', message_direction='outbound', state='sent'))
+        outbound = Message._create_outbound_log(self._vals('WAID-5', message_direction='outbound', state='sent'))
+        self.assertEqual(outbound, inbound)
+        self.assertEqual(Message.search_count([('message_id', '=', 'WAID-5')]), 1)
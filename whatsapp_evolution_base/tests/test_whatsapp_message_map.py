@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import WhatsappCase
+
+
+@tagged('post_install', '-at_install')
+class TestWhatsappMessageMap(WhatsappCase):
+
+    def _create_log(self, message_id):
+        return self.env['whatsapp.message'].create({
+            'instance_id': self.instance.id,
+            'message_id': message_id,
+            'timestamp': fields.Datetime.now(),
+            'message_direction': 'outbound',
+        })
+
+    def test_link_upserts_a_single_row(self):
+        Map = self.env['whatsapp.message.map']
+        log = self._create_log('MAP-1')
+        Map._link(self.instance.id, 'MAP-1', whatsapp_message_id=log.id)
+        Map._link(self.instance.id, 'MAP-1', whatsapp_message_id=log.id)
+        entries = Map.search([('instance_id', '=', self.instance.id), ('wa_message_id', '=', 'MAP-1')])
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries.whatsapp_message_id, log)
+
+    def test_link_completes_without_clearing(self):
+        Map = self.env['whatsapp.message.map']
+        log = self._create_log('MAP-2')
+        Map._link(self.instance.id, 'MAP-2', whatsapp_message_id=log.id)
+        partner = self.env['res.partner'].create({'name': 'Contato do Mapa'})
+        mail_message = partner.message_post(body='Mensagem do mapa')
+
+        # Só os vínculos informados são gravados; valores vazios não apagam os existentes.
+        Map._link(self.instance.id, 'MAP-2', mail_message_id=mail_message.id, whatsapp_message_id=False)
+        entry = Map._resolve(self.instance.id, 'MAP-2')
+        self.assertEqual(entry.whatsapp_message_id, log)
+        self.assertEqual(entry.mail_message_id, mail_message)
+
+    def test_resolve_is_scoped_by_instance(self):
+        Map = self.env['whatsapp.message.map']
+        log = self._create_log('MAP-3')
+        Map._link(self.instance.id, 'MAP-3', whatsapp_message_id=log.id)
+        self.assertFalse(Map._resolve(self.other_instance.id, 'MAP-3'))
+        self.assertFalse(Map._resolve(self.instance.id, 'MAP-unknown'))
+
+    def test_resolve_sees_links_made_after_a_miss(self):
+        Map = self.env['whatsapp.message.map']
+        self.assertFalse(Map._resolve(self.instance.id, 'MAP-4'))
+        log = self._create_log('MAP-4')
+        Map._link(self.instance.id, 'MAP-4', whatsapp_message_id=log.id)
+        self.assertEqual(Map._resolve(self.instance.id, 'MAP-4').whatsapp_message_id, log)
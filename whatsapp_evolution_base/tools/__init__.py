@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from . import http_pool
+from . import metrics
+from . import rate_limit
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Sessões HTTP reutilizáveis (keep-alive) para a Evolution API.
+
+Uma `requests.Session` por processo e por URL base: as conexões TCP/TLS são
+reaproveitadas entre chamadas em vez de abertas a cada envio. A chave inclui o
+PID, então os workers do modo prefork nunca herdam os sockets do processo pai;
+no modo threaded as threads compartilham o pool do urllib3, que é thread-safe.
+
+Não acessa o banco: pode ser usado pelas threads dos workers em segundo plano.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+_lock = threading.Lock()
+_sessions = {}  # {(pid, base_url): (opções, sessão)}
+
+
+def get_session(base_url, pool_size=10, keep_alive=True):
+    key = (os.getpid(), base_url)
+    options = (pool_size, keep_alive)
+    with _lock:
+        entry = _sessions.get(key)
+        if entry and entry[0] == options:
+            return entry[1]
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        _sessions[key] = (options, session)
+    if entry:
+        # Configuração alterada: a sessão antiga é descartada.
+        entry[1].close()
+    return session
+
+
+def request(method, base_url, endpoint, pool_size=10, keep_alive=True, connect_timeout=5, read_timeout=30, **kwargs):
+    """
+    Executa a chamada pela sessão pooled da URL base, registrando a latência.
+    O endpoint é reduzido aos dois primeiros segmentos (ex.: /message/sendText)
+    para que o nome da instância não vire um label de alta cardinalidade.
+    """
+    url = f"{base_url.rstrip('/')}{endpoint}"
+    session = get_session(base_url.rstrip('/'), pool_size, keep_alive)
+    metric_endpoint = '/'.join(endpoint.split('/')[:3])
+    status = 'error'
+    start = time.perf_counter()
+    try:
+        response = session.request(method, url, timeout=(connect_timeout, read_timeout), **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        metrics.observe_api_request(time.perf_counter() - start, method, metric_endpoint, status)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas em memória do pipeline do webhook e do cliente da Evolution API.
+
+Os histogramas vivem no processo: em modo prefork cada worker tem os seus, e o
+endpoint `/whatsapp/metrics` expõe os do worker que atendeu a coleta (o label
+`pid` permite ao Prometheus distinguir e somar as séries).
+
+Os valores dos labels vêm de um conjunto fechado: cada combinação cria uma série
+permanente, então nada que venha do payload público do webhook pode virar label
+sem antes ser validado (instância resolvida, evento da lista `WEBHOOK_EVENTS`).
+
+Uso:
+
+    with metrics.labels(instance=UNKNOWN_LABEL, event=metrics.event_label(event)):
+        ...
+        metrics.set_labels(instance=instancia.name)  # após resolver a instância
+        with metrics.stage('message_create', self.env.cr):
+            ...
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites (em segundos) dos buckets dos histogramas de latência.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Limites dos buckets dos histogramas de quantidade de consultas SQL.
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_HELP = {
+    'whatsapp_webhook_stage_seconds': 'Duração de cada etapa do processamento do webhook.',
+    'whatsapp_webhook_stage_queries': 'Consultas SQL executadas em cada etapa do processamento do webhook.',
+    'whatsapp_evolution_api_request_seconds': 'Latência das chamadas HTTP à Evolution API.',
+}
+
+# Eventos enviados pela Evolution API no webhook; qualquer outro valor vira `other`.
+WEBHOOK_EVENTS = frozenset({
+    'application.startup', 'qrcode.updated', 'connection.update',
+    'messages.set', 'messages.upsert', 'messages.update', 'messages.delete', 'send.message',
+    'contacts.set', 'contacts.upsert', 'contacts.update', 'presence.update',
+    'chats.set', 'chats.upsert', 'chats.update', 'chats.delete',
+    'groups.upsert', 'group.update', 'group.participants.update', 'call',
+})
+# Valor dos labels que ainda não puderam ser validados (ex.: instância não resolvida).
+UNKNOWN_LABEL = 'unknown'
+
+_lock = threading.Lock()
+_histograms = {}  # {(nome, labels ordenados): [contagens por bucket, soma, total]}
+_local = threading.local()
+
+
+def _observe(name, buckets, value, labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(buckets), 0.0, 0, buckets]
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[0][index] += 1
+                break
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def observe_api_request(duration, method, endpoint, status):
+    """Registra a latência de uma chamada à Evolution API."""
+    _observe('whatsapp_evolution_api_request_seconds', LATENCY_BUCKETS, duration, {
+        'method': method, 'endpoint': endpoint, 'status': str(status),
+    })
+
+
+def current_labels():
+    return getattr(_local, 'labels', {})
+
+
+def event_label(event):
+    """Normaliza o nome do evento do webhook para um valor da lista fechada de labels."""
+    event = str(event or '').lower().replace('_', '.')
+    return event if event in WEBHOOK_EVENTS else 'other'
+
+
+@contextmanager
+def labels(**values):
+    """Define os labels (ex.: instância e evento) das etapas executadas dentro do bloco."""
+    previous = current_labels()
+    _local.labels = {**previous, **{key: str(value or '') for key, value in values.items()}}
+    try:
+        yield
+    finally:
+        _local.labels = previous
+
+
+def set_labels(**values):
+    """
+    Altera os labels do bloco `labels()` corrente (ex.: depois de validar a
+    instância). As etapas ainda abertas usam os novos valores ao terminar.
+    """
+    _local.labels = {**current_labels(), **{key: str(value or '') for key, value in values.items()}}
+
+
+@contextmanager
+def stage(name, cr=None):
+    """Mede a duração (e, se `cr` for informado, as consultas SQL) de uma etapa."""
+    queries = cr.sql_log_count if cr is not None else 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_labels = {**current_labels(), 'stage': name}
+        _observe('whatsapp_webhook_stage_seconds', LATENCY_BUCKETS, time.perf_counter() - start, stage_labels)
+        if cr is not None:
+            _observe('whatsapp_webhook_stage_queries', QUERY_BUCKETS, cr.sql_log_count - queries, stage_labels)
+
+
+def _format_labels(label_items, extra=()):
+    items = list(label_items) + list(extra)
+    if not items:
+        return ''
+    escaped = (
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in items
+    )
+    return '{%s}' % ','.join(escaped)
+
+
+def render():
+    """Retorna todos os histogramas no formato de texto do Prometheus."""
+    with _lock:
+        snapshot = [
+            (name, label_items, list(counts), total_sum, count, buckets)
+            for (name, label_items), (counts, total_sum, count, buckets) in _histograms.items()
+        ]
+    pid = (('pid', os.getpid()),)
+    lines = []
+    for metric in sorted({entry[0] for entry in snapshot}):
+        lines.append(f'# HELP {metric} {_HELP.get(metric, metric)}')
+        lines.append(f'# TYPE {metric} histogram')
+        for name, label_items, counts, total_sum, count, buckets in snapshot:
+            if name != metric:
+                continue
+            label_items = label_items + pid
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(label_items, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(label_items, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(label_items)} {total_sum}')
+            lines.append(f'{name}_count{_format_labels(label_items)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Limitador de taxa (token bucket) e novas tentativas com backoff para a Evolution API.
+
+Os buckets vivem no processo e são compartilhados pelas threads dele; em modo
+prefork cada worker tem os seus. Não acessa o banco: pode ser usado pelas
+threads dos workers em segundo plano.
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+_logger = logging.getLogger(__name__)
+
+# Status HTTP que indicam limitação ou indisponibilidade temporária. O 429 garante
+# que a requisição não foi processada; os 5xx só são repetidos em chamadas idempotentes.
+RATE_LIMITED_STATUS = 429
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Espera total máxima (s) das novas tentativas em chamadas feitas durante uma
+# requisição HTTP do usuário; em segundo plano vale o backoff completo.
+INTERACTIVE_MAX_WAIT = 10.0
+
+_lock = threading.Lock()
+_buckets = {}
+
+
+class RateLimitExceeded(Exception):
+    """A ficha do bucket não fica disponível dentro da espera permitida; a chamada não foi feita."""
+
+    def __init__(self, wait):
+        super().__init__("Limite de chamadas da instância atingido; nova ficha em %.1fs." % wait)
+        self.wait = wait
+
+
+class TokenBucket:
+    """`rate` fichas por minuto, acumulando no máximo `burst` fichas."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, max_wait=None):
+        """
+        Consome uma ficha, aguardando o tempo necessário. Retorna o tempo aguardado.
+
+        :param max_wait: espera máxima, em segundos; se a ficha não puder ser obtida
+            dentro dela, levanta `RateLimitExceeded` logo, sem esperar nem consumir
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            if max_wait is not None and waited + wait > max_wait:
+                raise RateLimitExceeded(wait)
+            time.sleep(wait)
+            waited += wait
+
+
+def get_bucket(key, rate_per_minute, burst):
+    """Retorna o bucket da chave, recriando-o se os limites tiverem mudado."""
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None or bucket.rate != rate_per_minute / 60.0 or bucket.burst != max(burst, 1):
+            bucket = _buckets[key] = TokenBucket(rate_per_minute, burst)
+        return bucket
+
+
+def endpoint_class(endpoint):
+    """Agrupa os endpoints da Evolution nas classes limitadas separadamente."""
+    if endpoint.startswith('/message/'):
+        return 'send'
+    if endpoint.startswith('/chat/'):
+        return 'chat'
+    return 'admin'
+
+
+def retry_delay(attempt, response=None):
+    """
+    Tempo de espera antes da próxima tentativa: o `Retry-After` da resposta, se
+    houver, ou backoff exponencial com jitter completo.
+    """
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            try:
+                retry_date = email.utils.parsedate_to_datetime(retry_after)
+                return min(max(retry_date.timestamp() - time.time(), 0.0), BACKOFF_CAP)
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def is_connect_error(error):
+    """Indica se a requisição falhou antes de ser enviada (timeout de conexão ou conexão recusada)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+def call(send, bucket=None, max_retries=3, idempotent=False, max_wait=None):
+    """
+    Executa `send()` (que retorna uma `requests.Response`) respeitando o bucket e
+    repetindo em caso de falha. A última resposta é devolvida mesmo que ainda
+    seja um erro; a última exceção de rede é propagada.
+
+    Sempre são repetidos o 429 e as falhas de conexão, em que a Evolution não
+    recebeu a requisição. Timeouts de leitura, conexões interrompidas e 5xx só
+    são repetidos com `idempotent=True`: um envio já aceito seria duplicado.
+
+    :param max_wait: soma máxima das esperas (pelo bucket e entre tentativas), em
+        segundos; se o bucket exigir mais, levanta `RateLimitExceeded` sem chamar
+    """
+    attempt = 0
+    waited = 0.0
+    while True:
+        if bucket is not None:
+            waited += bucket.acquire(max_wait - waited if max_wait is not None else None)
+        try:
+            response = send()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries or not (idempotent or is_connect_error(e)):
+                raise
+            delay = retry_delay(attempt)
+            if max_wait is not None and waited + delay > max_wait:
+                raise
+            _logger.warning("Falha de conexão com a Evolution API (%s). Nova tentativa em %.1fs.", e, delay)
+        else:
+            retryable = response.status_code == RATE_LIMITED_STATUS or (idempotent and response.status_code in RETRYABLE_STATUS)
+            if not retryable or attempt >= max_retries:
+                return response
+            delay = retry_delay(attempt, response)
+            if max_wait is not None and waited + delay > max_wait:
+                return response
+            _logger.warning("Evolution API respondeu %s. Nova tentativa em %.1fs.", response.status_code, delay)
+        time.sleep(delay)
+        waited += delay
+        attempt += 1
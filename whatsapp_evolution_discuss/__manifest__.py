@@ -17,6 +17,10 @@
     ],
     'data': [
         'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
+        'views/evolution_api_config_views.xml',
+        'views/whatsapp_outbox_views.xml',
+        'views/whatsapp_campaign_views.xml',
         'wizard/whatsapp_composer_views.xml',
         # 'data/automation.xml', # <-- LINHA REMOVIDA
     ],
@@ -29,6 +33,7 @@
             'whatsapp_evolution_discuss/static/src/core/common/thread_model_patch.js',
             'whatsapp_evolution_discuss/static/src/core/public_web/discuss_app_model_patch.js',
             'whatsapp_evolution_discuss/static/src/core/web/channel_selector_patch.js',
+            'whatsapp_evolution_discuss/static/src/core/common/burst_service.js',
         ],
     },
     'installable': True,
@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+# Não é importado pelo addon: carregado apenas sob demanda (ex.: `odoo-bin shell`).
+from .webhook_replay import run_benchmark, load_corpus, FakeEvolution
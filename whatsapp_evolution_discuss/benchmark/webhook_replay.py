@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de ingestão de webhooks.
+
+Reproduz o corpus `webhook_corpus.json` (payloads reais da Evolution API, com os
+identificadores trocados por marcadores) através de toda a cadeia do
+`whatsapp.webhook.processor` (base -> contatos -> Discuss), exatamente como o
+controller faz no modo síncrono. A Evolution é substituída por um fake em
+processo, então nenhuma requisição sai da máquina.
+
+Tudo roda dentro de um savepoint que é desfeito no final: pode ser executado em
+um banco de testes sem deixar registros. Uso, a partir do `odoo-bin shell`:
+
+    from odoo.addons.whatsapp_evolution_discuss.benchmark import run_benchmark
+    run_benchmark(env, iterations=200)
+"""
+import copy
+import json
+import logging
+import os
+import time
+import tracemalloc
+import uuid
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'webhook_corpus.json')
+
+# Ordem de replay em cada rodada: as mensagens que citam, reagem ou atualizam
+# status referenciam a mensagem de texto da mesma rodada.
+EVENT_ORDER = (
+    'text', 'extended_text', 'image', 'audio', 'document',
+    'reaction', 'messages_update', 'connection_update',
+)
+
+# PNG de 1x1 devolvido pelo fake para fotos de perfil.
+_FAKE_PICTURE = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de000'
+    '0000c49444154789c63f8ffff3f0005fe02fe0def46b80000000049454e44ae426082'
+)
+
+
+class FakeEvolution:
+    """Responde às chamadas HTTP que a cadeia do webhook faz para a Evolution."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _response(self, url, content, content_type):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers['Content-Type'] = content_type
+        response.headers['Content-Length'] = str(len(content))
+        response._content = content
+        return response
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        if '/chat/fetchProfilePictureUrl/' in url:
+            body = {'profilePictureUrl': 'http://evolution.local:8080/profile/benchmark.png'}
+        elif '/chat/whatsappNumbers/' in url:
+            numbers = (kwargs.get('json') or {}).get('numbers') or []
+            body = [{'exists': True, 'jid': f'{number}@s.whatsapp.net', 'number': number} for number in numbers]
+        else:
+            body = {'key': {'id': uuid.uuid4().hex.upper()}, 'status': 'PENDING'}
+        return self._response(url, json.dumps(body).encode(), 'application/json')
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return self._response(url, _FAKE_PICTURE, 'image/png')
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as corpus_file:
+        return json.load(corpus_file)
+
+
+def _fill(value, markers):
+    if isinstance(value, dict):
+        return {key: _fill(item, markers) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, markers) for item in value]
+    if isinstance(value, str) and value in markers:
+        return markers[value]
+    return value
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _replay_round(processor, corpus, instance, round_number, on_event):
+    """Reproduz uma rodada do corpus. `on_event(event_type, payload)` executa e mede cada evento."""
+    jid = f'55119{round_number % 100000:05d}{uuid.uuid4().int % 1000:03d}@s.whatsapp.net'
+    ref_id = None
+    for event_type in EVENT_ORDER:
+        if event_type not in corpus:
+            continue
+        msg_id = uuid.uuid4().hex[:20].upper()
+        payload = _fill(copy.deepcopy(corpus[event_type]), {
+            '$INSTANCE': instance.name,
+            '$APIKEY': instance.api_key,
+            '$JID': jid,
+            '$MSG_ID': msg_id,
+            '$REF_ID': ref_id or msg_id,
+            '$TS': int(time.time()),
+        })
+        on_event(event_type, payload)
+        if event_type == 'text':
+            ref_id = msg_id
+
+
+def run_benchmark(env, iterations=100, memory_iterations=10, corpus=None):
+    """
+    Executa o benchmark e devolve um dicionário com as métricas por tipo de evento:
+    quantidade, throughput (eventos/s), latência p50/p99 (ms), consultas SQL por
+    evento e pico de memória (KiB).
+
+    :param iterations: rodadas do corpus na passada de latência/SQL
+    :param memory_iterations: rodadas na passada de memória (com tracemalloc, que
+        distorce a latência e por isso é medido à parte)
+    """
+    corpus = corpus or load_corpus()
+    fake = FakeEvolution()
+    cr = env.cr
+    stats = {
+        event_type: {'latencies': [], 'queries': 0, 'peak_memory': 0}
+        for event_type in EVENT_ORDER if event_type in corpus
+    }
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(requests.Session, 'request', lambda session, method, url, **kwargs: fake.request(method, url, **kwargs)))
+        stack.enter_context(patch.object(requests, 'get', fake.get))
+        savepoint = cr.savepoint()
+        try:
+            instance = env['whatsapp.instance'].with_context(syncing_instance=True).create({
+                'name': f'benchmark-{uuid.uuid4().hex[:8]}',
+                'instance_type': 'company',
+                'api_key': uuid.uuid4().hex,
+            })
+            processor = env['whatsapp.webhook.processor'].sudo()
+
+            def measure_latency(event_type, payload):
+                queries = cr.sql_log_count
+                start = time.perf_counter()
+                processor._process_payload(payload)
+                env.flush_all()
+                stats[event_type]['latencies'].append(time.perf_counter() - start)
+                stats[event_type]['queries'] += cr.sql_log_count - queries
+
+            def measure_memory(event_type, payload):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                processor._process_payload(payload)
+                env.flush_all()
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                stats[event_type]['peak_memory'] = max(stats[event_type]['peak_memory'], peak)
+
+            for round_number in range(iterations):
+                _replay_round(processor, corpus, instance, round_number, measure_latency)
+
+            if memory_iterations:
+                tracemalloc.start()
+                try:
+                    for round_number in range(memory_iterations):
+                        _replay_round(processor, corpus, instance, iterations + round_number, measure_memory)
+                finally:
+                    tracemalloc.stop()
+        finally:
+            savepoint.close(rollback=True)
+            env.invalidate_all()
+            env.registry.clear_cache()
+
+    report = {}
+    for event_type, data in stats.items():
+        latencies = data['latencies']
+        total = sum(latencies)
+        report[event_type] = {
+            'count': len(latencies),
+            'throughput': len(latencies) / total if total else 0.0,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'queries_per_event': data['queries'] / len(latencies) if latencies else 0.0,
+            'peak_memory_kib': data['peak_memory'] / 1024,
+        }
+
+    lines = [f"{'evento':<18} {'n':>6} {'ev/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'SQL/ev':>8} {'pico KiB':>10}"]
+    for event_type, row in report.items():
+        lines.append(
+            f"{event_type:<18} {row['count']:>6} {row['throughput']:>9.1f} {row['p50_ms']:>9.2f} "
+            f"{row['p99_ms']:>9.2f} {row['queries_per_event']:>8.1f} {row['peak_memory_kib']:>10.1f}"
+        )
+    _logger.info("Benchmark de webhooks (%s chamadas ao fake da Evolution):\n%s", fake.calls, '\n'.join(lines))
+    return report
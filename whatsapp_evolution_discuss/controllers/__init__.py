@@ -1,2 +0,0 @@
-# -*- coding: utf-8 -*-
-from . import main
\ No newline at end of file
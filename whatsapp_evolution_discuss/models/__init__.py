@@ -2,4 +2,11 @@
 from . import discuss_channel
 from . import mail_message
 from . import res_users_settings
-from . import mail_message_reaction # <-- NOVA LINHA
\ No newline at end of file
+from . import mail_message_reaction # <-- NOVA LINHA
+from . import whatsapp_webhook_processor
+from . import ir_attachment
+from . import ir_binary
+from . import evolution_api_config
+from . import whatsapp_outbox
+from . import whatsapp_campaign
+from . import whatsapp_campaign_recipient
\ No newline at end of file
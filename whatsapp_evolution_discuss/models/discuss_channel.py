@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
-from odoo import api, fields, models, _ as odoo_t, Command
+from odoo import api, fields, models, tools, Command
 from odoo.tools import html2plaintext
-from odoo.exceptions import UserError
+from odoo.tools.lru import LRU
+from odoo.addons.mail.tools.discuss import Store
+import hashlib
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Cache do processo: (banco, parceiro, instância) -> id do canal. Só guarda canais
+# encontrados e as entradas são sempre revalidadas, então não há invalidação entre workers.
+_WHATSAPP_CHANNEL_CACHE = LRU(8192)
+
 class DiscussChannel(models.Model):
     _inherit = 'discuss.channel'
 
@@ -15,20 +21,24 @@ class DiscussChannel(models.Model):
     
     whatsapp_instance_id = fields.Many2one('whatsapp.instance', string="WhatsApp Instance", readonly=True)
     whatsapp_partner_id = fields.Many2one('res.partner', string="WhatsApp Partner", readonly=True)
+    # Membros internos para os quais o canal já foi reconciliado (ver `_get_whatsapp_members_stamp`).
+    whatsapp_members_stamp = fields.Char(readonly=True, copy=False)
 
     @api.model
     def _find_or_create_whatsapp_channel(self, partner, instance):
         """
         Encontra ou cria um canal do tipo WhatsApp para um parceiro e uma instância.
-        """
-        channel = self.search([
-            ('channel_type', '=', 'whatsapp'),
-            ('whatsapp_partner_id', '=', partner.id),
-            ('whatsapp_instance_id', '=', instance.id)
-        ], limit=1)
 
-        if channel:
-            self._add_members_to_whatsapp_channel(channel, partner, instance)
+        O canal de uma conversa existente vem do LRU do processo, e os membros só
+        são reconciliados quando o "carimbo" de membros do canal não corresponde
+        mais à instância (responsável ou administradores alterados): no caso comum
+        custa no máximo uma consulta.
+        """
+        channel_id = self._get_whatsapp_channel_id(partner.id, instance.id)
+        if channel_id:
+            channel = self.browse(channel_id)
+            if channel.whatsapp_members_stamp != self._get_whatsapp_members_stamp(instance):
+                self._add_members_to_whatsapp_channel(channel, partner, instance)
             return channel
 
         channel = self.create({
@@ -37,49 +47,98 @@ class DiscussChannel(models.Model):
             'whatsapp_partner_id': partner.id,
             'whatsapp_instance_id': instance.id,
         })
-        
+
         self._add_members_to_whatsapp_channel(channel, partner, instance)
         _logger.info("Criado novo canal de WhatsApp #%s para o parceiro '%s' (ID: %s)", channel.id, partner.name, partner.id)
         return channel
-    
+
+    @api.model
+    def _get_whatsapp_channel_id(self, partner_id, instance_id):
+        """
+        Resolve (parceiro, instância) -> ID do canal. Um acerto no LRU é
+        revalidado pela chave primária, na mesma consulta que carrega o carimbo de
+        membros; "não encontrado" nunca é guardado, então criar ou excluir canais
+        não exige limpar caches.
+        """
+        domain = [
+            ('channel_type', '=', 'whatsapp'),
+            ('whatsapp_partner_id', '=', partner_id),
+            ('whatsapp_instance_id', '=', instance_id),
+        ]
+        cache_key = (self.env.cr.dbname, partner_id, instance_id)
+        channel_id = _WHATSAPP_CHANNEL_CACHE.get(cache_key)
+        if channel_id:
+            channel = self.sudo().search_fetch([('id', '=', channel_id)] + domain, ['whatsapp_members_stamp'])
+            if channel:
+                return channel.id
+        channel = self.sudo().search_fetch(domain, ['whatsapp_members_stamp'], limit=1)
+        if not channel:
+            return None
+        _WHATSAPP_CHANNEL_CACHE[cache_key] = channel.id
+        return channel.id
+
+    @api.model
+    @tools.ormcache()
+    def _get_whatsapp_admin_partner_ids(self):
+        """
+        Parceiros dos administradores, membros dos canais de instâncias da empresa
+        sem responsável. Alterar os grupos de um usuário limpa os caches do registro.
+        """
+        admin_group = self.env.ref('base.group_system', raise_if_not_found=False)
+        if not admin_group:
+            return ()
+        admin_users = self.env['res.users'].sudo().search([('groups_id', 'in', admin_group.id)])
+        return tuple(sorted(admin_users.partner_id.ids))
+
+    @api.model
+    def _get_whatsapp_members_stamp(self, instance):
+        """Identifica o conjunto de membros internos esperado para os canais da instância."""
+        if instance.user_id:
+            return f"user:{instance.user_id.id}"
+        if instance.instance_type == 'company':
+            admin_ids = ','.join(map(str, self._get_whatsapp_admin_partner_ids()))
+            return f"admins:{hashlib.sha1(admin_ids.encode()).hexdigest()[:16]}"
+        return "none"
+
     def _add_members_to_whatsapp_channel(self, channel, partner, instance):
         """
         Adiciona os membros corretos ao canal e o afixa para novos membros.
         """
-        members_to_add = {partner}
+        members_to_add = {partner.id}
         if instance.user_id:
-            members_to_add.add(instance.user_id.partner_id)
-         
+            members_to_add.add(instance.user_id.partner_id.id)
+
         if instance.instance_type == 'company' and not instance.user_id:
-            admin_group = self.env.ref('base.group_system', raise_if_not_found=False)
-            if admin_group:
-                admin_users = self.env['res.users'].search([('groups_id', 'in', admin_group.id)])
-                for user in admin_users:
-                    members_to_add.add(user.partner_id)
+            members_to_add.update(self._get_whatsapp_admin_partner_ids())
 
         current_member_ids = channel.channel_member_ids.mapped('partner_id').ids
         # Filtra apenas os parceiros que ainda não são membros do canal.
-        new_partners = [p for p in members_to_add if p.id not in current_member_ids]
-
-        if new_partners:
-            commands = []
-            for p in new_partners:
-                # Para usuários internos, afixa o canal na criação. O contato externo não precisa disso.
-                is_internal = p.id != partner.id
-                commands.append(Command.create({'partner_id': p.id, 'is_pinned': is_internal}))
-            
-            channel.write({
-                'channel_member_ids': commands
-            })
+        new_partner_ids = [partner_id for partner_id in members_to_add if partner_id not in current_member_ids]
+
+        vals = {'whatsapp_members_stamp': self._get_whatsapp_members_stamp(instance)}
+        if new_partner_ids:
+            # Para usuários internos, afixa o canal na criação. O contato externo não precisa disso.
+            vals['channel_member_ids'] = [
+                Command.create({'partner_id': partner_id, 'is_pinned': partner_id != partner.id})
+                for partner_id in new_partner_ids
+            ]
+        channel.write(vals)
 
     # ============================ INÍCIO DA CORREÇÃO (REAL-TIME E ENVIO) ============================
     def _notify_thread(self, message, msg_vals=False, **kwargs):
+        # Mensagens intermediárias de uma rajada do webhook: a interface as recebe
+        # de uma vez em `_whatsapp_send_burst` e a última da rajada notifica normalmente.
+        if self.env.context.get('whatsapp_burst_silent'):
+            return True
+
         # PRIMEIRO, CHAMA A LÓGICA ORIGINAL DO ODOO PARA TODOS OS CANAIS.
         # Isso garante que a notificação via bus.bus seja enviada para a interface,
         # resolvendo o problema de não atualização em tempo real.
         super(DiscussChannel, self)._notify_thread(message, msg_vals, **kwargs)
 
-        # AGORA, EXECUTA A LÓGICA DE ENVIO PARA O WHATSAPP APENAS NOS CANAIS RELEVANTES.
+        # AGORA, ENFILEIRA O ENVIO PARA O WHATSAPP APENAS NOS CANAIS RELEVANTES.
+        # O envio em si acontece depois do commit (whatsapp.outbox), para que postar
+        # no Discuss não dependa da latência da Evolution API.
         whatsapp_channels = self.filtered(lambda c: c.channel_type == 'whatsapp')
 
         for channel in whatsapp_channels:
@@ -97,78 +156,23 @@ class DiscussChannel(models.Model):
                 message.sudo().write({'whatsapp_status': 'failed'})
                 continue
 
-            try:
-                # Obtém o número formatado usando o método já existente no módulo de contato
-                number_to_send = partner._get_whatsapp_formatted_number()
-                
-                # Extrai texto e anexos dos valores da mensagem
-                body = html2plaintext(msg_vals.get('body', ''))
-                # Em vez de usar os `msg_vals` (que contêm comandos), pegamos os anexos 
-                # diretamente do registro `message` que já foi criado e processado. 
-                attachments = message.attachment_ids
-
-                # ======================= INÍCIO DA ALTERAÇÃO (RESPOSTAS) ======================= 
-                # Verifica se a mensagem é uma resposta a outra 
-                quoted_message = None 
-                if msg_vals.get('parent_id'): 
-                    quoted_message = self.env['mail.message'].browse(msg_vals['parent_id']) 
-                # ======================== FIM DA ALTERAÇÃO (RESPOSTAS) ========================= 
-                
-                # ======================= INÍCIO DA CORREÇÃO =======================
-                remote_message_id = None
-                log_message = None # <-- Variável para capturar o log
-
-                if attachments:
-                    first_attachment = attachments[0]
-                    # ======================= INÍCIO DA CORREÇÃO ======================= 
-                    # Passa o 'quoted_message' também para o send_attachment 
-                    log_message, remote_message_id = channel.whatsapp_instance_id.send_attachment( 
-                        number_to_send, first_attachment, caption=body, partner=partner, quoted_message=quoted_message 
-                    ) 
-                    # ======================== FIM DA CORREÇÃO =========================                     # Envia anexos subsequentes sem esperar por IDs
-                    for attachment in attachments[1:]:
-                        channel.whatsapp_instance_id.send_attachment(
-                            number_to_send, attachment, partner=partner
-                        )
-                elif body:
-                    # ======================= INÍCIO DA CORREÇÃO =======================
-                    # Capturamos o log retornado por send_text
-                    log_message, remote_message_id = channel.whatsapp_instance_id.send_text(
-                        number_to_send, body, partner=partner, quoted_message=quoted_message
-                    )
-                    # ======================== FIM DA CORREÇÃO =========================
-
-                # Atualiza a mensagem do Odoo com o ID retornado pela API
-                if remote_message_id:
-                    message.sudo().write({
-                        'whatsapp_status': 'sent',
-                        'whatsapp_message_id_str': remote_message_id
-                    })
-                    
-                    # ======================= INÍCIO DA CORREÇÃO =======================
-                    # Agora, se foi uma resposta, atualizamos o log que acabamos de criar.
-                    if quoted_message and log_message:
-                        # Precisamos encontrar o log da mensagem original
-                        original_log = self.env['whatsapp.message'].search([
-                            ('message_id', '=', quoted_message.whatsapp_message_id_str)
-                        ], limit=1)
-                        if original_log:
-                            log_message.sudo().write({'quoted_message_id': original_log.id})
-                    # ======================== FIM DA CORREÇÃO =========================
-
-                    _logger.info("Mensagem do canal #%s enviada para o WhatsApp com ID: %s.", channel.id, remote_message_id)
-                else:
-                    # Se remote_message_id for None, significa que o envio falhou na camada inferior
-                    raise UserError(odoo_t("A API não retornou um ID de mensagem para a mensagem enviada."))
-
-                # ======================== FIM DA CORREÇÃO ========================= 
-
-            except Exception as e:
-                _logger.error("Falha ao enviar mensagem do canal #%s para o WhatsApp: %s", channel.id, e, exc_info=True)
-                message.sudo().write({'whatsapp_status': 'failed'})
+            if not message.attachment_ids and not html2plaintext(message.body or '').strip():
+                continue
+
+            self.env['whatsapp.outbox'].sudo()._enqueue(message.sudo(), channel)
          
         return True 
     
+    def _whatsapp_send_burst(self, messages):
+        """Envia à interface, em uma única notificação do bus, as mensagens postadas em silêncio."""
+        self.ensure_one()
+        if not messages:
+            return
+        self._bus_send(
+            'whatsapp_evolution_discuss.burst',
+            {'id': self.id, 'data': Store(messages).get_result()},
+        )
+
     def _whatsapp_send_reaction(self, reaction):
         """
         Envia uma reação para o WhatsApp. Agora só é chamado na criação.
@@ -195,9 +199,9 @@ class DiscussChannel(models.Model):
                 "reaction": reaction.content
             }
 
-            reacted_message_log = self.env['whatsapp.message'].search([
-                ('message_id', '=', original_message.whatsapp_message_id_str)
-            ], limit=1)
+            reacted_message_log = self.env['whatsapp.message.map']._resolve(
+                self.whatsapp_instance_id.id, original_message.whatsapp_message_id_str
+            ).whatsapp_message_id
 
             self.whatsapp_instance_id.send_reaction(
                 number_to_send,
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+
+class EvolutionApiConfig(models.Model):
+    _inherit = 'evolution.api.config'
+
+    # --- Download de mídias recebidas ---
+    media_fetch_concurrency = fields.Integer(
+        string="Downloads Simultâneos", default=4,
+        help="Número máximo de mídias baixadas em paralelo pelo fetcher em segundo plano."
+    )
+    media_fetch_max_size_mb = fields.Integer(
+        string="Tamanho Máximo da Mídia (MB)", default=64,
+        help="Mídias maiores que este limite não são baixadas. Use 0 para não limitar."
+    )
+    media_fetch_timeout = fields.Integer(
+        string="Timeout do Download (s)", default=20,
+    )
+    media_fetch_max_attempts = fields.Integer(
+        string="Tentativas de Download", default=3,
+        help="Número de tentativas, com backoff exponencial, antes de marcar a mídia como falha."
+    )
+    media_storage_mode = fields.Selection([
+        ('eager', 'Baixar ao receber'),
+        ('lazy', 'Baixar ao abrir'),
+    ], string="Armazenamento de Mídias", default='eager', required=True,
+        help="No modo 'Baixar ao abrir', o webhook guarda apenas os metadados e a referência da mídia; "
+             "o arquivo é baixado da Evolution na primeira vez em que o anexo é aberto."
+    )
+    media_eviction_days = fields.Integer(
+        string="Liberar Mídias Não Acessadas (dias)", default=0,
+        help="Remove do filestore as mídias recebidas que não foram abertas neste período. "
+             "Elas continuam nas conversas e são baixadas de novo se forem abertas. Use 0 para desativar."
+    )
+
+    # --- Rajadas de mensagens no Discuss ---
+    discuss_burst_window = fields.Integer(
+        string="Janela de Agrupamento de Rajadas (s)", default=5,
+        help="Só vale no modo de processamento 'Fila assíncrona'. Mensagens da mesma conversa processadas "
+             "juntas pelo worker da fila, com até este intervalo entre uma e outra, chegam à interface em uma "
+             "única notificação, e só a última gera alerta e contador de não lidas. No modo síncrono cada "
+             "mensagem é notificada na hora. Use 0 para desativar."
+    )
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+
+from odoo import api, fields, models
+from odoo.tools.mimetypes import guess_mimetype
+
+_logger = logging.getLogger(__name__)
+
+# Tamanho de cada fatia do texto base64 decodificada por vez (múltiplo de 4).
+_BASE64_CHUNK_SIZE = 64 * 1024 * 4
+# Tipos gravados direto no filestore. Os demais passam pelo `create` normal, que
+# redimensiona imagens e indexa o conteúdo de documentos e textos.
+_STREAMED_MIMETYPE_PREFIXES = ('audio/', 'video/')
+# Anexos liberados por execução do cron de limpeza.
+_EVICTION_BATCH_SIZE = 500
+# Intervalo mínimo entre duas atualizações da data de acesso de uma mídia.
+_ACCESS_DATE_PRECISION = timedelta(days=1)
+
+
+def _iter_base64_chunks(b64_content, start=0):
+    """
+    Decodifica o texto base64 a partir de `start` em fatias de `_BASE64_CHUNK_SIZE`,
+    sem copiar o texto inteiro. Os espaços e quebras de linha (base64 MIME) são
+    removidos em cada fatia, e os caracteres que sobram além do múltiplo de 4
+    passam para a próxima, para que cada fatia decodifique sozinha.
+    """
+    leftover = ''
+    for offset in range(start, len(b64_content), _BASE64_CHUNK_SIZE):
+        piece = leftover + re.sub(r'\s+', '', b64_content[offset:offset + _BASE64_CHUNK_SIZE])
+        aligned = len(piece) - len(piece) % 4
+        leftover = piece[aligned:]
+        if aligned:
+            yield base64.b64decode(piece[:aligned])
+    if leftover:
+        # Base64 truncado: levanta o mesmo `binascii.Error` da decodificação inteira.
+        yield base64.b64decode(leftover)
+
+
+def _download_media(url, max_bytes, timeout, max_attempts):
+    """
+    Baixa uma mídia com limite de tamanho e novas tentativas (backoff exponencial).
+    Executada nas threads do pool: não acessa o banco nem o ambiente do Odoo.
+
+    :return: tupla (conteúdo ou None, mensagem de erro ou None)
+    """
+    error = None
+    for attempt in range(max(max_attempts, 1)):
+        if attempt:
+            time.sleep(2 ** (attempt - 1))
+        try:
+            with requests.get(url, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                content_length = int(response.headers.get('Content-Length') or 0)
+                if max_bytes and content_length > max_bytes:
+                    return None, f"Mídia maior que o limite ({content_length} > {max_bytes} bytes)"
+                chunks = []
+                size = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        return None, f"Mídia maior que o limite ({max_bytes} bytes)"
+                    chunks.append(chunk)
+                return b''.join(chunks), None
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+            _logger.warning("Falha ao baixar mídia de %s (tentativa %s/%s): %s", url, attempt + 1, max_attempts, e)
+    return None, error
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    whatsapp_media_url = fields.Char(string="WhatsApp Media URL", readonly=True)
+    whatsapp_media_state = fields.Selection([
+        ('lazy', 'Sob demanda'),
+        ('pending', 'Aguardando download'),
+        ('done', 'Disponível'),
+        ('failed', 'Falhou'),
+    ], string="WhatsApp Media Status", readonly=True, index='btree_not_null')
+    whatsapp_media_error = fields.Char(string="WhatsApp Media Error", readonly=True)
+    # Referência para baixar a mídia de novo pela Evolution (getBase64FromMediaMessage).
+    whatsapp_media_instance_id = fields.Many2one('whatsapp.instance', string="WhatsApp Media Instance", readonly=True, ondelete='set null')
+    whatsapp_media_key = fields.Char(string="WhatsApp Media Message Key", readonly=True)
+    whatsapp_media_access_date = fields.Datetime(string="WhatsApp Media Last Access", readonly=True)
+
+    @api.model
+    def _whatsapp_reference_vals(self, media_url=None, instance=None, message_key=None):
+        return {
+            'whatsapp_media_url': media_url or False,
+            'whatsapp_media_instance_id': instance.id if instance else False,
+            'whatsapp_media_key': json.dumps(message_key) if message_key else False,
+        }
+
+    @api.model
+    def _whatsapp_create_placeholder(self, name, mimetype, media_url, instance=None, message_key=None):
+        """
+        Cria um anexo vazio que será preenchido em segundo plano pelo fetcher de mídia.
+        Permite postar a mensagem no Discuss sem esperar o download.
+        """
+        attachment = self.create({
+            'name': name,
+            'mimetype': mimetype or 'application/octet-stream',
+            'res_model': 'mail.compose.message',
+            'res_id': 0,
+            'whatsapp_media_state': 'pending',
+            **self._whatsapp_reference_vals(media_url, instance, message_key),
+        })
+        self.env.ref('whatsapp_evolution_discuss.ir_cron_fetch_whatsapp_media')._trigger()
+        return attachment
+
+    @api.model
+    def _whatsapp_create_lazy(self, name, mimetype, media_url=None, instance=None, message_key=None):
+        """
+        Cria um anexo só com os metadados e a referência da mídia. O conteúdo é
+        baixado no primeiro acesso (ver `ir.binary._record_to_stream`).
+        """
+        return self.create({
+            'name': name,
+            'mimetype': mimetype or 'application/octet-stream',
+            'res_model': 'mail.compose.message',
+            'res_id': 0,
+            'whatsapp_media_state': 'lazy',
+            **self._whatsapp_reference_vals(media_url, instance, message_key),
+        })
+
+    @api.model
+    def _whatsapp_create_from_base64(self, name, b64_content, mimetype=None):
+        """
+        Cria um anexo a partir do base64 recebido no webhook. Áudios e vídeos
+        (as mídias grandes) não são materializados inteiros em memória: o texto é
+        decodificado em fatias e gravado direto no filestore, calculando o
+        checksum e o tamanho no caminho, o que evita as cópias decodificada e
+        recodificada que `datas` exigiria. Para esses tipos o `_postprocess_contents`
+        não faz nada e a indexação guarda só o tipo, então o `index_content` é
+        preenchido aqui com o mesmo `_index` do `create`.
+        """
+        # Pula o prefixo "data:<tipo>;base64," sem copiar o texto.
+        start = b64_content.index(',') + 1 if b64_content.startswith('data:') else 0
+        if not mimetype:
+            mimetype = guess_mimetype(next(_iter_base64_chunks(b64_content[:start + _BASE64_CHUNK_SIZE], start), b''))
+
+        vals = {
+            'name': name,
+            'res_model': 'mail.compose.message',
+            'res_id': 0,
+        }
+        if self._storage() != 'file' or not mimetype.startswith(_STREAMED_MIMETYPE_PREFIXES):
+            # Sem filestore para onde transmitir, ou tipo que precisa do fluxo completo do `create`.
+            vals['raw'] = b''.join(_iter_base64_chunks(b64_content, start))
+            vals['mimetype'] = mimetype
+            return self.create(vals)
+
+        sha = hashlib.sha1()
+        file_size = 0
+        tmp_dir = self._full_path('tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in _iter_base64_chunks(b64_content, start):
+                    sha.update(chunk)
+                    file_size += len(chunk)
+                    tmp_file.write(chunk)
+
+            checksum = sha.hexdigest()
+            fname = checksum[:2] + '/' + checksum
+            full_path = self._full_path(fname)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if os.path.isfile(full_path):
+                # Conteúdo idêntico já está no filestore (endereçado por sha1).
+                os.unlink(tmp_path)
+            else:
+                os.replace(tmp_path, full_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        # Se a transação for desfeita, o arquivo órfão é removido pelo GC do filestore.
+        self._mark_for_gc(fname)
+
+        vals.update({
+            'store_fname': fname,
+            'checksum': checksum,
+            'file_size': file_size,
+            'mimetype': mimetype,
+            'index_content': self._index(b'', mimetype, checksum),
+        })
+        return self.create(vals)
+
+    @api.model
+    def _cron_fetch_whatsapp_media(self):
+        """
+        Baixa as mídias pendentes com um pool de threads limitado pela configuração.
+        As threads só fazem o download; a gravação dos anexos e a notificação do
+        canal acontecem na thread do cron, que é a dona do cursor.
+        """
+        config = self.env['evolution.api.config']._get_api_config_values()
+        concurrency = max(config['media_fetch_concurrency'] or 1, 1)
+        max_bytes = (config['media_fetch_max_size_mb'] or 0) * 1024 * 1024
+        timeout = config['media_fetch_timeout'] or 20
+        max_attempts = config['media_fetch_max_attempts'] or 1
+        batch_size = concurrency * 4
+
+        self.env.cr.execute("""
+            SELECT id
+              FROM ir_attachment
+             WHERE whatsapp_media_state = 'pending'
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [batch_size])
+        attachments = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not attachments:
+            return
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                attachment: executor.submit(_download_media, attachment.whatsapp_media_url, max_bytes, timeout, max_attempts)
+                for attachment in attachments
+            }
+
+        for attachment, future in futures.items():
+            content, error = future.result()
+            if content is None:
+                _logger.error("Não foi possível baixar a mídia do anexo #%s: %s", attachment.id, error)
+                attachment.write({'whatsapp_media_state': 'failed', 'whatsapp_media_error': error})
+                continue
+            attachment.write({
+                'raw': content,
+                'mimetype': attachment.mimetype,
+                'whatsapp_media_state': 'done',
+                'whatsapp_media_error': False,
+                'whatsapp_media_access_date': fields.Datetime.now(),
+            })
+
+        attachments._whatsapp_notify_channels()
+
+        if len(attachments) == batch_size:
+            self.env.ref('whatsapp_evolution_discuss.ir_cron_fetch_whatsapp_media')._trigger()
+
+    def _whatsapp_notify_channels(self):
+        """Envia o anexo atualizado pelo bus para os membros dos canais do WhatsApp."""
+        channel_attachments = self.filtered(lambda a: a.res_model == 'discuss.channel' and a.res_id)
+        for channel_id in set(channel_attachments.mapped('res_id')):
+            channel = self.env['discuss.channel'].browse(channel_id)
+            channel._bus_send_store(channel_attachments.filtered(lambda a: a.res_id == channel_id))
+
+    # --- Mídias sob demanda ---
+
+    def _whatsapp_fetch_media(self):
+        """
+        Baixa o conteúdo da mídia pela referência guardada: primeiro a `mediaUrl`
+        (quando a Evolution grava as mídias em um storage), depois o
+        getBase64FromMediaMessage da instância.
+
+        :return: tupla (conteúdo ou None, mimetype, mensagem de erro ou None)
+        """
+        self.ensure_one()
+        config = self.env['evolution.api.config']._get_api_config_values()
+        max_bytes = (config['media_fetch_max_size_mb'] or 0) * 1024 * 1024
+        error = None
+        if self.whatsapp_media_url:
+            content, error = _download_media(self.whatsapp_media_url, max_bytes, config['media_fetch_timeout'] or 20, 1)
+            if content is not None:
+                return content, self.mimetype, None
+        if self.whatsapp_media_instance_id and self.whatsapp_media_key:
+            try:
+                response = self.env['whatsapp.evolution.api']._api_get_base64_from_media_message(
+                    self.whatsapp_media_instance_id, json.loads(self.whatsapp_media_key)
+                )
+            except Exception as e:
+                return None, None, str(e)
+            if response.get('base64'):
+                content = base64.b64decode(response['base64'])
+                if max_bytes and len(content) > max_bytes:
+                    return None, None, f"Mídia maior que o limite ({max_bytes} bytes)"
+                mimetype = self.mimetype
+                if not mimetype or mimetype == 'application/octet-stream':
+                    mimetype = response.get('mimetype') or guess_mimetype(content)
+                return content, mimetype, None
+            error = "A Evolution API não retornou o conteúdo da mídia."
+        return None, None, error or "A mídia não tem referência para download."
+
+    def _whatsapp_materialize(self):
+        """
+        Baixa a mídia de um anexo sob demanda e a grava no filestore. A gravação
+        usa um cursor próprio: as rotas de conteúdo podem rodar em um cursor
+        somente leitura, e a mídia fica salva mesmo se a requisição falhar depois.
+
+        :return: tupla (conteúdo, mimetype) ou None se o download falhou
+        """
+        self.ensure_one()
+        # O cursor atual não enxerga a gravação feita no cursor próprio: guarda o
+        # resultado para não baixar de novo a cada leitura na mesma transação.
+        materialized = self.env.cr.cache.setdefault('whatsapp.media.materialized', {})
+        if self.id in materialized:
+            return materialized[self.id]
+        content, mimetype, error = self._whatsapp_fetch_media()
+        now = fields.Datetime.now()
+        with self.env.registry.cursor() as cr:
+            # Se outra requisição já materializou o anexo, só devolve o conteúdo baixado.
+            cr.execute("""
+                SELECT id
+                  FROM ir_attachment
+                 WHERE id = %s AND whatsapp_media_state = 'lazy'
+                   FOR UPDATE SKIP LOCKED
+            """, [self.id])
+            if cr.fetchone():
+                attachment = self.with_env(self.env(cr=cr, su=True))
+                if content is None:
+                    attachment.write({'whatsapp_media_error': error})
+                else:
+                    attachment.write({
+                        'raw': content,
+                        'mimetype': mimetype,
+                        'whatsapp_media_state': 'done',
+                        'whatsapp_media_error': False,
+                        'whatsapp_media_access_date': now,
+                    })
+        if content is None:
+            _logger.warning("Não foi possível baixar a mídia sob demanda do anexo #%s: %s", self.id, error)
+            return None
+        materialized[self.id] = (content, mimetype)
+        return content, mimetype
+
+    def _compute_raw(self):
+        # Leituras pelo ORM (`raw`/`datas`, ex.: reenviar um anexo recebido) também
+        # materializam as mídias sob demanda, não só as rotas de conteúdo.
+        lazy_attachments = self.browse()
+        if not self.env.context.get('bin_size'):
+            lazy_attachments = self.filtered(lambda attachment: attachment.whatsapp_media_state == 'lazy')
+        for attachment in lazy_attachments:
+            result = attachment.sudo()._whatsapp_materialize()
+            attachment.raw = result[0] if result else False
+        super(IrAttachment, self - lazy_attachments)._compute_raw()
+
+    def _whatsapp_touch(self):
+        """Registra o acesso à mídia (no máximo uma vez por dia), para o cron de limpeza."""
+        self.ensure_one()
+        now = fields.Datetime.now()
+        if self.whatsapp_media_access_date and self.whatsapp_media_access_date > now - _ACCESS_DATE_PRECISION:
+            return
+        with self.env.registry.cursor() as cr:
+            cr.execute("""
+                UPDATE ir_attachment
+                   SET whatsapp_media_access_date = %s
+                 WHERE id = %s
+            """, [now, self.id])
+
+    @api.model
+    def _cron_evict_whatsapp_media(self):
+        """
+        Libera do filestore as mídias recebidas que não são abertas há mais que o
+        prazo configurado. Os anexos voltam para o estado 'Sob demanda' e são
+        baixados de novo no próximo acesso.
+        """
+        config = self.env['evolution.api.config']._get_api_config_values()
+        days = config['media_eviction_days']
+        if days <= 0:
+            return
+        self.env.cr.execute("""
+            SELECT id
+              FROM ir_attachment
+             WHERE whatsapp_media_state = 'done'
+               AND (whatsapp_media_url IS NOT NULL OR whatsapp_media_key IS NOT NULL)
+               AND COALESCE(whatsapp_media_access_date, write_date) < %s
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [fields.Datetime.now() - timedelta(days=days), _EVICTION_BATCH_SIZE])
+        attachments = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not attachments:
+            return
+        # Um `write` por mimetype: sem conteúdo, o mimetype seria recalculado.
+        for mimetype, group in attachments.grouped('mimetype').items():
+            group.write({'raw': False, 'mimetype': mimetype, 'whatsapp_media_state': 'lazy'})
+        _logger.info("%s mídias do WhatsApp não acessadas foram liberadas do filestore.", len(attachments))
+        # Libera os locks do lote antes de reagendar.
+        self.env.cr.commit()  # pylint: disable=invalid-commit
+
+        if len(attachments) == _EVICTION_BATCH_SIZE:
+            self.env.ref('whatsapp_evolution_discuss.ir_cron_evict_whatsapp_media')._trigger()
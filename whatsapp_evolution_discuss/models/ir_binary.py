@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+from odoo import models
+from odoo.http import Stream
+
+
+class IrBinary(models.AbstractModel):
+    _inherit = 'ir.binary'
+
+    def _record_to_stream(self, record, field_name):
+        """
+        Materializa as mídias do WhatsApp guardadas só como referência no primeiro
+        acesso (/web/content, /web/image), e registra o acesso às já baixadas.
+        As leituras pelo ORM materializam em `ir.attachment._compute_raw`.
+        """
+        if record._name == 'ir.attachment' and field_name in ('raw', 'datas', 'db_datas') and record.whatsapp_media_state:
+            attachment = record.sudo()
+            if attachment.whatsapp_media_state == 'lazy':
+                result = attachment._whatsapp_materialize()
+                if result:
+                    # O cursor da requisição não enxerga a gravação: transmite o conteúdo baixado.
+                    content, mimetype = result
+                    return Stream(
+                        type='data',
+                        data=content,
+                        mimetype=mimetype,
+                        download_name=attachment.name,
+                        etag=hashlib.sha1(content).hexdigest(),
+                        last_modified=attachment.write_date,
+                        size=len(content),
+                    )
+            elif attachment.whatsapp_media_state == 'done':
+                attachment._whatsapp_touch()
+        return super()._record_to_stream(record, field_name)
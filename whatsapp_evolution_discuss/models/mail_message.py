@@ -5,7 +5,10 @@ class MailMessage(models.Model):
     _inherit = 'mail.message'
 
     whatsapp_status = fields.Selection([
+        ('queued', 'Queued'),
         ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('read', 'Read'),
         ('failed', 'Failed')
     ], string="WhatsApp Status", copy=False)
     
@@ -17,3 +20,23 @@ class MailMessage(models.Model):
         help="O ID da mensagem no sistema do WhatsApp. Usado para rastrear respostas e reações."
     )
     # ======================== FIM DA ALTERAÇÃO =========================
+
+    def init(self):
+        super().init()
+        # Completa o mapa de IDs do WhatsApp com as mensagens do Discuss já existentes.
+        self.env.cr.execute("SELECT 1 FROM whatsapp_message_map WHERE mail_message_id IS NOT NULL LIMIT 1")
+        if self.env.cr.fetchone():
+            return
+        self.env.cr.execute("""
+            INSERT INTO whatsapp_message_map (instance_id, wa_message_id, mail_message_id, channel_id, create_date, write_date)
+                 SELECT DISTINCT ON (c.whatsapp_instance_id, m.whatsapp_message_id_str)
+                        c.whatsapp_instance_id, m.whatsapp_message_id_str, m.id, c.id, m.create_date, m.create_date
+                   FROM mail_message m
+                   JOIN discuss_channel c ON m.model = 'discuss.channel' AND m.res_id = c.id
+                  WHERE m.whatsapp_message_id_str IS NOT NULL
+                    AND c.whatsapp_instance_id IS NOT NULL
+               ORDER BY c.whatsapp_instance_id, m.whatsapp_message_id_str, m.id
+            ON CONFLICT (instance_id, wa_message_id) DO UPDATE
+                    SET mail_message_id = EXCLUDED.mail_message_id,
+                        channel_id = EXCLUDED.channel_id
+        """)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from ast import literal_eval
+
+from odoo import SUPERUSER_ID, _ as odoo_t, api, fields, models
+from odoo.exceptions import UserError
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+# Tempo máximo de uma execução do cron antes de se reagendar (segundos).
+_CAMPAIGN_RUN_BUDGET = 240
+_MAX_WORKERS = 8
+
+
+def _campaign_worker(dbname, deadline):
+    """
+    Worker de envio executado em uma thread, com cursor próprio. Reivindica um
+    destinatário por vez (SKIP LOCKED) e confirma cada envio isoladamente, então
+    vários workers podem trabalhar nas mesmas campanhas sem conflito.
+    """
+    threading.current_thread().dbname = dbname
+    registry = Registry(dbname)
+    while time.monotonic() < deadline:
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            recipient = env['whatsapp.campaign.recipient']._claim_next()
+            if not recipient:
+                return
+            recipient._send()
+
+
+class WhatsappCampaign(models.Model):
+    """
+    Campanha de envio em massa, construída sobre o composer do WhatsApp: o
+    mesmo corpo e anexos são enviados para todos os contatos do domínio, em
+    segundo plano, respeitando os limites de envio da instância.
+    """
+    _name = 'whatsapp.campaign'
+    _description = 'WhatsApp Broadcast Campaign'
+    _order = 'id desc'
+
+    name = fields.Char(string='Nome', required=True)
+    instance_id = fields.Many2one(
+        'whatsapp.instance', string='Enviar De', required=True,
+        domain="[('status', '=', 'connected')]"
+    )
+    partner_domain = fields.Char(string='Destinatários', default='[]', required=True)
+    body = fields.Text(string='Mensagem')
+    attachment_ids = fields.Many2many('ir.attachment', string='Anexos')
+    worker_count = fields.Integer(
+        string='Workers em Paralelo', default=2,
+        help="Quantidade de threads de envio. A taxa efetiva continua limitada pelos limites de envio da instância."
+    )
+    state = fields.Selection([
+        ('draft', 'Rascunho'),
+        ('running', 'Enviando'),
+        ('paused', 'Pausada'),
+        ('done', 'Concluída'),
+        ('cancel', 'Cancelada'),
+    ], string='Status', default='draft', required=True, readonly=True, index=True)
+    start_date = fields.Datetime(string='Iniciada em', readonly=True)
+    end_date = fields.Datetime(string='Concluída em', readonly=True)
+    recipient_ids = fields.One2many('whatsapp.campaign.recipient', 'campaign_id', string='Destinatários')
+
+    total_count = fields.Integer(string='Total', compute='_compute_progress')
+    pending_count = fields.Integer(string='Pendentes', compute='_compute_progress')
+    sent_count = fields.Integer(string='Enviadas', compute='_compute_progress')
+    failed_count = fields.Integer(string='Falhas', compute='_compute_progress')
+    progress = fields.Float(string='Progresso', compute='_compute_progress')
+    throughput = fields.Float(string='Mensagens por Minuto', compute='_compute_progress')
+
+    def _compute_progress(self):
+        counts = {
+            (campaign.id, state): count
+            for campaign, state, count in self.env['whatsapp.campaign.recipient']._read_group(
+                [('campaign_id', 'in', self.ids)], ['campaign_id', 'state'], ['__count'],
+            )
+        }
+        now = fields.Datetime.now()
+        for campaign in self:
+            campaign.pending_count = counts.get((campaign.id, 'pending'), 0)
+            campaign.sent_count = counts.get((campaign.id, 'sent'), 0)
+            campaign.failed_count = counts.get((campaign.id, 'failed'), 0)
+            campaign.total_count = campaign.pending_count + campaign.sent_count + campaign.failed_count
+            processed = campaign.sent_count + campaign.failed_count
+            campaign.progress = 100.0 * processed / campaign.total_count if campaign.total_count else 0.0
+            elapsed = ((campaign.end_date or now) - campaign.start_date).total_seconds() if campaign.start_date else 0
+            campaign.throughput = campaign.sent_count * 60.0 / elapsed if elapsed > 0 else 0.0
+
+    def _trigger_workers(self):
+        self.env.ref('whatsapp_evolution_discuss.ir_cron_process_whatsapp_campaigns')._trigger()
+
+    def action_start(self):
+        for campaign in self:
+            if campaign.state != 'draft':
+                continue
+            if not campaign.body and not campaign.attachment_ids:
+                raise UserError(odoo_t("Informe uma mensagem ou adicione um anexo."))
+            domain = literal_eval(campaign.partner_domain or '[]') + [('mobile', '!=', False)]
+            partners = self.env['res.partner'].search(domain)
+            if not partners:
+                raise UserError(odoo_t("Nenhum contato com celular corresponde aos destinatários da campanha."))
+            self.env['whatsapp.campaign.recipient'].sudo().create([
+                {'campaign_id': campaign.id, 'partner_id': partner.id} for partner in partners
+            ])
+            campaign.write({'state': 'running', 'start_date': fields.Datetime.now()})
+        self._trigger_workers()
+
+    def action_pause(self):
+        self.filtered(lambda c: c.state == 'running').write({'state': 'paused'})
+
+    def action_resume(self):
+        self.filtered(lambda c: c.state == 'paused').write({'state': 'running'})
+        self._trigger_workers()
+
+    def action_cancel(self):
+        self.filtered(lambda c: c.state in ('draft', 'running', 'paused')).write({
+            'state': 'cancel', 'end_date': fields.Datetime.now(),
+        })
+
+    @api.model
+    def _cron_process_campaigns(self):
+        """
+        Dispara os workers de envio das campanhas em andamento e aguarda o fim
+        deles. Reagenda a si mesmo se ainda houver destinatários pendentes.
+        """
+        running = self.search([('state', '=', 'running')])
+        if not running:
+            return
+        worker_count = min(max(running.mapped('worker_count') + [1]), _MAX_WORKERS)
+        deadline = time.monotonic() + _CAMPAIGN_RUN_BUDGET
+        dbname = self.env.cr.dbname
+        # Os workers usam cursores próprios: libera o snapshot e os locks desta transação.
+        self.env.cr.commit()  # pylint: disable=invalid-commit
+
+        workers = [
+            threading.Thread(target=_campaign_worker, args=(dbname, deadline), name=f'whatsapp_campaign_{index}', daemon=True)
+            for index in range(worker_count)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.env.invalidate_all()
+        for campaign in running.exists().filtered(lambda c: c.state == 'running'):
+            if not campaign.pending_count:
+                campaign.write({'state': 'done', 'end_date': fields.Datetime.now()})
+                _logger.info("Campanha #%s concluída: %s enviadas, %s falhas.", campaign.id, campaign.sent_count, campaign.failed_count)
+        if self.search_count([('state', '=', 'running')]):
+            self._trigger_workers()
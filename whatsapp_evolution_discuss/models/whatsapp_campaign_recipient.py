@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class WhatsappCampaignRecipient(models.Model):
+    _name = 'whatsapp.campaign.recipient'
+    _description = 'WhatsApp Campaign Recipient'
+    _order = 'id'
+    _rec_name = 'partner_id'
+
+    campaign_id = fields.Many2one('whatsapp.campaign', string='Campanha', required=True, index=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', string='Contato', required=True, ondelete='cascade')
+    state = fields.Selection([
+        ('pending', 'Pendente'),
+        ('sent', 'Enviada'),
+        ('failed', 'Falhou'),
+    ], string='Status', default='pending', required=True, readonly=True)
+    whatsapp_message_id = fields.Many2one('whatsapp.message', string='Log da Mensagem', readonly=True, ondelete='set null')
+    error = fields.Char(string='Erro', readonly=True)
+    sent_date = fields.Datetime(string='Enviada em', readonly=True)
+
+    def init(self):
+        # Os workers buscam sempre "próximo pendente da campanha".
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_campaign_recipient_pending_idx
+                ON whatsapp_campaign_recipient (campaign_id, id)
+             WHERE state = 'pending'
+        """)
+
+    @api.model
+    def _claim_next(self):
+        """Reivindica o próximo destinatário pendente de uma campanha em andamento."""
+        self.env.cr.execute("""
+            SELECT r.id
+              FROM whatsapp_campaign_recipient r
+              JOIN whatsapp_campaign c ON c.id = r.campaign_id
+             WHERE r.state = 'pending'
+               AND c.state = 'running'
+          ORDER BY r.id
+             LIMIT 1
+               FOR UPDATE OF r SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self
+
+    def _send(self):
+        """Envia a mensagem da campanha para o destinatário e registra o resultado."""
+        self.ensure_one()
+        campaign = self.campaign_id
+        instance = campaign.instance_id
+        partner = self.partner_id
+        log_message = self.env['whatsapp.message']
+        remote_message_id = None
+        try:
+            phone_number = partner._get_whatsapp_formatted_number()
+            if campaign.attachment_ids:
+                log_message, remote_message_id = instance.send_attachment(
+                    phone_number, campaign.attachment_ids[0], caption=campaign.body or '', partner=partner
+                )
+                for attachment in campaign.attachment_ids[1:]:
+                    instance.send_attachment(phone_number, attachment, partner=partner)
+            else:
+                log_message, remote_message_id = instance.send_text(phone_number, campaign.body, partner=partner)
+        except Exception as e:
+            _logger.warning("Campanha #%s: falha ao enviar para %s: %s", campaign.id, partner.name, e)
+            self.write({'state': 'failed', 'error': str(e)})
+            return
+        self.write({
+            'state': 'sent' if remote_message_id else 'failed',
+            'whatsapp_message_id': log_message.id,
+            'error': False if remote_message_id else log_message.raw_json,
+            'sent_date': fields.Datetime.now(),
+        })
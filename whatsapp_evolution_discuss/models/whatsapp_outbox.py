@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import timedelta
+
+from odoo import _ as odoo_t, api, fields, models
+from odoo.exceptions import UserError
+from odoo.tools import html2plaintext
+
+_logger = logging.getLogger(__name__)
+
+
+class WhatsappOutbox(models.Model):
+    """
+    Outbox transacional dos envios feitos pelo Discuss.
+
+    O `_notify_thread` do canal apenas grava a mensagem aqui, na mesma transação
+    do `message_post`; o cron `ir_cron_dispatch_whatsapp_outbox` faz o envio para
+    a Evolution depois do commit, com novas tentativas, e avisa a interface pelo bus.
+    """
+    _name = 'whatsapp.outbox'
+    _description = 'WhatsApp Outbound Queue'
+    _order = 'id'
+    _rec_name = 'message_id'
+
+    message_id = fields.Many2one('mail.message', string='Mensagem', required=True, readonly=True, ondelete='cascade')
+    channel_id = fields.Many2one('discuss.channel', string='Canal', required=True, readonly=True, index=True, ondelete='cascade')
+    state = fields.Selection([
+        ('pending', 'Pendente'),
+        ('done', 'Enviado'),
+        ('failed', 'Falhou'),
+    ], string='Status', default='pending', required=True, readonly=True, index=True)
+    attempts = fields.Integer(string='Tentativas', readonly=True)
+    next_attempt_date = fields.Datetime(string='Próxima Tentativa', default=fields.Datetime.now, readonly=True)
+    error = fields.Text(string='Erro', readonly=True)
+    sent_date = fields.Datetime(string='Enviado em', readonly=True)
+
+    _MAX_ATTEMPTS = 5
+    _BATCH_SIZE = 50
+
+    def _trigger_dispatch(self, at=None):
+        self.env.ref('whatsapp_evolution_discuss.ir_cron_dispatch_whatsapp_outbox')._trigger(at)
+
+    @api.model
+    def _enqueue(self, message, channel):
+        """Registra o envio. Só acontece de fato depois do commit, pelo cron."""
+        item = self.create({'message_id': message.id, 'channel_id': channel.id})
+        message.write({'whatsapp_status': 'queued'})
+        self._trigger_dispatch()
+        return item
+
+    @api.model
+    def _cron_dispatch(self):
+        """
+        Envia os itens pendentes. Dentro de um canal a ordem é mantida: um item só
+        é elegível se não houver outro pendente mais antigo no mesmo canal.
+        """
+        self.env.cr.execute("""
+            SELECT o.id
+              FROM whatsapp_outbox o
+             WHERE o.state = 'pending'
+               AND o.next_attempt_date <= (now() at time zone 'UTC')
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM whatsapp_outbox prev
+                     WHERE prev.channel_id = o.channel_id
+                       AND prev.state = 'pending'
+                       AND prev.id < o.id
+               )
+          ORDER BY o.id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [self._BATCH_SIZE])
+        items = self.browse([row[0] for row in self.env.cr.fetchall()])
+
+        for item in items:
+            item._dispatch()
+            # Libera o lock do item e torna o status visível para a interface.
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+        if len(items) == self._BATCH_SIZE:
+            self._trigger_dispatch()
+
+    def _dispatch(self):
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                remote_message_id = self._send()
+        except Exception as e:
+            attempts = self.attempts + 1
+            _logger.error("Falha ao enviar a mensagem #%s do canal #%s para o WhatsApp (tentativa %s): %s",
+                          self.message_id.id, self.channel_id.id, attempts, e, exc_info=True)
+            if attempts >= self._MAX_ATTEMPTS:
+                self.write({'state': 'failed', 'attempts': attempts, 'error': str(e)})
+                self._notify_status('failed')
+            else:
+                next_attempt = fields.Datetime.now() + timedelta(minutes=2 ** (attempts - 1))
+                self.write({'attempts': attempts, 'error': str(e), 'next_attempt_date': next_attempt})
+                self._trigger_dispatch(next_attempt)
+            return
+
+        self.write({'state': 'done', 'sent_date': fields.Datetime.now(), 'error': False})
+        self._notify_status('sent', remote_message_id)
+        _logger.info("Mensagem do canal #%s enviada para o WhatsApp com ID: %s.", self.channel_id.id, remote_message_id)
+
+    def _send(self):
+        """Envia a mensagem para a Evolution. Retorna o ID remoto ou levanta uma exceção."""
+        message = self.message_id
+        channel = self.channel_id
+        partner = channel.whatsapp_partner_id
+        instance = channel.whatsapp_instance_id
+
+        # Obtém o número formatado usando o método já existente no módulo de contato
+        number_to_send = partner._get_whatsapp_formatted_number()
+        body = html2plaintext(message.body or '')
+        attachments = message.attachment_ids
+        quoted_message = message.parent_id
+
+        if attachments:
+            log_message, remote_message_id = instance.send_attachment(
+                number_to_send, attachments[0], caption=body, partner=partner, quoted_message=quoted_message
+            )
+            # Envia anexos subsequentes sem esperar por IDs
+            for attachment in attachments[1:]:
+                instance.send_attachment(number_to_send, attachment, partner=partner)
+        else:
+            log_message, remote_message_id = instance.send_text(
+                number_to_send, body, partner=partner, quoted_message=quoted_message
+            )
+
+        if not remote_message_id:
+            # Se remote_message_id for None, significa que o envio falhou na camada inferior
+            raise UserError(odoo_t("A API não retornou um ID de mensagem para a mensagem enviada."))
+
+        message.write({'whatsapp_status': 'sent', 'whatsapp_message_id_str': remote_message_id})
+        self.env['whatsapp.message.map']._link(
+            instance.id, remote_message_id, mail_message_id=message.id, channel_id=channel.id
+        )
+        return remote_message_id
+
+    def _notify_status(self, status, remote_message_id=None):
+        """Atualiza o status do envio na interface de quem está com o canal aberto."""
+        values = {'whatsapp_status': status}
+        if status == 'failed':
+            self.message_id.write(values)
+        if remote_message_id:
+            values['whatsapp_message_id_str'] = remote_message_id
+        self.channel_id._bus_send_store(self.message_id, values)
+
+    def action_retry(self):
+        self.write({'state': 'pending', 'attempts': 0, 'error': False, 'next_attempt_date': fields.Datetime.now()})
+        self.message_id.write({'whatsapp_status': 'queued'})
+        self._trigger_dispatch()
+
+    @api.autovacuum
+    def _gc_sent_items(self):
+        """Remove itens já enviados há mais de 7 dias."""
+        limit_date = fields.Datetime.now() - timedelta(days=7)
+        self.search([('state', '=', 'done'), ('sent_date', '<', limit_date)]).unlink()
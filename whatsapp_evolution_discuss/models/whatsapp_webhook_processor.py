@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+import logging
+import binascii
+import mimetypes # <- Importa o módulo padrão do Python, não o do Odoo
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from odoo import api, models
+from odoo.addons.whatsapp_evolution_base.tools import metrics
+
+_logger = logging.getLogger(__name__)
+
+class WhatsappWebhookProcessor(models.AbstractModel):
+    _inherit = 'whatsapp.webhook.processor'
+
+    @api.model
+    def _apply_message_status_updates(self, instance, status_by_key):
+        """
+        Replica os novos status na mail.message vinculada, também em lote
+        (um `write` por status) e sem rebaixar mensagens já lidas.
+        """
+        super()._apply_message_status_updates(instance, status_by_key)
+
+        # Resolve pelo mapa de IDs da instância: o mesmo ID pode existir em outra instância.
+        map_entries = self.env['whatsapp.message.map'].sudo().search_fetch([
+            ('instance_id', '=', instance.id),
+            ('wa_message_id', 'in', list(status_by_key)),
+            ('mail_message_id', '!=', False),
+        ], ['wa_message_id', 'mail_message_id'])
+        key_by_mail_message_id = {entry.mail_message_id.id: entry.wa_message_id for entry in map_entries}
+        mail_messages = self.env['mail.message'].search_fetch([
+            ('id', 'in', list(key_by_mail_message_id)),
+            ('whatsapp_status', '!=', 'read'),
+        ], ['id'])
+
+        ids_by_status = defaultdict(list)
+        for mail_message in mail_messages:
+            ids_by_status[status_by_key[key_by_mail_message_id[mail_message.id]]].append(mail_message.id)
+
+        for new_status, message_ids in ids_by_status.items():
+            self.env['mail.message'].browse(message_ids).write({'whatsapp_status': new_status})
+
+    @api.model
+    def _post_message_in_discuss_channel(self, instance, message_data, partner):
+        """
+        CORRIGIDO: Separa a criação da mensagem da atualização com campos customizados.
+        """
+        if not partner:
+            return
+
+        try:
+            with metrics.stage('channel_find_or_create', self.env.cr):
+                channel = self.env['discuss.channel'].sudo()._find_or_create_whatsapp_channel(partner, instance)
+            message_content = message_data.get('message', {})
+            is_from_me = message_data.get('key', {}).get('fromMe', False)
+            message_id_str = message_data.get('key', {}).get('id')
+            
+            if 'reactionMessage' in message_content:
+                # A interface precisa receber a mensagem reagida antes da reação.
+                self._batch_flush()
+                reaction = message_content['reactionMessage']
+                original_msg_id = reaction.get('key', {}).get('id')
+                emoji = reaction.get('text', '')
+                 
+                original_message = self.env['whatsapp.message.map']._resolve(instance.id, original_msg_id).mail_message_id
+
+                if original_message:
+                    author_partner = partner if not is_from_me else (instance.user_id.partner_id if instance.user_id else self.env['res.partner'])
+                    if author_partner:
+                        self._apply_inbound_reaction(original_message, author_partner, emoji)
+                return
+            
+            with metrics.stage('attachment_create', self.env.cr):
+                body, attachment_ids = self._extract_message_content_and_attachments(
+                    message_content, instance=instance, message_key=message_data.get('key')
+                )
+            
+            author_id = False
+            if is_from_me:
+                author_id = instance.user_id.partner_id.id if instance.user_id and instance.user_id.partner_id else False
+            else:
+                author_id = partner.id
+            
+            if not author_id:
+                _logger.error("Não foi possível determinar um autor válido para a mensagem do webhook.")
+                return
+
+            if not body and not attachment_ids:
+                _logger.info("Webhook ignorado para o Discuss: mensagem sem conteúdo processável.")
+                return
+
+            # ======================= INÍCIO DA CORREÇÃO DE RESPOSTA =======================
+            post_vals = {
+                'body': body,
+                'author_id': author_id,
+                'message_type': 'comment',
+                'subtype_xmlid': 'mail.mt_comment',
+                'attachment_ids': attachment_ids,
+            }
+            
+            # Lógica de busca de contexto mais robusta
+            context_info = message_content.get('contextInfo') or \
+                           message_data.get('contextInfo') or \
+                           message_content.get('extendedTextMessage', {}).get('contextInfo')
+
+            if context_info:
+                quoted_msg_id = context_info.get('stanzaId')
+                if quoted_msg_id:
+                    # Busca a mensagem original no Discuss pelo mapa de IDs do WhatsApp
+                    parent_message = self.env['whatsapp.message.map']._resolve(instance.id, quoted_msg_id).mail_message_id
+                    if parent_message:
+                        post_vals['parent_id'] = parent_message.id
+            
+            # Preserva o horário original da mensagem no WhatsApp.
+            timestamp = message_data.get('messageTimestamp')
+            if timestamp:
+                post_vals['date'] = datetime.fromtimestamp(int(timestamp), timezone.utc).replace(tzinfo=None)
+
+            ctx = {'from_webhook': True}
+            # Só no modo fila: a mensagem é gravada agora, mas notificada no fim do lote (`_batch_flush`).
+            coalesce = self.env.context.get('whatsapp_webhook_batch') and \
+                self.env['evolution.api.config']._get_api_config_values()['discuss_burst_window'] > 0
+            if coalesce:
+                ctx['whatsapp_burst_silent'] = True
+
+            with metrics.stage('message_post', self.env.cr):
+                new_message = channel.with_context(**ctx).message_post(**post_vals)
+
+            if new_message and message_id_str:
+                new_message.sudo().write({
+                    'whatsapp_message_id_str': message_id_str
+                })
+                self.env['whatsapp.message.map']._link(
+                    instance.id, message_id_str, mail_message_id=new_message.id, channel_id=channel.id
+                )
+            if coalesce:
+                self._get_burst_buffer().append((channel.id, new_message.id))
+
+            _logger.info("Mensagem do webhook (ID: %s) postada no canal #%s e atualizada.", message_id_str, channel.id)
+            # ======================== FIM DA CORREÇÃO DE RESPOSTA =========================
+
+        except Exception as e:
+            if self.env.context.get('whatsapp_webhook_batch'):
+                # Na fila, o item é marcado com falha e processado de novo, sem perder a mensagem.
+                raise
+            _logger.error("Falha ao postar mensagem do webhook no canal do Discuss: %s", e, exc_info=True)
+
+    # --- Rajadas de mensagens ---
+    # Só no modo fila (`webhook_processing_mode = 'queue'`): no síncrono cada
+    # webhook é uma transação e a mensagem é notificada na hora. Na fila, cada
+    # mensagem é postada em silêncio dentro do savepoint do seu item (uma falha
+    # desfaz e repete só aquele item). O buffer guarda (canal, mensagem) das
+    # mensagens gravadas, e o fim do lote as notifica agrupadas em rajadas pela
+    # janela `discuss_burst_window`.
+
+    def _get_burst_buffer(self):
+        return self.env.cr.cache.setdefault('whatsapp.discuss.burst', [])
+
+    @api.model
+    def _batch_mark(self):
+        return len(self._get_burst_buffer())
+
+    @api.model
+    def _batch_discard(self, mark):
+        del self._get_burst_buffer()[mark:]
+
+    @api.model
+    def _batch_flush(self):
+        """
+        Notifica as mensagens gravadas no lote, por canal e na ordem de chegada.
+        Mensagens com até `discuss_burst_window` segundos entre uma e outra (pelo
+        horário original do WhatsApp) formam uma rajada: as anteriores vão à
+        interface em uma única notificação; só a última passa pelo fluxo completo
+        (bus, contadores de não lidas, push).
+        """
+        buffer = self._get_burst_buffer()
+        if not buffer:
+            return
+        message_ids_by_channel = defaultdict(list)
+        for channel_id, message_id in buffer:
+            message_ids_by_channel[channel_id].append(message_id)
+        buffer.clear()
+        window = timedelta(seconds=self.env['evolution.api.config']._get_api_config_values()['discuss_burst_window'])
+        for channel_id, message_ids in message_ids_by_channel.items():
+            channel = self.env['discuss.channel'].sudo().browse(channel_id)
+            bursts = []
+            previous = None
+            for message in self.env['mail.message'].sudo().browse(message_ids):
+                if previous is None or message.date - previous.date > window:
+                    bursts.append(message)
+                else:
+                    bursts[-1] |= message
+                previous = message
+            try:
+                # As mensagens já estão gravadas: uma falha aqui perde só a notificação em tempo real.
+                with self.env.cr.savepoint():
+                    for messages in bursts:
+                        channel._whatsapp_send_burst(messages[:-1])
+                        channel.with_context(from_webhook=True)._notify_thread(messages[-1])
+            except Exception as e:
+                _logger.error("Falha ao notificar a rajada de mensagens do canal #%s: %s", channel_id, e, exc_info=True)
+
+    @api.model
+    def _apply_inbound_reaction(self, message, partner, emoji):
+        """
+        Aplica a reação recebida com um único comando SQL: no WhatsApp cada pessoa
+        tem no máximo uma reação por mensagem, então as outras reações do parceiro
+        são removidas e a nova é inserida (emoji vazio = remoção). Depois, só os
+        grupos de reação alterados são enviados pelo bus aos membros do canal.
+
+        O insert direto também evita o `create` da reação, que a reenviaria ao WhatsApp.
+        """
+        self.env['mail.message.reaction'].flush_model()
+        self.env.cr.execute("""
+            WITH removed AS (
+                DELETE FROM mail_message_reaction
+                      WHERE message_id = %(message_id)s
+                        AND partner_id = %(partner_id)s
+                        AND content != %(content)s
+                  RETURNING content
+            ), inserted AS (
+                INSERT INTO mail_message_reaction (message_id, partner_id, content)
+                     SELECT %(message_id)s, %(partner_id)s, %(content)s
+                      WHERE %(content)s != ''
+                ON CONFLICT DO NOTHING
+                  RETURNING content
+            )
+            SELECT content FROM removed
+             UNION
+            SELECT content FROM inserted
+        """, {'message_id': message.id, 'partner_id': partner.id, 'content': emoji or ''})
+        changed_contents = [row[0] for row in self.env.cr.fetchall()]
+        if not changed_contents:
+            return
+        self.env['mail.message.reaction'].invalidate_model()
+        message.invalidate_recordset(['reaction_ids'])
+        for content in changed_contents:
+            message._bus_send_reaction_group(content)
+        _logger.info("Reações do parceiro #%s na mensagem #%s atualizadas: %s", partner.id, message.id, changed_contents)
+
+    @api.model
+    def _extract_message_content_and_attachments(self, message_content, instance=None, message_key=None):
+        """
+        Extrai o corpo do texto e cria anexos a partir do 'base64' OU, quando há uma
+        'mediaUrl', cria anexos provisórios que são baixados em segundo plano.
+        No modo de armazenamento 'Baixar ao abrir', cria só a referência da mídia
+        (`instance` + `message_key` do webhook), baixada no primeiro acesso.
+        """
+        lazy_media = self.env['evolution.api.config']._get_api_config_values()['media_storage_mode'] == 'lazy'
+        body = ""
+        attachment_ids = []
+        
+        media_types = [
+            'imageMessage', 'videoMessage', 'stickerMessage',
+            'audioMessage', 'documentMessage'
+        ]
+
+        if 'conversation' in message_content:
+            body = message_content['conversation']
+        elif 'extendedTextMessage' in message_content:
+            body = message_content.get('extendedTextMessage', {}).get('text', '')
+        
+        for media_type in media_types:
+            if media_type in message_content:
+                media_data = message_content[media_type]
+
+                caption = media_data.get('caption', '')
+                if caption and not body:
+                    body = caption
+                
+                # Tenta obter um nome de arquivo, com fallbacks
+                mimetype = (media_data.get('mimetype') or '').split(';')[0]
+                filename = media_data.get('fileName') or media_data.get('title')
+                if not filename:
+                    ext = mimetypes.guess_extension(mimetype) if mimetype else ''
+                    filename = f"whatsapp_media{ext or '.bin'}"
+
+                try:
+                    base64_content_str = message_content.get('base64')
+                    # Modo sob demanda: guarda só a referência, mesmo que o base64 tenha vindo no webhook.
+                    if lazy_media and (message_content.get('mediaUrl') or (instance and message_key)):
+                        attachment = self.env['ir.attachment'].sudo()._whatsapp_create_lazy(
+                            filename, mimetype, message_content.get('mediaUrl'), instance, message_key
+                        )
+                    # Prioridade 1: o conteúdo veio em 'base64' no próprio webhook
+                    elif base64_content_str:
+                        # Decodifica em fatias direto para o filestore, sem recodificar para 'datas'.
+                        try:
+                            attachment = self.env['ir.attachment'].sudo()._whatsapp_create_from_base64(
+                                filename, base64_content_str, mimetype
+                            )
+                        except binascii.Error:
+                            _logger.warning("Não foi possível decodificar o conteúdo base64 do webhook.")
+                            continue
+                    # Prioridade 2: há uma 'mediaUrl'. O download não acontece na requisição:
+                    # criamos um anexo provisório que o fetcher de mídia preenche em segundo plano.
+                    elif message_content.get('mediaUrl'):
+                        attachment = self.env['ir.attachment'].sudo()._whatsapp_create_placeholder(
+                            filename, mimetype, message_content['mediaUrl'], instance, message_key
+                        )
+                    else:
+                        _logger.warning("Não foi encontrado conteúdo de mídia (nem base64, nem URL válida) para o tipo: %s", media_type)
+                        continue
+
+                    attachment_ids.append(attachment.id)
+
+                    # Se o anexo for um áudio, cria o metadado para o player do Discuss.
+                    if media_type == 'audioMessage':
+                        self.env['discuss.voice.metadata'].sudo().create({
+                            'attachment_id': attachment.id
+                        })
+                        _logger.info("Metadado de voz criado para o anexo de áudio #%s", attachment.id)
+
+                except Exception as e:
+                    _logger.error("Falha ao criar anexo a partir dos dados de mídia do webhook: %s", e)
+        
+        return body, attachment_ids
@@ -0,0 +1,28 @@
+/** @odoo-module **/
+
+import { registry } from "@web/core/registry";
+
+/**
+ * Recebe as mensagens intermediárias de uma rajada do WhatsApp, enviadas pelo
+ * servidor em uma única notificação, e as adiciona à conversa aberta. A última
+ * mensagem da rajada chega depois, pela notificação padrão de nova mensagem.
+ */
+export const whatsappBurstService = {
+    dependencies: ["bus_service", "mail.store"],
+    start(env, { bus_service: busService, "mail.store": store }) {
+        busService.subscribe("whatsapp_evolution_discuss.burst", (payload) => {
+            const { Message: messages = [] } = store.insert(payload.data, { html: true });
+            const thread = store.Thread.get({ model: "discuss.channel", id: payload.id });
+            if (!thread || thread.loadNewer) {
+                return;
+            }
+            for (const message of messages) {
+                if (!thread.messages.includes(message)) {
+                    thread.messages.push(message);
+                }
+            }
+        });
+    },
+};
+
+registry.category("services").add("whatsapp_evolution_discuss.burst", whatsappBurstService);
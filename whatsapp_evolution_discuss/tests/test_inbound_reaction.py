@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+
+@tagged('post_install', '-at_install')
+class TestInboundReaction(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.processor = cls.env['whatsapp.webhook.processor'].sudo()
+        cls.channel = cls.env['discuss.channel'].create({'name': 'Canal de Reações'})
+        cls.message = cls.channel.message_post(body='Mensagem reagida', message_type='comment')
+        cls.partner = cls.env['res.partner'].create({'name': 'Contato que Reage'})
+        cls.other_partner = cls.env['res.partner'].create({'name': 'Outro Contato'})
+
+    def _reactions(self, partner=None):
+        domain = [('message_id', '=', self.message.id)]
+        if partner:
+            domain.append(('partner_id', '=', partner.id))
+        return self.env['mail.message.reaction'].search(domain)
+
+    def test_reaction_is_inserted_once(self):
+        self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+        self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+        reactions = self._reactions(self.partner)
+        self.assertEqual(reactions.mapped('content'), ['👍'])
+
+    def test_new_reaction_replaces_the_previous_one(self):
+        self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+        self.processor._apply_inbound_reaction(self.message, self.partner, '❤️')
+        self.assertEqual(self._reactions(self.partner).mapped('content'), ['❤️'])
+        self.assertEqual(self.message.reaction_ids.mapped('content'), ['❤️'])
+
+    def test_empty_reaction_removes_it(self):
+        self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+        self.processor._apply_inbound_reaction(self.message, self.partner, '')
+        self.assertFalse(self._reactions(self.partner))
+
+    def test_reactions_of_other_partners_are_kept(self):
+        self.processor._apply_inbound_reaction(self.message, self.other_partner, '😂')
+        self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+        self.processor._apply_inbound_reaction(self.message, self.partner, '')
+        self.assertEqual(self._reactions().mapped('content'), ['😂'])
+
+    def test_only_changed_groups_are_pushed(self):
+        Message = self.registry['mail.message']
+        with patch.object(Message, '_bus_send_reaction_group', autospec=True) as send_group:
+            self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+            self.assertEqual([call.args[1] for call in send_group.call_args_list], ['👍'])
+            send_group.reset_mock()
+
+            # Nada mudou: nenhuma notificação.
+            self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+            send_group.assert_not_called()
+
+            # Troca de emoji: o grupo antigo e o novo são atualizados.
+            self.processor._apply_inbound_reaction(self.message, self.partner, '❤️')
+            self.assertEqual(sorted(call.args[1] for call in send_group.call_args_list), sorted(['👍', '❤️']))
+
+    def test_reaction_is_not_sent_back_to_whatsapp(self):
+        Channel = self.registry['discuss.channel']
+        with patch.object(Channel, '_whatsapp_send_reaction', autospec=True) as send_reaction:
+            self.processor._apply_inbound_reaction(self.message, self.partner, '👍')
+        send_reaction.assert_not_called()
@@ -15,13 +15,19 @@ class WhatsappEvolutionComposer(models.TransientModel):
             record = self.env[res['model']].browse(res['res_id'])
             if 'partner_id' in record and record.partner_id:
                 res['partner_id'] = record.partner_id.id
+        # Vários contatos selecionados na lista: o envio vira uma campanha em segundo plano.
+        active_ids = self.env.context.get('active_ids') or []
+        if self.env.context.get('active_model') == 'res.partner' and len(active_ids) > 1:
+            res['partner_ids'] = [(6, 0, active_ids)]
+            res.pop('partner_id', None)
         
         instance = self.env['whatsapp.instance'].search([('status', '=', 'connected')], limit=1)
         if instance:
             res['instance_id'] = instance.id
         return res
 
-    partner_id = fields.Many2one('res.partner', string="Recipient", required=True)
+    partner_id = fields.Many2one('res.partner', string="Recipient")
+    partner_ids = fields.Many2many('res.partner', string="Recipients")
     body = fields.Text(string="Message", required=True)
     instance_id = fields.Many2one(
         'whatsapp.instance', string="Send From", required=True,
@@ -36,6 +42,10 @@ class WhatsappEvolutionComposer(models.TransientModel):
         self.ensure_one()
         if not self.body and not self.attachment_ids:
             raise UserError(_("Please enter a message or add an attachment."))
+        if self.partner_ids:
+            return self._action_send_campaign()
+        if not self.partner_id:
+            raise UserError(_("Please select a recipient."))
         
         record = self.env[self.model].browse(self.res_id) if self.model and self.res_id else None
 
@@ -63,4 +73,25 @@ class WhatsappEvolutionComposer(models.TransientModel):
         except Exception as e:
             raise UserError(_("Failed to send WhatsApp message: %s") % e)
 
-        return {'type': 'ir.actions.act_window_close'}
\ No newline at end of file
+        return {'type': 'ir.actions.act_window_close'}
+
+    def _action_send_campaign(self):
+        """Cria e inicia uma campanha com os destinatários selecionados."""
+        # O envio em massa roda como superusuário: só quem pode gerenciar campanhas o dispara.
+        if not self.env['whatsapp.campaign'].has_access('create'):
+            raise UserError(_("Only WhatsApp administrators can send a message to several contacts at once."))
+        campaign = self.env['whatsapp.campaign'].create({
+            'name': _("Envio para %s contatos", len(self.partner_ids)),
+            'instance_id': self.instance_id.id,
+            'partner_domain': repr([('id', 'in', self.partner_ids.ids)]),
+            'body': self.body,
+            'attachment_ids': [(6, 0, self.attachment_ids.ids)],
+        })
+        campaign.action_start()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'whatsapp.campaign',
+            'res_id': campaign.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }